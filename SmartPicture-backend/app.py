@@ -1,53 +1,362 @@
-from flask import Flask, request, jsonify
-from google.cloud import firestore
+"""
+SmartPicture Backend 入口。
+
+create_app() 只创建 Flask 应用并注册路由，不导入 Google SDK、不建立任何客户端：
+Firestore / Firebase Auth / Gemini 等在首次使用时经 utils/clients.py 的注册表懒加载，
+冷启动只需要 Flask 本身的导入时间。
+
+可选预热（APP_PREWARM）：
+    off         默认（未设置 CLIENT_WARMUP 时），全部懒加载
+    sync        create_app() 返回前在主线程完成预热
+    background  在后台线程预热，不阻塞启动探针；首个请求若先到达会等待同一客户端构造完成
+预热的客户端列表由 CLIENT_WARMUP 指定，默认 "firestore,firebase"。
+gunicorn --preload 时建议在 post_fork 钩子里调用 warm_up()（gRPC 通道不能跨 fork）。
+
+生成类接口在验证身份后按用户 / 路由限流，上游调用按模型预算公平排队（见 utils/admission.py）。
+生成的图片按内容哈希存入媒体库，JSON 中只返回 /media/<id>；Accept 首选图片类型时
+/api/generate_image 直接返回图片字节（见 utils/media.py）。
+GET /metrics 以 Prometheus 文本格式导出请求与各阶段耗时（见 utils/metrics.py）。
+"""
+
+import os
+import threading
+
+from flask import Blueprint, Flask, request, jsonify
+from utils.clients import registry
 from utils.fb_auth import verify_token
+from utils.spending import PointsSpender, InsufficientPoints
+from utils.tx_writer import TransactionLogWriter, install_shutdown_hooks
+from utils.ai_client import cached_generate_content, generation_cache, generation_key, stream_content
+from utils.streaming import stream_format, stream_generation, streaming_response
+from utils.seo import build_seo_response
+from utils.gen_gateway import gateway, GatewayOverloaded, client_disconnected
+from utils.admission import RateLimited, admission_stats, admit, trust_proxies
+from utils.vision import batch_annotate
+from utils.image_index import index_stats
+from utils.metrics import metrics, timed, init_app as init_metrics
+from utils.media import media_bp, media_path, send_media, sniff
+from utils import jobs
+
+
+api = Blueprint("api", __name__)
+
+_tx_log = None
+_spender = None
+_jobs = None
+_init_lock = threading.RLock()
+_shutdown_hooks_installed = False
+
+def get_db():
+    return registry.get("firestore")
+
+def get_tx_log():
+    """懒加载交易日志写入器；退出时的刷写钩子由 create_app() 在主线程预先注册"""
+    global _tx_log
+    if _tx_log is None:
+        with _init_lock:
+            if _tx_log is None:
+                _tx_log = TransactionLogWriter(get_db())
+    return _tx_log
+
+def get_spender():
+    global _spender
+    if _spender is None:
+        with _init_lock:
+            if _spender is None:
+                _spender = PointsSpender(get_db(), log_writer=get_tx_log())
+    return _spender
+
+def get_jobs():
+    """懒加载异步任务管理器（JOB_* 环境变量），首次使用时启动进程内 worker"""
+    global _jobs
+    if _jobs is None:
+        with _init_lock:
+            if _jobs is None:
+                manager = jobs.build_from_env(
+                    lambda prompt, **kw: cached_generate_content(prompt, mode="image", **kw)[0],
+                    spender=get_spender())
+                manager.start_workers(jobs.default_workers())
+                _jobs = manager
+    return _jobs
 
+def _reset_after_fork():
+    # 写入器的后台线程与 Firestore 通道都不跨 fork，子进程重新懒加载
+    global _tx_log, _spender, _jobs, _init_lock
+    _tx_log, _spender, _jobs, _init_lock = None, None, None, threading.RLock()
 
-db = firestore.Client()
-app = Flask(__name__)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
+def warm_up(names=None):
+    """预热客户端与积分组件；失败只记录，不影响启动。返回各项结果"""
+    names = names or [n.strip() for n in os.environ.get("CLIENT_WARMUP", "firestore,firebase").split(",") if n.strip()]
+    results = registry.warm_up([n for n in names if n != "firebase"])
+    if "firebase" in names:
+        try:
+            from utils.fb_auth import warm_up as warm_up_auth
+            warm_up_auth()
+            results["firebase"] = "ok"
+        except Exception as e:
+            print(f"[Client Warmup Error] firebase: {e}")
+            results["firebase"] = str(e)
+    if results.get("firestore") == "ok":
+        get_spender()
+    return results
+
+@timed("get_points")
 def get_points(uid):
-    doc = db.collection("users").document(uid).get()
+    doc = get_db().collection("users").document(uid).get()
     return (doc.to_dict() or {}).get("points", 0)
 
+@timed("add_tx")
 def add_tx(uid, amount, meta):
-    db.collection("transactions").add({
-        "uid": uid, "type": "earn" if amount>0 else "spend",
-        "amount": amount, "meta": meta,
-        "createdAt": firestore.SERVER_TIMESTAMP
-    })
-    db.collection("users").document(uid).set({
+    # 余额同步写入（强一致），交易日志交给后台批量写入
+    from google.cloud import firestore
+    get_db().collection("users").document(uid).set({
         "points": firestore.Increment(amount),
         "lastActiveAt": firestore.SERVER_TIMESTAMP
     }, merge=True)
+    return get_tx_log().log(uid, amount, meta)
+
+def generate_billed(uid, prompt, mode, cost, module, disconnected=None):
+    """
+    命中生成缓存时按计费策略收费且不调用模型；
+    未命中时预留原价 → 生成（并发相同请求合并为一次上游调用）→ 提交，失败自动退款。
+    客户端中途断开（disconnected() 为 True）时取消上游调用并退款。
+    返回 (结果, 实际扣除积分, 缓存来源)
+    """
+    meta = {"module": module, "prompt": prompt}
+    cached, source = generation_cache.lookup(generation_key(prompt, mode))
+    if source:
+        spent = generation_cache.cost_for(cost, source)
+        if spent:
+            get_spender().commit(get_spender().reserve(uid, spent, {**meta, "cache": source}))
+        return cached, spent, source
+    with get_spender().spend(uid, cost, meta):
+        result, source = cached_generate_content(prompt, mode=mode, user=uid, disconnected=disconnected)
+    return result, cost, source
+
+def stream_text_response(uid, prompt, cost, fmt):
+    """
+    流式生成：预留积分后逐块推送文本；尾部 done 事件携带 SEO 封装与结算结果。
+    生成失败或客户端断开时自动退款。
+    """
+    spender = get_spender()
+    chunks = stream_content(prompt, user=uid)
+    reservation = spender.reserve(uid, cost, {"module":"smart_insights","prompt":prompt,"stream":True})
+
+    def on_complete(text):
+        generation_cache.put(generation_key(prompt, "text"), text)
+        # 正文已逐块下发，尾部 SEO 封装不再携带 data
+        seo = build_seo_response(
+            title="AI文章生成 | SmartPicture 智能洞察",
+            keywords=["AI内容生成", "AEO优化", "品牌内容中心"],
+            description=f"基于AI的内容生成工具，为品牌提供高质量AEO文章：{prompt[:60]}",
+            content_type="Article",
+        )
+        spender.commit(reservation)
+        return {"spent": cost, "seo": seo}
+
+    def on_abort(reason):
+        spender.refund(reservation, reason=reason)
+
+    return streaming_response(stream_generation(chunks, on_complete, on_abort, fmt,
+                                                disconnected=client_disconnected(request.environ)), fmt)
 
-@app.post("/api/generate_text")
+def overloaded_response(e):
+    if isinstance(e, RateLimited):
+        resp = jsonify({"error": "RATE_LIMITED", "scope": e.scope, "retry_after": e.retry_after})
+    else:
+        resp = jsonify({"error": "BUSY", "retry_after": e.retry_after})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
+@api.post("/api/generate_text")
 def api_generate_text():
     try:
         uid = verify_token(request.headers.get("Authorization"))
+        admit(uid, request.url_rule.rule)
         cost = 10
-        if get_points(uid) < cost:
-            return jsonify({"error":"INSUFFICIENT_POINTS"}), 403
-        prompt = (request.get_json(force=True).get("prompt") or "").strip()
-        content = generate_content(prompt, mode="text")
-        add_tx(uid, -cost, {"module":"smart_insights","prompt":prompt})
-        return jsonify({"generated_text": content, "spent": cost})
+        data = request.get_json(force=True)
+        prompt = (data.get("prompt") or "").strip()
+        fmt = stream_format(request, data)
+        if fmt:
+            return stream_text_response(uid, prompt, cost, fmt)
+        content, spent, source = generate_billed(uid, prompt, "text", cost, "smart_insights",
+                                                 disconnected=client_disconnected(request.environ))
+        return jsonify({"generated_text": content, "spent": spent, "cache": source})
+    except InsufficientPoints:
+        return jsonify({"error":"INSUFFICIENT_POINTS"}), 403
+    except GatewayOverloaded as e:
+        return overloaded_response(e)
+    except ConnectionAbortedError:
+        return jsonify({"error": "CLIENT_DISCONNECTED"}), 499
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
-@app.post("/api/generate_image")
+def wants_async(data):
+    return bool(data.get("async")) or "respond-async" in request.headers.get("Prefer", "")
+
+def submit_image_job(uid, prompt, cost):
+    """预留积分并入队，立即返回 202；结果通过 /api/jobs/<id> 轮询"""
+    job = get_jobs().submit(uid, prompt, cost=cost, params={"user": uid})
+    status_url = f"/api/jobs/{job['id']}"
+    resp = jsonify({"job_id": job["id"], "status": job["status"], "status_url": status_url})
+    resp.headers["Location"] = status_url
+    return resp, 202
+
+def wants_binary():
+    """Accept 首选图片类型（如 image/webp）时直接返回图片字节；*/* 与未设置时仍返回 JSON"""
+    return request.accept_mimetypes.best_match(["application/json", "image/*"]) == "image/*"
+
+def binary_image_response(result, spent, source):
+    """媒体库中的图片以二进制返回，计费信息放在响应头；外部 URL 退回 JSON"""
+    path = media_path(result)
+    if path is None:
+        return jsonify({"image": result, "spent": spent, "cache": source})
+    with open(path, "rb") as f:
+        mimetype = sniff(f.read(16))
+    resp = send_media(path, mimetype, result.rsplit("/", 1)[-1])
+    resp.headers["Content-Location"] = result
+    resp.headers["X-Points-Spent"] = str(spent)
+    resp.headers["X-Cache"] = source
+    return resp
+
+@api.post("/api/generate_image")
 def api_generate_image():
     try:
         uid = verify_token(request.headers.get("Authorization"))
+        admit(uid, request.url_rule.rule)
         cost = 5
-        if get_points(uid) < cost:
-            return jsonify({"error":"INSUFFICIENT_POINTS"}), 403
+        data = request.get_json(force=True)
+        prompt = (data.get("prompt") or "").strip()
+        if not prompt:
+            return jsonify({"error": "Missing prompt"}), 400
+        if wants_async(data):
+            return submit_image_job(uid, prompt, cost)
+        result, spent, source = generate_billed(uid, prompt, "image", cost, "creative_studio",  # 返回 URL 或 /media/<id>
+                                                disconnected=client_disconnected(request.environ))
+        if wants_binary():
+            return binary_image_response(result, spent, source)
+        return jsonify({"image": result, "spent": spent, "cache": source})
+    except InsufficientPoints:
+        return jsonify({"error":"INSUFFICIENT_POINTS"}), 403
+    except GatewayOverloaded as e:
+        return overloaded_response(e)
+    except ConnectionAbortedError:
+        return jsonify({"error": "CLIENT_DISCONNECTED"}), 499
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@api.post("/api/jobs/generate_image")
+def api_jobs_generate_image():
+    try:
+        uid = verify_token(request.headers.get("Authorization"))
+        admit(uid, request.url_rule.rule)
         prompt = (request.get_json(force=True).get("prompt") or "").strip()
-        result = generate_content(prompt, mode="image")  # 返回URL或Base64
-        add_tx(uid, -cost, {"module":"creative_studio","prompt":prompt})
-        return jsonify({"image": result, "spent": cost})
+        if not prompt:
+            return jsonify({"error": "Missing prompt"}), 400
+        return submit_image_job(uid, prompt, 5)
+    except InsufficientPoints:
+        return jsonify({"error":"INSUFFICIENT_POINTS"}), 403
+    except GatewayOverloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@api.get("/api/jobs/<job_id>")
+def api_job_status(job_id):
+    """任务状态；?wait=N 时长轮询最多 N 秒（上限 30），任务结束立即返回"""
+    try:
+        uid = verify_token(request.headers.get("Authorization"))
+        wait = request.args.get("wait", default=0, type=float)
+        job = get_jobs().status(job_id, wait=wait)
+        if not job or job["uid"] != uid:
+            return jsonify({"error": "NOT_FOUND"}), 404
+        return jsonify(jobs.public_view(job))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@api.get("/api/jobs/stats")
+def api_jobs_stats():
+    # 只读取已有状态：尚未提交过任务时不为一次 GET 启动工作线程、连接队列后端
+    return jsonify(_jobs.stats() if _jobs is not None else {"workers": 0})
+
+@api.post("/api/vision/batch_annotate")
+def api_vision_batch_annotate():
+    """批量图片标注：多张图片 × 多个特征（labels / safe_search / ocr），逐张返回结果"""
+    try:
+        uid = verify_token(request.headers.get("Authorization"))
+        admit(uid, request.url_rule.rule)
+        data = request.get_json(force=True)
+        uris = [u for u in (data.get("image_uris") or []) if u]
+        features = data.get("features") or ["labels", "safe_search"]
+        if not uris:
+            return jsonify({"error": "Missing image_uris"}), 400
+        if len(uris) > 256:
+            return jsonify({"error": "Too many images (max 256)"}), 400
+        results = batch_annotate(uris, features=features)
+        failed = sum(1 for r in results if r["error"])
+        return jsonify({"results": results, "total": len(results), "failed": failed})
+    except GatewayOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@api.get("/")
+def health():
+    """就绪 / 存活探针：不触碰任何下游客户端"""
+    return jsonify({"service": "smartpicture-backend", "status": "ok"})
+
+@api.get("/api/tx_log/stats")
+def api_tx_log_stats():
+    return jsonify(_tx_log.stats() if _tx_log is not None else {"pending": 0})
+
+@api.get("/api/gen_cache/stats")
+def api_gen_cache_stats():
+    return jsonify(generation_cache.stats())
+
+@api.get("/api/gateway/stats")
+def api_gateway_stats():
+    return jsonify(gateway.stats())
+
+@api.get("/api/admission/stats")
+def api_admission_stats():
+    return jsonify(admission_stats())
+
+@api.get("/api/image_index/stats")
+def api_image_index_stats():
+    return jsonify(index_stats())
+
+def create_app(prewarm=None) -> Flask:
+    """
+    应用工厂。prewarm 为 None 时读取 APP_PREWARM（off / sync / background）。
+    """
+    global _shutdown_hooks_installed
+    app = Flask(__name__)
+    if not _shutdown_hooks_installed:
+        # 写入器在首个请求（工作线程）上才创建，SIGTERM 处理只能在这里于主线程注册；
+        # 钩子在收到信号时才读取 _tx_log，fork 出的子进程刷写各自的写入器
+        install_shutdown_hooks(lambda: _tx_log)
+        _shutdown_hooks_installed = True
+    trust_proxies(app)  # TRUSTED_PROXIES 层代理之后还原客户端地址
+    app.register_blueprint(api)
+    app.register_blueprint(media_bp)
+    init_metrics(app)
+    metrics.register_gauges("smartpicture_gateway", gateway.stats)
+    metrics.register_gauges("smartpicture_gen_cache", generation_cache.stats)
+    metrics.register_gauges("smartpicture_tx_log", lambda: _tx_log.stats() if _tx_log is not None else {})
+    metrics.register_gauges("smartpicture_admission", admission_stats)
+    metrics.register_gauges("smartpicture_image_index", index_stats)
+    # 兼容旧配置：只设置了 CLIENT_WARMUP 时与之前一样同步预热
+    mode = prewarm or os.environ.get("APP_PREWARM", "sync" if os.environ.get("CLIENT_WARMUP") else "off")
+    if mode == "sync":
+        warm_up()
+    elif mode == "background":
+        threading.Thread(target=warm_up, name="app-prewarm", daemon=True).start()
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     app.run(port=8080, host="0.0.0.0")
@@ -0,0 +1,160 @@
+"""
+benchmarks/bench_admission.py
+------------------------------
+准入控制（utils/admission.py）仿真：偏斜的用户流量打到一个有配额的上游模型。
+
+上游按令牌桶实施配额（--quota 次/秒），超出即返回 429；客户端按 _with_retry 的指数退避重试。
+--heavy-users 个重度用户发出 --heavy-share 比例的请求，其余请求均匀来自 --users 个普通用户，
+总到达率 --rate（泊松，开环）。对比四种策略：
+- none：不做准入，直接调用上游（429 + 重试）
+- user：只有按用户的令牌桶
+- fifo：用户令牌桶 + 模型预算，所有请求同一队列先到先服务
+- fair：用户令牌桶 + 模型预算 + 按用户加权公平排队
+按用户类别报告：成功率、快速拒绝（带 Retry-After）比例、重试后仍失败比例、成功请求 p50 / p95 延迟，
+以及上游收到的 429 次数。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_admission.py --rate 60 --quota 20 --duration 15
+    python benchmarks/bench_admission.py --backend sqlite   # 令牌桶存放在共享的 SQLite 中
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.admission import AdmissionController, MemoryBucketStore, RateLimited, SQLiteBucketStore  # noqa: E402
+from utils.embed_cache import _with_retry  # noqa: E402
+
+MODEL = "gemini-pro"
+ROUTE = "/api/generate_text"
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class Upstream:
+    """有配额的上游：每秒 quota 次，超出返回 429"""
+
+    def __init__(self, quota, latency):
+        self.quota = quota
+        self.latency = latency
+        self.bucket = MemoryBucketStore()
+        self.rejected = 0
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def call(self):
+        if self.bucket.take("quota", self.quota, self.quota, 1.0):
+            with self._lock:
+                self.rejected += 1
+            time.sleep(0.02)
+            raise QuotaExceeded("429 resource exhausted")
+        time.sleep(self.latency)
+        with self._lock:
+            self.served += 1
+
+
+def workload(args):
+    rnd = random.Random(args.seed)
+    t, arrivals = 0.0, []
+    while True:
+        t += rnd.expovariate(args.rate)
+        if t >= args.duration:
+            return arrivals
+        if rnd.random() < args.heavy_share:
+            uid = f"heavy{rnd.randrange(args.heavy_users)}"
+        else:
+            uid = f"user{rnd.randrange(args.users)}"
+        arrivals.append((t, uid))
+
+
+def run(policy, arrivals, args, store):
+    upstream = Upstream(args.quota, args.latency)
+    budget = (args.quota * 0.95, max(args.quota * 0.95, 1.0))
+    controller = AdmissionController(
+        store,
+        user_limit=None if policy == "none" else (args.user_rate, args.user_burst),
+        model_budgets=None if policy in ("none", "user") else {MODEL: budget},
+        max_wait=args.max_wait,
+    )
+    results = []
+    lock = threading.Lock()
+
+    def request(uid):
+        t0 = time.perf_counter()
+        outcome = "ok"
+        try:
+            controller.admit(uid, ROUTE)
+            controller.acquire_model(MODEL, "shared" if policy == "fifo" else uid)
+            _with_retry(upstream.call, 3, 0.5, "Upstream")
+        except RateLimited:
+            outcome = "rejected"
+        except QuotaExceeded:
+            outcome = "failed"
+        with lock:
+            results.append((uid, outcome, time.perf_counter() - t0))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1024) as pool:
+        for at, uid in arrivals:
+            delay = start + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(request, uid)
+    return results, upstream
+
+
+def report(policy, results, upstream):
+    for label, prefix in (("heavy", "heavy"), ("light", "user")):
+        rows = [r for r in results if r[0].startswith(prefix)]
+        ok = sorted(lat for _, o, lat in rows if o == "ok")
+        n = len(rows) or 1
+
+        def pct(q):
+            return ok[min(int(q * len(ok)), len(ok) - 1)] * 1000 if ok else float("nan")
+        print(f"{policy:>6} {label:>6} {len(rows):>6} {len(ok) / n:>7.1%} "
+              f"{sum(o == 'rejected' for _, o, _ in rows) / n:>9.1%} {sum(o == 'failed' for _, o, _ in rows) / n:>7.1%} "
+              f"{pct(0.5):>8.0f} {pct(0.95):>8.0f}")
+    print(f"{'':>6} {'':>6} upstream: served {upstream.served}, 429s {upstream.rejected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=60, help="总到达率（请求/秒）")
+    parser.add_argument("--quota", type=float, default=20, help="上游配额（请求/秒）")
+    parser.add_argument("--latency", type=float, default=0.3, help="上游单次调用耗时（秒）")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--heavy-users", type=int, default=3)
+    parser.add_argument("--heavy-share", type=float, default=0.7)
+    parser.add_argument("--user-rate", type=float, default=2.0)
+    parser.add_argument("--user-burst", type=float, default=10.0)
+    parser.add_argument("--max-wait", type=float, default=5.0)
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--policies", nargs="+", default=["none", "user", "fifo", "fair"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    arrivals = workload(args)
+    print(f"{len(arrivals)} requests over {args.duration:.0f}s, quota {args.quota:.0f}/s, "
+          f"{args.heavy_users} heavy users send {args.heavy_share:.0%}\n")
+    print(f"{'policy':>6} {'class':>6} {'reqs':>6} {'success':>7} {'rejected':>9} {'failed':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for policy in args.policies:
+            store = SQLiteBucketStore(os.path.join(tmp, f"{policy}.sqlite")) if args.backend == "sqlite" \
+                else MemoryBucketStore()
+            results, upstream = run(policy, arrivals, args, store)
+            report(policy, results, upstream)
+
+
+if __name__ == "__main__":
+    main()
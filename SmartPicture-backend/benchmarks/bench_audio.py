@@ -0,0 +1,135 @@
+"""
+benchmarks/bench_audio.py
+--------------------------
+长音频分段并行转写（utils/audio.py）测试，使用合成音频与本地假后端，无需网络。
+
+合成音频由「词」（不同幅度的短音）、词间短停顿与句间长静音组成；假后端从 PCM 中
+按能量检测出词并由幅度还原词表中的词，耗时与片段时长成正比（--rtf）。
+- 不同片段长度 × 并发数下的耗时与相对串行的加速比
+- 拼接结果与原文逐词比对（切点不能截断词，重叠部分不能重复或丢词）
+- 注入瞬时失败时依靠重试仍得到完整结果
+- 首个部分结果的到达时间（流式产出）
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_audio.py --minutes 20 --rtf 0.01 --fail-rate 0.05
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.audio import iter_transcript, plan_segments  # noqa: E402
+
+RATE = 16_000
+VOCAB = [f"w{i}" for i in range(40)]
+LEVEL = 400  # 词 i 的幅度为 LEVEL * (i + 2)
+
+
+def synth_audio(minutes, seed=0):
+    """返回 (样本, 原文词列表)"""
+    rnd = random.Random(seed)
+    rng = np.random.default_rng(seed)
+    parts, script, total = [], [], 0
+    while total < minutes * 60 * RATE:
+        for _ in range(rnd.randint(5, 14)):
+            wid = rnd.randrange(len(VOCAB))
+            n = int(RATE * rnd.uniform(0.2, 0.45))
+            t = np.arange(n) / RATE
+            # 方波：每帧平均幅度恒定，假后端可由幅度准确还原词
+            parts.append(LEVEL * (wid + 2) * np.sign(np.sin(2 * np.pi * rnd.uniform(150, 400) * t) + 1e-9))
+            parts.append(np.zeros(int(RATE * rnd.uniform(0.08, 0.18))))
+            script.append(VOCAB[wid])
+        parts.append(np.zeros(int(RATE * rnd.uniform(0.5, 1.2))))  # 句间静音
+        total = sum(len(p) for p in parts)
+    samples = np.concatenate(parts)
+    samples += rng.normal(scale=20, size=len(samples))
+    return samples.astype("<i2"), script
+
+
+class FakeBackend:
+    def __init__(self, rtf, overhead=0.05, fail_rate=0.0, seed=5):
+        self.rtf = rtf
+        self.overhead = overhead
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self.failures = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, pcm, sample_rate, language_code):
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+        with self._lock:
+            self.calls += 1
+            fail = self._rnd.random() < self.fail_rate
+            self.failures += fail
+        time.sleep(self.overhead + self.rtf * len(samples) / sample_rate)
+        if fail:
+            raise RuntimeError("503 UNAVAILABLE")
+        frame = sample_rate // 100
+        level = np.abs(samples[:len(samples) // frame * frame].reshape(-1, frame)).mean(axis=1)
+        voiced = level > LEVEL
+        words, i = [], 0
+        while i < len(voiced):
+            if not voiced[i]:
+                i += 1
+                continue
+            j = i
+            while j < len(voiced) and voiced[j]:
+                j += 1
+            amp = float(np.median(level[i:j]))
+            wid = min(max(int(round(amp / LEVEL)) - 2, 0), len(VOCAB) - 1)
+            words.append({"word": VOCAB[wid], "start": i / 100, "end": j / 100})
+            i = j
+        return words
+
+
+def run(samples, backend, concurrency, max_segment_s):
+    t0 = time.perf_counter()
+    first = None
+    words = []
+    for part in iter_transcript((samples, RATE), backend=backend, max_concurrency=concurrency,
+                                base_delay=0.01, max_segment_s=max_segment_s):
+        if first is None:
+            first = time.perf_counter() - t0
+        words.extend(w["word"] for w in part["words"])
+    return time.perf_counter() - t0, first, words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=20)
+    parser.add_argument("--rtf", type=float, default=0.01, help="假后端耗时 / 音频时长")
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    samples, script = synth_audio(args.minutes)
+    print(f"audio: {len(samples) / RATE / 60:.1f} min, {len(script)} words")
+    print(f"{'segment s':>10} {'segments':>9} {'conc':>5} {'seconds':>8} {'speedup':>8} "
+          f"{'first part s':>13} {'exact':>6}")
+
+    for max_segment_s in (55, 30, 15):
+        n = len(plan_segments(samples, RATE, max_segment_s=max_segment_s))
+        serial = None
+        for conc in (1, 4, 8, 16):
+            wall, first, words = run(samples, FakeBackend(args.rtf), conc, max_segment_s)
+            serial = serial or wall
+            print(f"{max_segment_s:>10} {n:>9} {conc:>5} {wall:>8.2f} {serial / wall:>7.1f}x "
+                  f"{first:>13.2f} {str(words == script):>6}")
+            assert words == script, "transcript mismatch"
+
+    backend = FakeBackend(args.rtf, fail_rate=args.fail_rate)
+    wall, _, words = run(samples, backend, 8, 55)
+    assert words == script
+    print(f"\nwith {args.fail_rate:.0%} transient failures: {backend.failures} retried of "
+          f"{backend.calls} calls, transcript exact, {wall:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+benchmarks/bench_embed_cache.py
+--------------------------------
+批量 embedding 缓存（utils/embed_cache.py）测试，使用计数的假 embedder，无需网络：
+- per-text：现状，每段文本一次上游调用（按少量样本外推总耗时）
+- first pass：去重 + 按 100 条切批 + 并行批次（含随机瞬时失败与重试）
+- second pass：同一语料再次入库，应当零上游调用
+- 5% changed：只有改动的切片触发上游调用
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_embed_cache.py --chunks 20000 --latency 0.05 --fail-rate 0.05
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.embed_cache import EmbeddingCache, embed_many  # noqa: E402
+
+
+class FakeEmbedder:
+    def __init__(self, dim, latency, fail_rate=0.0, seed=7):
+        self.dim = dim
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self.texts = 0
+        self.failures = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def vector(self, text):
+        seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+        return np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+
+    def __call__(self, texts, model):
+        with self._lock:
+            self.calls += 1
+            fail = self._rnd.random() < self.fail_rate
+            if fail:
+                self.failures += 1
+            else:
+                self.texts += len(texts)
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        return [self.vector(t).tolist() for t in texts]
+
+
+def corpus(n, changed=frozenset()):
+    # 约 2% 的切片内容重复（模板化段落），同一批内也会去重
+    return [f"第 {i % (n - n // 50)} 段：AI 内容策略{' (修订)' if i in changed else ''}" for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--latency", type=float, default=0.05, help="每次上游调用的延迟（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.05, help="单次调用瞬时失败的概率")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"))
+        texts = corpus(args.chunks)
+        print(f"{'pass':>14} {'upstream calls':>15} {'texts sent':>11} {'retries':>8} {'seconds':>8}")
+
+        sample = 50
+        fake = FakeEmbedder(args.dim, args.latency)
+        t0 = time.perf_counter()
+        for t in texts[:sample]:
+            fake([t], "m")
+        est = (time.perf_counter() - t0) / sample * len(texts)
+        print(f"{'per-text':>14} {len(texts):>15} {len(texts):>11} {0:>8} {est:>7.1f}*")
+
+        def run(name, items, expect_calls=None):
+            fake = FakeEmbedder(args.dim, args.latency, args.fail_rate)
+            t0 = time.perf_counter()
+            matrix = embed_many(items, model="m", embedder=fake, cache=cache,
+                                max_concurrency=args.concurrency, base_delay=0.01)
+            wall = time.perf_counter() - t0
+            ok_calls = fake.calls - fake.failures
+            print(f"{name:>14} {ok_calls:>15} {fake.texts:>11} {fake.failures:>8} {wall:>8.2f}")
+            if expect_calls is not None:
+                assert ok_calls == expect_calls, (ok_calls, expect_calls)
+            # 结果与直接调用一致且顺序对应输入
+            for i in (0, len(items) // 2, len(items) - 1):
+                assert np.allclose(matrix[i], fake.vector(items[i]))
+            return matrix
+
+        unique = len(set(texts))
+        run("first pass", texts, expect_calls=-(-unique // 100))
+        run("second pass", texts, expect_calls=0)
+        changed = frozenset(random.Random(3).sample(range(args.chunks), args.chunks // 20))
+        edited = corpus(args.chunks, changed)
+        new_texts = len(set(edited) - set(texts))
+        run("5% changed", edited, expect_calls=-(-new_texts // 100))
+
+        print(f"\n* estimated from {sample} sequential calls; cache: {cache.stats()}, "
+              f"db size {os.path.getsize(os.path.join(tmp, 'embeddings.sqlite')) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+benchmarks/bench_gen_gateway.py
+--------------------------------
+异步生成网关（utils/gen_gateway.py）的压测脚本，使用本地假模型，无需网络。
+
+- sync：现状。每个 gunicorn 同步 worker 在 generate_content 上阻塞，
+  单实例并发 = workers，吞吐约为 workers / 模型延迟
+- gateway：Flask 处理线程只等待 Future，模型调用在事件循环上以协程并发执行，
+  并发由全局 / 按模型信号量控制；超出排队上限的请求立即得到 429 + Retry-After
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_gen_gateway.py --clients 200 --requests 2000 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.gen_gateway import GatewayOverloaded, GenerationGateway  # noqa: E402
+
+
+class FakeModel:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate(self, prompt):
+        time.sleep(self.latency)
+        return {"generated_text": prompt[::-1]}
+
+    async def generate_async(self, prompt):
+        await asyncio.sleep(self.latency)
+        return {"generated_text": prompt[::-1]}
+
+
+def drive(clients, requests, handler):
+    """clients 个并发客户端共发出 requests 个请求，返回 (耗时, 延迟列表, 429 数)"""
+    latencies, rejected = [], [0]
+    lock = threading.Lock()
+
+    def one(i):
+        t0 = time.perf_counter()
+        status = handler(f"prompt {i}")
+        elapsed = (time.perf_counter() - t0) * 1000
+        with lock:
+            if status == 429:
+                rejected[0] += 1
+            else:
+                latencies.append(elapsed)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(one, range(requests)))
+    return time.perf_counter() - t0, sorted(latencies), rejected[0]
+
+
+def report(name, wall, latencies, rejected):
+    ok = len(latencies)
+    p50 = statistics.median(latencies) if latencies else 0
+    p99 = latencies[max(int(ok * 0.99) - 1, 0)] if latencies else 0
+    print(f"{name:>22} {ok / wall:>9.1f} {p50:>9.1f} {p99:>9.1f} {rejected:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="假模型延迟（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="sync 路径的 gunicorn worker 数")
+    parser.add_argument("--concurrency", type=int, default=64, help="网关全局并发上限")
+    parser.add_argument("--queue", type=int, default=256, help="网关排队上限")
+    args = parser.parse_args()
+    model = FakeModel(args.latency)
+
+    print(f"{'path':>22} {'req/s':>9} {'p50(ms)':>9} {'p99(ms)':>9} {'429s':>6}")
+
+    # 现状：请求被 workers 个同步 worker 串行消化
+    workers = ThreadPoolExecutor(args.workers)
+    wall, lat, rej = drive(args.clients, args.requests,
+                           lambda p: workers.submit(model.generate, p).result() and 200)
+    workers.shutdown()
+    report(f"sync ({args.workers} workers)", wall, lat, rej)
+
+    gw = GenerationGateway(max_concurrency=args.concurrency, max_queue=args.queue,
+                           default_model_limit=args.concurrency)
+
+    def via_gateway(prompt):
+        try:
+            gw.call(model.generate_async, prompt, model="fake", timeout=30)
+            return 200
+        except GatewayOverloaded:
+            return 429
+
+    wall, lat, rej = drive(args.clients, args.requests, via_gateway)
+    report(f"gateway (c={args.concurrency})", wall, lat, rej)
+
+    small = GenerationGateway(max_concurrency=8, max_queue=16, default_model_limit=8)
+
+    def shedding(prompt):
+        try:
+            small.call(model.generate_async, prompt, model="fake", timeout=30)
+            return 200
+        except GatewayOverloaded:
+            return 429
+
+    wall, lat, rej = drive(args.clients, args.requests // 4, shedding)
+    report("gateway (c=8, q=16)", wall, lat, rej)
+    print(f"\nload shedding stats: {small.stats()}")
+
+    # 客户端断开：等待中取消任务，上游名额立即释放
+    disconnected_at = time.monotonic() + args.latency / 4
+    try:
+        gw.call(model.generate_async, "bye", model="fake", disconnected=lambda: time.monotonic() > disconnected_at)
+    except ConnectionAbortedError:
+        pass
+    time.sleep(0.05)
+    print(f"after disconnect: {gw.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+benchmarks/bench_image_dedup.py
+--------------------------------
+图片指纹去重（utils/image_index.py）的两部分基准：
+
+1. 查找延迟：--size 个 64 位指纹（其中一部分成簇，模拟同一张图的多个版本），
+   多索引哈希（MIH）与线性扫描在 --max-distance 内查找，分别测近重复命中和未命中的 p50 / p99，
+   并核对两者结果一致。
+2. 去重效果：合成 --originals 张照片风格图片，按 --dup-ratio 生成变体（原样复制、JPEG 重新压缩、
+   缩小、调亮度、裁掉边缘、加水印文字）混入独立图片，经 vision.batch_annotate 分析（上游为计数的假
+   Vision 客户端）。报告上游调用节省比例、误判（独立图片命中了别人的结果）与漏判（变体未命中）。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_image_dedup.py --size 1000000 --queries 500
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+
+from utils.image_index import MultiIndexHash  # noqa: E402
+
+
+def flip_bits(code, n, rnd):
+    for b in rnd.sample(range(64), n):
+        code ^= 1 << b
+    return code
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def bench_lookup(args):
+    rnd = random.Random(args.seed)
+    rng = np.random.default_rng(args.seed)
+    codes = rng.integers(0, 2 ** 63, args.size, dtype=np.uint64, endpoint=True)
+    # 约 1/4 的指纹属于簇：同一张图的 2~5 个版本，彼此相差 1~6 位
+    cluster_heads = rng.choice(args.size, args.size // 16, replace=False)
+    filled = set(cluster_heads.tolist())
+    free = iter(i for i in range(args.size) if i not in filled)
+    for head in cluster_heads.tolist():
+        for _ in range(rnd.randint(1, 4)):
+            codes[next(free)] = flip_bits(int(codes[head]), rnd.randint(1, 6), rnd)
+
+    mih = MultiIndexHash()
+    t0 = time.perf_counter()
+    mih.add_many(codes.tolist())
+    build = time.perf_counter() - t0
+    picks = rng.choice(args.size, args.queries).tolist()
+    queries = {
+        "near hit": [flip_bits(int(codes[i]), rnd.randint(0, args.max_distance), rnd) for i in picks],
+        "miss": [rnd.getrandbits(64) for _ in range(args.queries)],
+    }
+    print(f"{args.size:,} fingerprints, MIH build {build:.2f}s, radius {args.max_distance}\n")
+    print(f"{'queries':<10} {'method':<8} {'p50 µs':>10} {'p99 µs':>10} {'avg hits':>9}")
+    for label, qs in queries.items():
+        for method in ("mih", "scan"):
+            fn = mih.search if method == "mih" else mih.scan
+            times, hits = [], 0
+            for q in qs:
+                t0 = time.perf_counter()
+                positions, _ = fn(q, args.max_distance)
+                times.append(time.perf_counter() - t0)
+                hits += len(positions)
+            p50, p99 = percentiles(times)
+            print(f"{label:<10} {method:<8} {p50:>10.0f} {p99:>10.0f} {hits / len(qs):>9.2f}")
+        for q in qs[:50]:
+            assert sorted(mih.search(q, args.max_distance)[0].tolist()) == \
+                sorted(mih.scan(q, args.max_distance)[0].tolist()), "MIH 与线性扫描结果不一致"
+    print()
+
+
+# ----------------------------------------------------------------------
+def photo(seed, size=640):
+    """随机色块 + 渐变 + 噪声，每个 seed 的构图不同"""
+    from PIL import Image, ImageDraw, ImageFilter
+    rnd = random.Random(seed)
+    img = Image.linear_gradient("L").rotate(rnd.randrange(360)).resize((size, size)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(rnd.randint(4, 9)):
+        x, y = rnd.randrange(size), rnd.randrange(size)
+        r = rnd.randint(size // 10, size // 3)
+        fill = tuple(rnd.randrange(256) for _ in range(3))
+        (draw.ellipse if rnd.random() < 0.5 else draw.rectangle)((x - r, y - r, x + r, y + r), fill=fill)
+    noise = Image.effect_noise((size, size), 40).convert("RGB")
+    return Image.blend(img.filter(ImageFilter.GaussianBlur(2)), noise, 0.15)
+
+
+def encode(img, fmt="PNG", **kw):
+    out = io.BytesIO()
+    img.save(out, fmt, **kw)
+    return out.getvalue()
+
+
+def variants():
+    from PIL import ImageDraw, ImageEnhance
+
+    def watermark(img):
+        img = img.copy()
+        ImageDraw.Draw(img).text((20, img.height - 40), "@smartpicture", fill=(255, 255, 255))
+        return encode(img)
+    return {
+        "copy": lambda img, png: png,
+        "jpeg q70": lambda img, png: encode(img, "JPEG", quality=70),
+        "resize 50%": lambda img, png: encode(img.resize((img.width // 2, img.height // 2))),
+        "brightness +15%": lambda img, png: encode(ImageEnhance.Brightness(img).enhance(1.15)),
+        "crop 4%": lambda img, png: encode(img.crop((13, 13, img.width - 13, img.height - 13))),
+        "watermark": lambda img, png: watermark(img),
+    }
+
+
+class CountingVision:
+    """假 Vision 客户端：记录上游收到的图片数，标签由图片来源决定，便于核对复用是否正确"""
+
+    def __init__(self, owners):
+        self.owners = owners
+        self.images = 0
+        self.calls = 0
+
+    def batch_annotate_images(self, requests):
+        self.calls += 1
+        self.images += len(requests)
+        responses = []
+        for r in requests:
+            owner = self.owners[r["image"]["source"]["image_uri"]]
+            responses.append(SimpleNamespace(
+                error=None,
+                label_annotations=[SimpleNamespace(description=owner)],
+                safe_search_annotation=SimpleNamespace(adult="VERY_UNLIKELY", violence="UNLIKELY", racy="UNLIKELY"),
+            ))
+        return SimpleNamespace(responses=responses)
+
+
+def bench_dedup(args, tmp):
+    os.environ["IMAGE_DEDUP_PATH"] = os.path.join(tmp, "image_index.sqlite")
+    os.environ["IMAGE_DEDUP_MAX_DISTANCE"] = str(args.max_distance)
+    from utils import vision
+
+    rnd = random.Random(args.seed)
+    kinds = variants()
+    workload, owners = [], {}  # (uri, 变体名)；owners: uri -> 原图编号
+    originals = {}
+    for n in range(args.originals):
+        img = photo(n)
+        originals[n] = (img, encode(img))
+    for n, (img, png) in originals.items():
+        workload.append((f"orig-{n}", "original", n, png))
+    for n in range(args.originals * args.dup_ratio):
+        src = rnd.randrange(args.originals)
+        name = rnd.choice(list(kinds))
+        workload.append((f"var-{n}", name, src, kinds[name](*originals[src])))
+    for n in range(args.unique):
+        workload.append((f"uniq-{n}", "unique", 10 ** 6 + n, encode(photo(10 ** 6 + n))))
+    rnd.shuffle(workload)
+
+    # 图片放在 data URI 里，省去存储依赖
+    import base64
+    uris = {}
+    for key, name, owner, data in workload:
+        uri = f"data:image/png;base64,{base64.b64encode(data).decode('ascii')}"
+        uris[key] = uri
+        owners[uri] = f"image-{owner}"
+    client = CountingVision(owners)
+
+    t0 = time.perf_counter()
+    stats, seen = {}, set()
+    for start in range(0, len(workload), args.batch):
+        part = workload[start:start + args.batch]
+        results = vision.batch_annotate([uris[k] for k, *_ in part], client=client)
+        for (key, name, owner, _), result in zip(part, results):
+            s = stats.setdefault(name, {"n": 0, "reused": 0, "wrong": 0, "missed": 0})
+            s["n"] += 1
+            s["reused"] += bool(result.get("deduplicated"))
+            s["wrong"] += result["labels"] != [f"image-{owner}"]
+            # 漏判：同一原图的某个版本在之前的批次已分析过，这次却没有复用
+            s["missed"] += owner in seen and not result.get("deduplicated")
+        seen.update(owner for _, _, owner, _ in part)
+    elapsed = time.perf_counter() - t0
+
+    print(f"{len(workload)} images ({args.originals} originals, {args.originals * args.dup_ratio} variants, "
+          f"{args.unique} unique), batches of {args.batch}\n")
+    print(f"{'variant':<16} {'images':>7} {'reused':>8} {'wrong result':>13} {'missed':>7}")
+    for name in ["original", *kinds, "unique"]:
+        s = stats.get(name)
+        if s:
+            print(f"{name:<16} {s['n']:>7} {s['reused'] / s['n']:>8.1%} {s['wrong']:>13} {s['missed']:>7}")
+    saved = 1 - client.images / len(workload)
+    print(f"\nupstream images {client.images} / {len(workload)} (saved {saved:.1%}), "
+          f"{client.calls} batch calls, {elapsed:.1f}s total")
+    print(f"index: {vision.get_image_index().stats()}")
+    assert sum(s["wrong"] for s in stats.values()) == 0, "出现误判：复用了另一张图片的结果"
+    print(f"false positives 0, false negatives {sum(s['missed'] for s in stats.values())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000, help="查找基准的指纹数量")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-distance", type=int, default=8)
+    parser.add_argument("--originals", type=int, default=60)
+    parser.add_argument("--dup-ratio", type=int, default=3, help="每张原图平均的变体数")
+    parser.add_argument("--unique", type=int, default=60, help="不重复的独立图片数")
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-lookup", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_lookup:
+        bench_lookup(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_dedup(args, tmp)
+
+
+if __name__ == "__main__":
+    main()
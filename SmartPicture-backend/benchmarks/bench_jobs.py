@@ -0,0 +1,172 @@
+"""
+benchmarks/bench_jobs.py
+-------------------------
+异步图像生成任务（utils/jobs.py）测试，使用假生成器与进程内 Firestore 替身，无需网络：
+- sync：现状，请求线程阻塞直到模型返回（按 --clients 个并发请求线程计）
+- async：提交即返回（报告提交延迟），--workers 个 worker 消费队列，统计吞吐与完成延迟
+- 结算：每个任务恰好提交或退款一次，最终余额 = 初始余额 - 成功任务数 × 单价
+- 重新投递：SQLite 队列中 worker 取走任务后「崩溃」（不 ack），租约到期后由其他 worker
+  完成，积分仍只结算一次
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_jobs.py --jobs 200 --latency 0.2 --workers 16 --fail-rate 0.05
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.fakes import FakeFirestore, FailedPrecondition, fake_firestore_module as fs  # noqa: E402
+from utils import jobs  # noqa: E402
+from utils.spending import PointsSpender  # noqa: E402
+
+COST = 5
+
+
+class FakeGenerator:
+    def __init__(self, latency, fail_rate=0.0, seed=11):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, **params):
+        with self._lock:
+            self.calls += 1
+            fail = self._rnd.random() < self.fail_rate
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("503 model unavailable")
+        return b"\x89PNG fake " + prompt.encode()
+
+
+def make_spender(users, points):
+    db = FakeFirestore()
+    for i in range(users):
+        db.collection("users").document(f"u{i}").set({"points": points})
+    return db, PointsSpender(db, fs=fs, conflict_error=FailedPrecondition)
+
+
+def check_settlement(db, manager, job_ids, users, points):
+    """每个任务的交易状态与任务状态一致，余额守恒"""
+    settled = {"committed": 0, "refunded": 0}
+    for job_id in job_ids:
+        job = manager.store.get(job_id)
+        tx = db.collection("transactions").document(job["reservation"]["tx_id"]).get().to_dict()
+        expected = {"succeeded": "committed", "failed": "refunded"}[job["status"]]
+        assert tx["status"] == expected, (job_id, job["status"], tx["status"])
+        settled[expected] += 1
+    balance = sum(db.collection("users").document(f"u{i}").get().to_dict()["points"] for i in range(users))
+    assert balance == users * points - settled["committed"] * COST, (balance, settled)
+    return settled
+
+
+def run_sync(args):
+    gen = FakeGenerator(args.latency, args.fail_rate)
+    _, spender = make_spender(args.users, 10 ** 6)
+
+    def request(i):
+        t0 = time.perf_counter()
+        try:
+            with spender.spend(f"u{i % args.users}", COST, {"module": "bench"}):
+                gen(f"prompt {i}")
+        except RuntimeError:
+            pass
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        latencies = list(pool.map(request, range(args.jobs)))
+    wall = time.perf_counter() - t0
+    return wall, statistics.median(latencies), max(latencies)
+
+
+def run_async(args, queue_kind, tmp):
+    gen = FakeGenerator(args.latency, args.fail_rate)
+    db, spender = make_spender(args.users, 10 ** 6)
+    if queue_kind == "sqlite":
+        path = os.path.join(tmp, f"jobs-{time.monotonic_ns()}.sqlite")
+        queue, store = jobs.SQLiteQueue(path), jobs.SQLiteJobStore(path)
+    else:
+        queue, store = jobs.InProcessQueue(), jobs.MemoryJobStore()
+    manager = jobs.JobManager(store, queue, gen, spender=spender,
+                              result_sink=jobs.local_result_sink(os.path.join(tmp, "results")))
+    manager.start_workers(args.workers)
+
+    submit_latencies = []
+    t0 = time.perf_counter()
+    ids = []
+    for i in range(args.jobs):
+        s = time.perf_counter()
+        ids.append(manager.submit(f"u{i % args.users}", f"prompt {i}", cost=COST)["id"])
+        submit_latencies.append(time.perf_counter() - s)
+    done = [manager.status(job_id, wait=30) for job_id in ids]
+    wall = time.perf_counter() - t0
+    manager.stop()
+
+    assert all(j["status"] in jobs.TERMINAL for j in done)
+    completion = [j["updated_at"] - j["created_at"] for j in done]
+    settled = check_settlement(db, manager, ids, args.users, 10 ** 6)
+    return wall, statistics.median(submit_latencies), statistics.median(completion), settled
+
+
+def run_redelivery(args, tmp):
+    """worker 取走任务后不 ack 即退出；租约到期后另一个 worker 完成，积分只结算一次"""
+    gen = FakeGenerator(0.01)
+    db, spender = make_spender(1, 100)
+    path = os.path.join(tmp, "redelivery.sqlite")
+    queue = jobs.SQLiteQueue(path, visibility_timeout=0.3)
+    manager = jobs.JobManager(jobs.SQLiteJobStore(path), queue, gen, spender=spender)
+    job = manager.submit("u0", "crash me", cost=COST)
+
+    job_id, _ = queue.get(timeout=1)
+    manager.store.claim(job_id)  # 「崩溃」的 worker：已开始执行，没有 finish 也没有 ack
+
+    manager.start_workers(2)
+    final = manager.status(job["id"], wait=5)
+    manager.stop()
+    assert final["status"] == "succeeded" and final["attempts"] == 2, final
+    # 同一任务被重复投递时，终态任务直接 ack，不会再次生成或结算
+    queue.put(job["id"])
+    manager.process_one(timeout=1)
+    assert gen.calls == 1 and queue.depth() == 0
+    check_settlement(db, manager, [job["id"]], 1, 100)
+    return final
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="每次模型调用的延迟（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--clients", type=int, default=8, help="sync 模式下的并发请求线程数")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    wall, p50, worst = run_sync(args)
+    print(f"{'mode':>14} {'jobs/s':>8} {'request p50 ms':>15} {'done p50 ms':>12} {'wall s':>7}")
+    print(f"{'sync':>14} {args.jobs / wall:>8.1f} {p50 * 1000:>15.1f} {p50 * 1000:>12.1f} {wall:>7.2f}"
+          f"   (request thread held up to {worst * 1000:.0f} ms)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("memory", "sqlite"):
+            wall, submit_p50, done_p50, settled = run_async(args, kind, tmp)
+            print(f"{'async ' + kind:>14} {args.jobs / wall:>8.1f} {submit_p50 * 1000:>15.2f} "
+                  f"{done_p50 * 1000:>12.1f} {wall:>7.2f}   settled {settled}")
+        final = run_redelivery(args, tmp)
+        print(f"\nredelivery after worker crash: status={final['status']}, attempts={final['attempts']}, "
+              f"points settled once")
+
+
+if __name__ == "__main__":
+    main()
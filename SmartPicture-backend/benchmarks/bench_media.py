@@ -0,0 +1,127 @@
+"""
+benchmarks/bench_media.py
+--------------------------
+图片下发：JSON 内嵌 Base64（旧路径）vs /media/<id> 二进制 + 缓存变体（utils/media.py）。
+
+在本地 HTTP/1.1 服务上（keep-alive 连接）对每种方式请求 --requests 次，报告响应字节数、
+服务端到客户端拿到完整字节的延迟（p50 / p95），以及客户端解出图片字节的额外耗时
+（JSON 需要 json.loads + Base64 解码）。还包括：首次生成变体的耗时、ETag 重新验证（304）、
+Range 请求前 64 KB。图片为合成的照片风格 PNG（与 Imagen 默认输出一致）。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_media.py --sizes 1024 2048 --requests 200
+"""
+
+import argparse
+import base64
+import http.client
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask, jsonify  # noqa: E402
+
+from benchmarks.loadtest import Server  # noqa: E402
+
+
+def photo(size, seed):
+    """平滑渐变 + 细节噪声，压缩率接近真实照片"""
+    from PIL import Image, ImageFilter
+    noise = Image.effect_noise((size, size), 64).convert("RGB")
+    base = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    tint = Image.new("RGB", (size, size), ((seed * 67) % 256, (seed * 131) % 256, 160))
+    img = Image.blend(Image.blend(base, tint, 0.5), noise.filter(ImageFilter.GaussianBlur(1)), 0.35)
+    out = io.BytesIO()
+    img.save(out, "PNG")
+    return out.getvalue()
+
+
+def fetch(conn, path, headers=None):
+    t0 = time.perf_counter()
+    conn.request("GET", path, headers=headers or {})
+    resp = conn.getresponse()
+    body = resp.read()
+    return resp.status, body, time.perf_counter() - t0
+
+
+def measure(conn, path, n, headers=None, decode=None):
+    latencies, decode_s, size = [], 0.0, 0
+    for _ in range(n):
+        status, body, dt = fetch(conn, path, headers)
+        assert status in (200, 206, 304), (path, status)
+        latencies.append(dt)
+        size = len(body)
+        if decode:
+            t0 = time.perf_counter()
+            decode(body)
+            decode_s += time.perf_counter() - t0
+    latencies.sort()
+    return size, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, \
+        decode_s / n * 1000
+
+
+def decode_json(body):
+    uri = json.loads(body)["image"]
+    return base64.b64decode(uri[uri.index(",") + 1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1024, 2048])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--width", type=int, default=512, help="变体宽度")
+    args = parser.parse_args()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["MEDIA_DIR"] = tmp
+        from utils import media
+        store = media.get_media_store()
+
+        app = Flask(__name__)
+        app.register_blueprint(media.media_bp)
+        originals = {}
+
+        @app.get("/legacy/<int:size>")
+        def legacy(size):
+            # 旧的 /api/generate_image 返回形态：Base64 图片放在 JSON 里
+            return jsonify({"image": "data:image/png;base64," + base64.b64encode(originals[size]).decode("ascii"),
+                            "spent": 5, "cache": "memory"})
+
+        server = Server(app)
+        conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=60)
+        print(f"{'image':>6} {'delivery':<26} {'bytes':>10} {'p50 ms':>8} {'p95 ms':>8} {'decode ms':>10}")
+        for size in args.sizes:
+            originals[size] = photo(size, size)
+            url = media.store_result(originals[size])
+            rows = [("JSON + Base64", f"/legacy/{size}", None, decode_json),
+                    ("binary original", url, None, None)]
+            for fmt in ("webp", "avif"):
+                t0 = time.perf_counter()
+                fetch(conn, f"{url}?w={args.width}&format={fmt}")
+                print(f"{size:>6} {f'(first {fmt} w={args.width} build)':<26} {'':>10} "
+                      f"{(time.perf_counter() - t0) * 1000:>8.1f}")
+                rows.append((f"binary {fmt} w={args.width}", f"{url}?w={args.width}&format={fmt}", None, None))
+            conn.request("GET", url)
+            resp = conn.getresponse()
+            resp.read()
+            etag = resp.getheader("ETag")
+            rows.append(("revalidate (304)", url, {"If-None-Match": etag}, None))
+            rows.append(("range first 64 KB", url, {"Range": "bytes=0-65535"}, None))
+            for label, path, headers, decode in rows:
+                nbytes, p50, p95, dec = measure(conn, path, args.requests, headers, decode)
+                print(f"{size:>6} {label:<26} {nbytes:>10,} {p50:>8.2f} {p95:>8.2f} {dec:>10.2f}")
+            print()
+        conn.close()
+        server.stop()
+        print(f"media store: {store.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+benchmarks/bench_metrics.py
+----------------------------
+请求埋点（utils/metrics.py）的开销测试，超出预算时以非零状态退出，可放进 CI。
+
+- 单次操作：@timed 装饰的空函数、with metrics.stage、Histogram.observe
+- 每请求（预算检查）：在一个已推入的请求上下文里循环执行中间件钩子 + 5 个带阶段计时的空函数
+  （verify_token / get_points / generate_content / add_tx / build_seo_response 的形态），
+  减去同样 5 个空函数的耗时，多轮取最小值。直接测埋点本身，不受 Flask 测试客户端整请求
+  （数百微秒、抖动数十微秒）的噪声影响
+- 预算按本机速度校准：--budget-us 以空函数调用 REFERENCE_NOOP_NS 纳秒的机器为准，
+  本机空函数调用更慢时按比例放宽
+- 整请求（仅参考）：测试客户端下埋点开启 vs 关闭，两者交替运行、各取最小值
+- 慢请求采样剖析：METRICS_PROFILE_RATE=1 时确认 .prof 文件写出且数量受 KEEP 限制
+- /metrics 渲染耗时（--routes 个路由 × 若干阶段）
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_metrics.py --requests 5000 --budget-us 50
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask, jsonify  # noqa: E402
+
+from utils import metrics as metrics_module  # noqa: E402
+from utils.metrics import Histogram, Metrics  # noqa: E402
+
+STAGES = ("verify_token", "get_points", "generate_content", "add_tx", "build_seo_response")
+REFERENCE_NOOP_NS = 50  # 预算对应机器上一次空函数调用的耗时
+
+
+def per_op(fn, n, rounds=5):
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / n * 1e9)
+    return best
+
+
+def make_app(registry, instrumented):
+    app = Flask(__name__)
+    steps = [registry.timed(name)(lambda: None) for name in STAGES]
+    app.config["BENCH_STEPS"] = steps
+
+    @app.post("/api/generate_text")
+    def view():
+        for step in steps:
+            step()
+        return jsonify({"ok": True})
+
+    registry.enabled = instrumented
+    metrics_module.init_app(app, registry)
+    return app
+
+
+def per_request_us(apps, n, rounds):
+    """整请求耗时（微秒），多个应用交替运行以抵消机器负载的漂移，各取最小值"""
+    clients = [app.test_client() for app in apps]
+    for client in clients:
+        for _ in range(200):
+            client.post("/api/generate_text")
+    best = [float("inf")] * len(apps)
+    for _ in range(rounds):
+        for i, client in enumerate(clients):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                client.post("/api/generate_text")
+            best[i] = min(best[i], (time.perf_counter() - t0) / n * 1e6)
+    return best
+
+
+def instrumentation_us(n, rounds):
+    """中间件钩子 + 5 个阶段的埋点耗时（微秒）：同一请求上下文中直接调用，减去空函数"""
+    app = make_app(Metrics(), True)
+    steps = app.config["BENCH_STEPS"]
+    bare = [lambda: None for _ in STAGES]
+    with app.test_request_context("/api/generate_text", method="POST"):
+        before = app.before_request_funcs[None]
+        after = list(reversed(app.after_request_funcs[None]))
+        teardown = app.teardown_request_funcs[None]
+        response = app.response_class()
+
+        def instrumented():
+            for f in before:
+                f()
+            for step in steps:
+                step()
+            r = response
+            for f in after:
+                r = f(r)
+            for f in teardown:
+                f(None)
+
+        def plain():
+            for step in bare:
+                step()
+
+        return (per_op(instrumented, n, rounds) - per_op(plain, n, rounds)) / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget-us", type=float, default=50, help="每请求埋点开销上限（微秒）")
+    parser.add_argument("--routes", type=int, default=50)
+    args = parser.parse_args()
+
+    registry = Metrics()
+    noop = registry.timed("noop")(lambda: None)
+    plain = (lambda: None)
+    hist = Histogram()
+
+    def with_stage():
+        with registry.stage("noop"):
+            pass
+
+    base = per_op(plain, 200_000)
+    print(f"{'operation':<28} {'ns/op':>8}")
+    print(f"{'plain call':<28} {base:>8.0f}")
+    print(f"{'@timed call':<28} {per_op(noop, 200_000):>8.0f}")
+    print(f"{'with stage()':<28} {per_op(with_stage, 200_000):>8.0f}")
+    print(f"{'Histogram.observe':<28} {per_op(lambda: hist.observe(0.0123), 200_000):>8.0f}")
+
+    budget = args.budget_us * max(1.0, base / REFERENCE_NOOP_NS)
+    overhead = instrumentation_us(args.requests * 4, args.rounds)
+    print(f"\ninstrumentation per request (middleware + {len(STAGES)} stages, best of {args.rounds}): "
+          f"{overhead:.1f}us (budget {budget:.0f}us = {args.budget_us:.0f}us x{budget / args.budget_us:.2f} "
+          f"for a {base:.0f}ns no-op call)")
+    off, on = per_request_us([make_app(Metrics(), False), make_app(Metrics(), True)], args.requests, args.rounds)
+    print(f"whole request (test client, interleaved, for reference): off {off:.1f}us, on {on:.1f}us")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(METRICS_PROFILE_RATE="1", METRICS_SLOW_MS="0", METRICS_PROFILE_DIR=tmp,
+                          METRICS_PROFILE_KEEP="5")
+        app = make_app(Metrics(), True)
+        client = app.test_client()
+        log = io.StringIO()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            for _ in range(20):
+                client.post("/api/generate_text")
+        profiled = (time.perf_counter() - t0) / 20 * 1e6
+        assert log.getvalue().count("[Slow Request]") == 20
+        dumps = [f for f in os.listdir(tmp) if f.endswith(".prof")]
+        assert len(dumps) == 5, dumps
+        print(f"profiled slow requests: {profiled:.0f}us each, {len(dumps)} dumps kept (e.g. {dumps[0]})")
+        for key in ("METRICS_PROFILE_RATE", "METRICS_SLOW_MS", "METRICS_PROFILE_DIR", "METRICS_PROFILE_KEEP"):
+            del os.environ[key]
+
+    registry = Metrics()
+    for r in range(args.routes):
+        for status in ("200", "400"):
+            registry.observe(metrics_module.REQUEST_METRIC, 0.05,
+                             (("method", "POST"), ("route", f"/api/r{r}"), ("status", status)))
+    for name in STAGES:
+        registry.stage(name).__enter__().__exit__()
+    t0 = time.perf_counter()
+    text = registry.render()
+    print(f"/metrics render: {len(text.splitlines())} lines in {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+    if overhead > budget:
+        print(f"FAIL: instrumentation overhead {overhead:.1f}us exceeds budget {budget:.0f}us")
+        sys.exit(1)
+    print("OK: within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+benchmarks/bench_points_ledger.py
+----------------------------------
+对比旧版「整文件 JSON 重写」积分模块与追加写账本（utils/ledger.py）的 ops/sec。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_points_ledger.py
+    python benchmarks/bench_points_ledger.py --users 10000 100000 --ops 20000 --workers 4
+
+--workers > 1 时额外启动多个进程并发扣减同一用户，校验最终余额没有丢失更新。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.ledger import PointsLedger  # noqa: E402
+
+
+class LegacyJsonPoints:
+    """旧版 utils/points.py 的等价实现：每次读写都加载 / 重写整个 users.json"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load_data(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def save_data(self, data):
+        with open(self.path, "w") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def get(self, user_id):
+        return self.load_data().get(user_id, {}).get("points", 0)
+
+    def add(self, user_id, amount):
+        data = self.load_data()
+        user = data.get(user_id, {"points": 0, "invited_by": None})
+        user["points"] += amount
+        data[user_id] = user
+        self.save_data(data)
+
+    def deduct(self, user_id, cost):
+        data = self.load_data()
+        user = data.get(user_id, {"points": 0})
+        if user["points"] < cost:
+            return False
+        user["points"] -= cost
+        data[user_id] = user
+        self.save_data(data)
+        return True
+
+
+def seed_users(n):
+    return {f"user_{i}": {"points": 100, "invited_by": None} for i in range(n)}
+
+
+def run_mix(store, n_users, max_ops, time_budget):
+    """读:加:扣 = 2:1:1 的混合负载，达到 ops 上限或时间预算即停止"""
+    rnd = random.Random(42)
+    ops = 0
+    start = time.perf_counter()
+    while ops < max_ops and time.perf_counter() - start < time_budget:
+        uid = f"user_{rnd.randrange(n_users)}"
+        r = ops % 4
+        if r < 2:
+            store.get(uid)
+        elif r == 2:
+            store.add(uid, 5)
+        else:
+            store.deduct(uid, 3)
+        ops += 1
+    elapsed = time.perf_counter() - start
+    return ops, elapsed
+
+
+def bench_legacy(n_users, max_ops, time_budget):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.json")
+        with open(path, "w") as f:
+            json.dump(seed_users(n_users), f, indent=2)
+        return run_mix(LegacyJsonPoints(path), n_users, max_ops, time_budget)
+
+
+def bench_ledger(n_users, max_ops, time_budget):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "users.json")
+        with open(legacy, "w") as f:
+            json.dump(seed_users(n_users), f)
+        t0 = time.perf_counter()
+        ledger = PointsLedger(tmp, legacy_file=legacy)
+        startup = time.perf_counter() - t0
+        ops, elapsed = run_mix(ledger, n_users, max_ops, time_budget)
+        ledger.close()
+
+        t0 = time.perf_counter()
+        PointsLedger(tmp).close()
+        recovery = time.perf_counter() - t0
+        return ops, elapsed, startup, recovery
+
+
+def _deduct_worker(data_dir, uid, attempts, results):
+    ledger = PointsLedger(data_dir)
+    ok = sum(1 for _ in range(attempts) if ledger.deduct(uid, 1))
+    results.put(ok)
+
+
+def check_concurrency(workers, attempts):
+    """多个进程争抢扣减同一用户：成功次数之和必须恰好等于初始余额"""
+    with tempfile.TemporaryDirectory() as tmp:
+        initial = workers * attempts // 2
+        ledger = PointsLedger(tmp, compact_every=500)
+        ledger.add("hot_user", initial)
+        ledger.close()
+
+        results = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=_deduct_worker, args=(tmp, "hot_user", attempts, results))
+            for _ in range(workers)
+        ]
+        for p in procs:
+            p.start()
+        succeeded = sum(results.get() for _ in procs)
+        for p in procs:
+            p.join()
+
+        final = PointsLedger(tmp).get("hot_user")
+        return initial, succeeded, final
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--ops", type=int, default=50_000, help="每个规模的最大操作数")
+    parser.add_argument("--budget", type=float, default=10.0, help="每个实现每个规模的时间预算（秒）")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'impl':>8} {'ops':>8} {'ops/sec':>12} {'startup(s)':>11} {'recover(s)':>11}")
+    for n in args.users:
+        ops, elapsed = bench_legacy(n, args.ops, args.budget)
+        legacy_rate = ops / elapsed
+        print(f"{n:>10} {'legacy':>8} {ops:>8} {legacy_rate:>12.1f} {'-':>11} {'-':>11}")
+
+        ops, elapsed, startup, recovery = bench_ledger(n, args.ops, args.budget)
+        ledger_rate = ops / elapsed
+        print(f"{n:>10} {'ledger':>8} {ops:>8} {ledger_rate:>12.1f} {startup:>11.3f} {recovery:>11.3f}"
+              f"   x{ledger_rate / legacy_rate:.0f}")
+
+    if args.workers > 1:
+        initial, succeeded, final = check_concurrency(args.workers, 2_000)
+        status = "OK" if succeeded == initial and final == 0 else "LOST UPDATES"
+        print(f"\nconcurrency: {args.workers} processes, initial={initial}, "
+              f"successful deducts={succeeded}, final balance={final} -> {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+benchmarks/bench_points_spending.py
+------------------------------------
+统计每个生成请求的 Firestore 往返次数与延迟：
+- legacy：app.py 旧流程 get_points → add_tx（transactions.add + users.set）
+- reserve：utils/spending.PointsSpender 的 reserve → commit / refund
+
+同时用并发请求争抢同一用户余额，检查是否出现超扣。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_points_spending.py --latency 0.005 --requests 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.fakes import FakeFirestore, FailedPrecondition, fake_firestore_module as fs  # noqa: E402
+from utils.spending import InsufficientPoints, PointsSpender  # noqa: E402
+
+
+def legacy_request(db, uid, cost, model_delay):
+    """旧版 app.py：读余额 → 调模型 → 两次独立写入"""
+    doc = db.collection("users").document(uid).get()
+    if (doc.to_dict() or {}).get("points", 0) < cost:
+        return False
+    time.sleep(model_delay)
+    db.collection("transactions").add({
+        "uid": uid, "type": "spend", "amount": -cost, "meta": {},
+        "createdAt": fs.SERVER_TIMESTAMP,
+    })
+    db.collection("users").document(uid).set({
+        "points": fs.Increment(-cost),
+        "lastActiveAt": fs.SERVER_TIMESTAMP,
+    }, merge=True)
+    return True
+
+
+def reserve_request(spender, uid, cost, model_delay, fail=False):
+    try:
+        with spender.spend(uid, cost, {"module": "bench"}):
+            time.sleep(model_delay)
+            if fail:
+                raise RuntimeError("model error")
+    except InsufficientPoints:
+        return False
+    except RuntimeError:
+        return False
+    return True
+
+
+def seed(db, users, points):
+    for i in range(users):
+        db.collection("users").document(f"u{i}").set({"points": points})
+    db.reset_counts()
+
+
+def measure(run, db, n):
+    latencies = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        run(i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return db.round_trips / n, statistics.median(latencies), sorted(latencies)[int(n * 0.99) - 1]
+
+
+def overspend_check(make_request, db, concurrency):
+    """余额只够 5 次消费时并发发起 concurrency 次请求，统计成功次数与最终余额"""
+    db.collection("users").document("hot").set({"points": 50})
+    with ThreadPoolExecutor(concurrency) as pool:
+        ok = sum(pool.map(lambda _: make_request("hot"), range(concurrency)))
+    final = db.collection("users").document("hot").get().to_dict()["points"]
+    return ok, final
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.005, help="每次 Firestore RPC 的模拟延迟（秒）")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    cost = 10
+
+    print(f"{'path':>16} {'round-trips/req':>16} {'p50(ms)':>9} {'p99(ms)':>9}")
+
+    db = FakeFirestore(latency=args.latency)
+    seed(db, args.users, 10 ** 9)
+    rt, p50, p99 = measure(lambda i: legacy_request(db, f"u{i % args.users}", cost, 0), db, args.requests)
+    print(f"{'legacy':>16} {rt:>16.2f} {p50:>9.2f} {p99:>9.2f}")
+
+    db = FakeFirestore(latency=args.latency)
+    seed(db, args.users, 10 ** 9)
+    spender = PointsSpender(db, fs=fs, conflict_error=FailedPrecondition)
+    rt, p50, p99 = measure(lambda i: reserve_request(spender, f"u{i % args.users}", cost, 0), db, args.requests)
+    print(f"{'reserve/commit':>16} {rt:>16.2f} {p50:>9.2f} {p99:>9.2f}")
+
+    db = FakeFirestore(latency=args.latency)
+    seed(db, args.users, 10 ** 9)
+    spender = PointsSpender(db, fs=fs, conflict_error=FailedPrecondition)
+    rt, p50, p99 = measure(lambda i: reserve_request(spender, f"u{i % args.users}", cost, 0, fail=True), db, args.requests)
+    refunded = db.collection("users").document("u0").get().to_dict()["points"] == 10 ** 9
+    print(f"{'reserve/refund':>16} {rt:>16.2f} {p50:>9.2f} {p99:>9.2f}   balance restored: {refunded}")
+
+    print(f"\noverspend check: balance 50, cost {cost}, {args.concurrency} concurrent requests")
+    db = FakeFirestore(latency=args.latency)
+    ok, final = overspend_check(lambda uid: legacy_request(db, uid, cost, 0.01), db, args.concurrency)
+    print(f"  legacy : {ok} succeeded, final balance {final}")
+    db = FakeFirestore(latency=args.latency)
+    spender = PointsSpender(db, fs=fs, conflict_error=FailedPrecondition, max_retries=args.concurrency + 5)
+    ok, final = overspend_check(lambda uid: reserve_request(spender, uid, cost, 0.01), db, args.concurrency)
+    print(f"  reserve: {ok} succeeded, final balance {final}")
+
+
+if __name__ == "__main__":
+    main()
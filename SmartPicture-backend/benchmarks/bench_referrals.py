@@ -0,0 +1,136 @@
+"""
+benchmarks/bench_referrals.py
+------------------------------
+批量邀请接口（/api/referral/batch）与逐条接口（/api/referral）对比，使用临时账本目录。
+
+工作负载：--referrals 条邀请，其中混入约 2% 自我邀请与 3% 重复的被邀请人（模拟活动刷量）。
+- per-pair：每条邀请一次 HTTP 请求（Flask 测试客户端），与批量接口同样去重
+- batch：按 --batch-size 分批提交，校验逐条结果
+- retry：整批重放（相同幂等键）应全部返回 replayed，余额不变
+- 多进程：两个进程同时提交同一批邀请，奖励只发放一次
+最终余额与逐条结果中的奖励总和逐一核对。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_referrals.py --referrals 100000 --batch-size 5000
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def workload(n, seed=0):
+    rnd = random.Random(seed)
+    pairs = []
+    for i in range(n):
+        inviter = f"u{rnd.randrange(max(n // 20, 1))}"
+        r = rnd.random()
+        if r < 0.02:
+            invitee = inviter
+        elif r < 0.05 and i:
+            invitee = pairs[rnd.randrange(len(pairs))]["invitee_id"]
+        else:
+            invitee = f"new{i}"
+        pairs.append({"inviter_id": inviter, "invitee_id": invitee, "idempotency_key": f"campaign-1:{i}"})
+    return pairs
+
+
+def make_client(ledger_dir):
+    os.environ["POINTS_LEDGER_DIR"] = ledger_dir
+    from flask import Flask
+    from utils import points
+    from utils.referral import referral_bp
+    points.LEDGER_DIR, points._ledger = ledger_dir, None
+    app = Flask(__name__)
+    app.register_blueprint(referral_bp)
+    return app.test_client(), points
+
+
+def submit_batches(client, pairs, batch_size):
+    results = []
+    for s in range(0, len(pairs), batch_size):
+        resp = client.post("/api/referral/batch", json={"referrals": pairs[s:s + batch_size]})
+        assert resp.status_code == 200, resp.get_json()
+        results.extend(resp.get_json()["results"])
+    return results
+
+
+def expected_balances(results):
+    balances = {}
+    for r in results:
+        if r["status"] == "applied":
+            balances[r["inviter_id"]] = balances.get(r["inviter_id"], 0) + r["inviter_reward"]
+            balances[r["invitee_id"]] = balances.get(r["invitee_id"], 0) + r["invitee_reward"]
+    return balances
+
+
+def _worker(ledger_dir, pairs, batch_size, out):
+    client, _ = make_client(ledger_dir)
+    out.put([r["status"] for r in submit_batches(client, pairs, batch_size)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--referrals", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    pairs = workload(args.referrals)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client, points = make_client(os.path.join(tmp, "per_pair"))
+        t0 = time.perf_counter()
+        awarded = 0
+        for p in pairs:
+            resp = client.post("/api/referral", json=p)
+            awarded += resp.status_code == 200
+        per_pair = time.perf_counter() - t0
+        print(f"{'mode':>10} {'seconds':>8} {'referrals/s':>12} {'rewarded':>9} {'rejected':>9}")
+        print(f"{'per-pair':>10} {per_pair:>8.2f} {len(pairs) / per_pair:>12.0f} {awarded:>9} {len(pairs) - awarded:>9}")
+
+        client, points = make_client(os.path.join(tmp, "batch"))
+        t0 = time.perf_counter()
+        results = submit_batches(client, pairs, args.batch_size)
+        batch = time.perf_counter() - t0
+        counts = {}
+        for r in results:
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+        print(f"{'batch':>10} {batch:>8.2f} {len(pairs) / batch:>12.0f} {counts['applied']:>9} "
+              f"{len(pairs) - counts['applied']:>9}   ({per_pair / batch:.0f}x) {counts}")
+
+        expected = expected_balances(results)
+        actual = points.get_ledger().balances()
+        assert actual == expected, "ledger balances differ from per-pair results"
+        unique_invitees = len({p["invitee_id"] for p in pairs if p["invitee_id"] != p["inviter_id"]})
+        assert counts["applied"] == unique_invitees
+
+        t0 = time.perf_counter()
+        replay = submit_batches(client, pairs, args.batch_size)
+        assert all(r["status"] == ("replayed" if o["status"] == "applied" else o["status"])
+                   for r, o in zip(replay, results))
+        assert points.get_ledger().balances() == expected
+        print(f"{'retry':>10} {time.perf_counter() - t0:>8.2f}   all applied entries replayed, balances unchanged")
+
+        sample = pairs[:20_000]
+        ledger_dir = os.path.join(tmp, "multi")
+        out = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_worker, args=(ledger_dir, sample, args.batch_size, out))
+                 for _ in range(2)]
+        for p in procs:
+            p.start()
+        statuses = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+        applied = sum(s == "applied" for run in statuses for s in run)
+        expected_applied = len({p["invitee_id"] for p in sample if p["invitee_id"] != p["inviter_id"]})
+        assert applied == expected_applied, (applied, expected_applied)
+        print(f"\n2 processes x {len(sample)} overlapping referrals: {applied} rewarded once each")
+
+
+if __name__ == "__main__":
+    main()
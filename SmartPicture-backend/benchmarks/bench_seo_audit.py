@@ -0,0 +1,114 @@
+"""
+benchmarks/bench_seo_audit.py
+------------------------------
+批量 SEO 审计（utils/seo_audit.py）在合成语料上的吞吐测试：
+- baseline：整体 json.load 后单进程逐条 evaluate_seo_health / detect_content_type
+- in-process：流式读取，workers=1 时在当前进程内逐批审计，结果逐批写出 JSONL
+- pool w=N：流式读取 + N 个进程（N = 2, 4, … --workers），报告进程池开始快于
+  in-process 的交叉点（跨进程传输与序列化的开销需要足够多的核来摊薄；单核机器上不会出现）
+- incremental：修改 1% 记录后带 --state 重跑，只重新评分变化的记录
+
+同时报告流式审计阶段的峰值 RSS（父进程与最大的子进程，基线运行前记录）。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_seo_audit.py --records 1000000 --workers 8
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.seo_audit import audit_record, run_audit  # noqa: E402
+
+TOPICS = ["品牌出海", "AI 内容策略", "AEO 优化", "跨平台分发", "增长飞轮", "海外营销", "短视频", "播客"]
+
+
+def synth(i, rnd, version=0):
+    kws = rnd.sample(TOPICS, rnd.randint(1, 5))
+    return {
+        "id": f"article-{i}",
+        "seoTitle": f"{kws[0]} 指南 #{i}" + (" | SmartPicture" if i % 3 else ""),
+        "seoDescription": "解析 AI 内容策略如何结合 SEO 与 AEO 实现增长。" * rnd.randint(0, 4),
+        "keywords": kws,
+        "summary": f"第 {i} 篇文章摘要 v{version}",
+        "cover": f"https://cdn.example.com/{i}.webp" if i % 5 == 0 else None,
+    }
+
+
+def write_corpus(path, n, seed=11, changed=()):
+    rnd = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps(synth(i, rnd, version=1 if i in changed else 0), ensure_ascii=False) + "\n")
+
+
+def max_rss_mb():
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return self_kb / 1024, child_kb / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--skip-baseline", action="store_true", help="跳过整体载入的基线（大语料时内存占用高）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus, out, state = (os.path.join(tmp, n) for n in ("corpus.jsonl", "audit.jsonl", "audit.state"))
+        t0 = time.perf_counter()
+        write_corpus(corpus, args.records)
+        print(f"corpus: {args.records} records, {os.path.getsize(corpus) / 1e6:.0f} MB "
+              f"(generated in {time.perf_counter() - t0:.1f}s)\n")
+        print(f"{'mode':>16} {'seconds':>9} {'records/s':>11} {'scored':>9} {'skipped':>9}")
+
+        sweep = [1] + [w for w in (2, 4, 8, 16, 32, 64) if w < args.workers] + ([args.workers] if args.workers > 1 else [2])
+        rates, crossover = {}, None
+        for workers in sorted(set(sweep)):
+            stats = run_audit(corpus, out, workers=workers, batch_size=args.batch_size,
+                              state_path=state if workers == args.workers else None)
+            rates[workers] = stats["total"] / stats["seconds"]
+            label = "in-process" if workers == 1 else f"pool w={workers}"
+            print(f"{label:>16} {stats['seconds']:>9.2f} {rates[workers]:>11.0f} {stats['scored']:>9} {stats['skipped']:>9}")
+            if workers > 1 and crossover is None and rates[workers] > rates[1]:
+                crossover = workers
+        if crossover:
+            print(f"{'':>16} process pool overtakes in-process at w={crossover} "
+                  f"({rates[crossover] / rates[1]:.1f}x; {os.cpu_count()} CPUs)")
+        else:
+            print(f"{'':>16} no crossover: in-process is fastest on this machine ({os.cpu_count()} CPUs)")
+
+        changed = set(random.Random(5).sample(range(args.records), max(1, args.records // 100)))
+        write_corpus(corpus, args.records, changed=changed)
+        stats = run_audit(corpus, out, workers=args.workers, batch_size=args.batch_size, state_path=state)
+        print(f"{'incremental':>16} {stats['seconds']:>9.2f} {stats['total'] / stats['seconds']:>11.0f} "
+              f"{stats['scored']:>9} {stats['skipped']:>9}")
+        assert stats["scored"] == len(changed)
+        with open(out, encoding="utf-8") as f:
+            assert sum(1 for _ in f) == args.records, "增量重跑的输出应包含全部记录"
+
+        parent, children = max_rss_mb()  # 在整体载入的基线之前记录
+        if not args.skip_baseline:
+            t0 = time.perf_counter()
+            with open(corpus, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            for r in records:
+                audit_record(r)
+            wall = time.perf_counter() - t0
+            print(f"{'baseline':>16} {wall:>9.2f} {args.records / wall:>11.0f} {len(records):>9} {0:>9}")
+            del records
+
+        print(f"\nstreaming audit peak RSS: parent {parent:.0f} MB, largest worker {children:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+benchmarks/bench_startup.py
+----------------------------
+冷启动基准：每轮启动一个全新的解释器，测量
+- interpreter：解释器启动到执行第一行用户代码
+- import app：导入 app 模块（含 create_app()）的耗时
+- first request：测试客户端发出的第一个请求（GET /，就绪探针路径）
+- warm request：第二个请求，作为对照
+并用 -X importtime 统计累计耗时最高的模块（按顶层包汇总），便于定位回归。
+
+--max-import-ms 超出时以非零状态退出，可直接放进 CI；--json 输出机器可读结果。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --prewarm background --json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+assert client.get("/").status_code == 200
+t2 = time.perf_counter()
+client.get("/")
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first": t2 - t1, "warm": t3 - t2}))
+"""
+
+
+def run_once(env):
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    total = time.perf_counter() - t0
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["total"] = total
+    result["interpreter"] = total - result["import"] - result["first"] - result["warm"]
+    return result
+
+
+def importtime_hotspots(env, top):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    modules, packages = [], defaultdict(int)
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = (p.strip() for p in line[len("import time:"):].split("|"))
+        if not self_us.isdigit():
+            continue  # 表头
+        self_us, cumulative_us = int(self_us), int(cumulative_us)
+        modules.append((cumulative_us, self_us, name))
+        packages[name.split(".")[0]] += self_us
+    modules.sort(reverse=True)
+    return modules[:top], sorted(packages.items(), key=lambda kv: -kv[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--prewarm", choices=("off", "sync", "background"), default="off")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="import app 中位数上限，超出时退出码为 1")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    env = {**os.environ, "APP_PREWARM": args.prewarm}
+    runs = [run_once(env) for _ in range(args.runs)]
+    summary = {k: statistics.median(r[k] for r in runs) * 1000 for k in ("interpreter", "import", "first", "warm", "total")}
+    modules, packages = importtime_hotspots(env, args.top)
+
+    if args.json:
+        print(json.dumps({
+            "median_ms": {k: round(v, 2) for k, v in summary.items()},
+            "modules": [{"module": n, "cumulative_ms": c / 1000, "self_ms": s / 1000} for c, s, n in modules],
+            "packages": [{"package": n, "self_ms": s / 1000} for n, s in packages],
+        }, indent=2))
+    else:
+        print(f"cold start, APP_PREWARM={args.prewarm}, median of {args.runs} runs:")
+        for k, v in summary.items():
+            print(f"  {k:>12}: {v:8.1f} ms")
+        print("\nslowest imports (cumulative, -X importtime):")
+        for c, s, n in modules:
+            print(f"  {c / 1000:8.1f} ms  (self {s / 1000:6.1f})  {n}")
+        print("\nself time by top-level package:")
+        for n, s in packages:
+            print(f"  {s / 1000:8.1f} ms  {n}")
+
+    if args.max_import_ms is not None and summary["import"] > args.max_import_ms:
+        print(f"\nimport app took {summary['import']:.1f} ms > {args.max_import_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
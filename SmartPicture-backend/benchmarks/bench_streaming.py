@@ -0,0 +1,116 @@
+"""
+benchmarks/bench_streaming.py
+------------------------------
+流式生成（utils/streaming.py）与缓冲式响应的首字节时间（TTFB）对比。
+
+启动一个本地 HTTP 服务（werkzeug），用假流式模型逐块产出文本：
+- buffered：等待全部片段后 build_seo_response 再整体返回（现状）
+- sse / ndjson：逐块推送，尾部 done 事件携带 SEO 封装
+
+最后模拟客户端读到几个事件后断开，校验 on_abort（退款）被调用。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_streaming.py --chunks 40 --chunk-delay 0.05
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.seo import build_seo_response  # noqa: E402
+from utils.streaming import stream_format, stream_generation, streaming_response  # noqa: E402
+
+
+def fake_stream(chunks, delay):
+    for i in range(chunks):
+        time.sleep(delay)
+        yield f"第{i}段：AI 内容策略与增长飞轮。"
+
+
+def build_app(chunks, delay, aborted):
+    app = Flask(__name__)
+
+    def seo_for(text):
+        return build_seo_response(data={"generated_text": text}, title="AI文章生成 | SmartPicture 智能洞察")
+
+    @app.post("/generate")
+    def generate():
+        data = request.get_json(force=True)
+        fmt = stream_format(request, data)
+        if fmt:
+            def on_complete(text):
+                seo = seo_for(text)
+                seo.pop("data", None)
+                return {"spent": 10, "seo": seo}
+            return streaming_response(
+                stream_generation(fake_stream(chunks, delay), on_complete, aborted.append, fmt), fmt)
+        text = "".join(fake_stream(chunks, delay))
+        return jsonify(seo_for(text))
+
+    return app
+
+
+def timed_request(port, body, headers=None):
+    """返回 (首字节耗时, 全部完成耗时, 响应体)"""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    t0 = time.perf_counter()
+    conn.request("POST", "/generate", body=json.dumps(body), headers={"Content-Type": "application/json", **(headers or {})})
+    resp = conn.getresponse()
+    first = resp.read1(1)
+    ttfb = time.perf_counter() - t0
+    rest = resp.read()
+    total = time.perf_counter() - t0
+    conn.close()
+    return ttfb, total, first + rest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="假模型每个片段的间隔（秒）")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    aborted = []
+    server = make_server("127.0.0.1", 0, build_app(args.chunks, args.chunk_delay, aborted), threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"{'mode':>9} {'TTFB(ms)':>9} {'total(ms)':>10} {'bytes':>7}")
+    for name, body, headers in [
+        ("buffered", {"prompt": "x"}, None),
+        ("sse", {"prompt": "x"}, {"Accept": "text/event-stream"}),
+        ("ndjson", {"prompt": "x", "stream": "ndjson"}, None),
+    ]:
+        ttfb, total, payload = timed_request(port, body, headers)
+        print(f"{name:>9} {ttfb * 1000:>9.1f} {total * 1000:>10.1f} {len(payload):>7}")
+        if name == "sse":
+            assert payload.decode().rstrip().split("\n\n")[-1].startswith("event: done")
+
+    # 客户端读到前几个事件后断开
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("POST", "/generate", body=json.dumps({"prompt": "x", "stream": "sse"}),
+                 headers={"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    resp.read1(64)
+    resp.close()  # 服务端未给 Content-Length，连接已交给 resp，关闭即断开套接字
+    conn.close()
+    deadline = time.time() + args.chunks * args.chunk_delay + 2
+    while not aborted and time.time() < deadline:
+        time.sleep(0.05)
+    print(f"\nclient disconnect -> on_abort called: {aborted[:1] or 'no'}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
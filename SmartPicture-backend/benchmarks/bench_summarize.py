@@ -0,0 +1,131 @@
+"""
+benchmarks/bench_summarize.py
+------------------------------
+长转写稿 map-reduce 摘要（utils/summarize.py）：用本地假模型测并发带来的加速与缓存效果。
+
+假模型的耗时 = --base-latency + 输入 token × --prefill-ms + 输出 token × --decode-ms（sleep，线程可重叠），
+输出为输入中抽取的若干句，长度约为输入的 --ratio。转写稿为 --minutes 分钟的合成中文讲话
+（约 250 字 / 分钟）。报告：
+- 单次调用直接总结全文的耗时（基线）
+- map-reduce 在不同 --concurrency 下的耗时、相对串行（并发 1）的加速比、模型调用数、reduce 层数
+- 修改一句话后重跑、原样重跑时的模型调用数与耗时（缓存命中）
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_summarize.py --minutes 60 --concurrency 1 2 4 8 16
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.summarize import CHUNK_TOKENS, REDUCE_TOKENS, SummaryCache, estimate_tokens, summarize_transcript  # noqa: E402,E501
+from utils.tts_cache import split_sentences  # noqa: E402
+
+TOPICS = ["新品发布", "渠道定价", "用户增长", "内容审核", "海外市场", "供应链", "品牌合作", "数据安全"]
+
+
+def transcript(minutes, seed):
+    rnd = random.Random(seed)
+    sentences, chars, t = [], 0, 0
+    while chars < minutes * 250:
+        topic = TOPICS[(t // 600) % len(TOPICS)]  # 每 10 分钟换一个话题
+        s = (f"[{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}] 关于{topic}，"
+             f"第{rnd.randrange(1, 40)}项指标{rnd.choice(['上升', '下降', '持平'])}了{rnd.randrange(1, 99)}%，"
+             f"{rnd.choice(['团队', '合作方', '用户'])}反馈{rnd.choice(['积极', '一般', '需要跟进'])}。")
+        sentences.append(s)
+        chars += len(s)
+        t += rnd.randint(4, 9)
+    return "\n".join(sentences)
+
+
+class FakeModel:
+    def __init__(self, base, prefill_ms, decode_ms, ratio):
+        self.base, self.prefill_ms, self.decode_ms, self.ratio = base, prefill_ms, decode_ms, ratio
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        sentences = split_sentences(prompt.split("\n\n", 1)[-1])  # 去掉提示词说明部分
+        keep = max(1, int(len(sentences) * self.ratio))
+        output = "".join(sentences[::max(1, len(sentences) // keep)][:keep])
+        if "要点" in prompt:
+            output += "\n要点：\n" + "\n".join(f"- {s}" for s in sentences[1:6])
+        time.sleep(self.base + (estimate_tokens(prompt) * self.prefill_ms + estimate_tokens(output) * self.decode_ms) / 1000)
+        with self._lock:
+            self.in_flight -= 1
+        return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--base-latency", type=float, default=0.3, help="每次调用的固定耗时（秒）")
+    parser.add_argument("--prefill-ms", type=float, default=0.05, help="每个输入 token 的耗时（毫秒）")
+    parser.add_argument("--decode-ms", type=float, default=4.0, help="每个输出 token 的耗时（毫秒）")
+    parser.add_argument("--ratio", type=float, default=0.1, help="输出长度占输入的比例")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--reduce-tokens", type=int, default=REDUCE_TOKENS, help="调小可观察多层合并")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    text = transcript(args.minutes, args.seed)
+    print(f"transcript: {args.minutes} min, {len(text):,} chars, ~{estimate_tokens(text):,} tokens\n")
+
+    model = FakeModel(args.base_latency, args.prefill_ms, args.decode_ms, args.ratio)
+    t0 = time.perf_counter()
+    model(f"请总结以下全文并列出要点：\n{text}")
+    single = time.perf_counter() - t0
+    print(f"{'run':<26} {'seconds':>8} {'speedup':>8} {'calls':>6} {'peak':>5} {'chunks':>7} {'levels':>7}")
+    print(f"{'single call (baseline)':<26} {single:>8.2f} {'':>8} {1:>6} {1:>5}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        serial = None
+        for n in args.concurrency:
+            model = FakeModel(args.base_latency, args.prefill_ms, args.decode_ms, args.ratio)
+            cache = SummaryCache(os.path.join(tmp, f"c{n}.sqlite"))
+            t0 = time.perf_counter()
+            result = summarize_transcript(text, model_fn=model, model="fake", cache=cache, max_concurrency=n,
+                                          chunk_tokens=args.chunk_tokens, min_chunk_tokens=args.chunk_tokens * 2 // 5,
+                                          reduce_tokens=args.reduce_tokens)
+            elapsed = time.perf_counter() - t0
+            serial = serial or elapsed
+            print(f"{f'map-reduce c={n}':<26} {elapsed:>8.2f} {serial / elapsed:>7.1f}x {model.calls:>6} "
+                  f"{model.peak:>5} {result['chunks']:>7} {result['levels']:>7}")
+            assert model.peak <= n, "并发超过上限"
+            assert result["summary"] and result["highlights"], result
+
+        # 在最后一个缓存上：改一句话重跑，再原样重跑
+        lines = text.split("\n")
+        lines[len(lines) // 2] = lines[len(lines) // 2].replace("反馈", "反馈（会后补充说明）")
+        edited = "\n".join(lines)
+        events = []
+        for label, body in (("edit one sentence", edited), ("identical re-run", edited)):
+            model.calls = 0
+            t0 = time.perf_counter()
+            result = summarize_transcript(body, model_fn=model, model="fake", cache=cache,
+                                          max_concurrency=args.concurrency[-1], chunk_tokens=args.chunk_tokens,
+                                          min_chunk_tokens=args.chunk_tokens * 2 // 5, reduce_tokens=args.reduce_tokens,
+                                          progress=lambda e, d: events.append(e))
+            elapsed = time.perf_counter() - t0
+            print(f"{label:<26} {elapsed:>8.2f} {'':>8} {model.calls:>6} {'':>5} {result['chunks']:>7} "
+                  f"{result['levels']:>7}  (cached calls {result['cached_calls']})")
+        assert model.calls == 0, "原样重跑不应调用模型"
+        print(f"\nprogress events in last two runs: { {e: events.count(e) for e in dict.fromkeys(events)} }")
+        print(f"highlights: {result['highlights'][:3]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+benchmarks/bench_token_cache.py
+--------------------------------
+已验证 Token 缓存的微基准：缓存关闭 / 开启时每秒验证次数。
+
+- hs256：utils/auth.py 的 jwt.decode 路径
+- rs256：Firebase ID Token 形态（RS256 + aud/iss/exp 校验），使用本地生成的
+  密钥对模拟，无需网络；需要安装 cryptography，否则跳过
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_token_cache.py --tokens 1000 --calls 200000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import jwt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.token_cache import VerifiedTokenCache  # noqa: E402
+
+PROJECT_ID = "bench-project"
+
+
+def make_hs256(n):
+    secret = "bench-secret-0123456789abcdef-0123456789"
+    tokens = [jwt.encode({"user_id": f"u{i}"}, secret, algorithm="HS256") for i in range(n)]
+    return tokens, lambda t: jwt.decode(t, secret, algorithms=["HS256"])
+
+
+def make_rs256(n):
+    try:
+        from cryptography.hazmat.primitives.asymmetric import rsa
+    except ImportError:
+        return None
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_key = private_key.public_key()
+    now = int(time.time())
+    tokens = [
+        jwt.encode({
+            "sub": f"u{i}", "aud": PROJECT_ID, "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+            "iat": now, "exp": now + 3600,
+        }, private_key, algorithm="RS256", headers={"kid": "k1"})
+        for i in range(n)
+    ]
+
+    def verify(t):
+        decoded = jwt.decode(t, public_key, algorithms=["RS256"], audience=PROJECT_ID,
+                             issuer=f"https://securetoken.google.com/{PROJECT_ID}")
+        decoded["uid"] = decoded["sub"]
+        return decoded
+
+    return tokens, verify
+
+
+def run(tokens, verifier, cache, calls, time_budget):
+    rnd = random.Random(1)
+    start = time.perf_counter()
+    done = 0
+    while done < calls and time.perf_counter() - start < time_budget:
+        cache.verify(tokens[rnd.randrange(len(tokens))], verifier)
+        done += 1
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=1000, help="活跃 Token 数量（模拟活跃用户）")
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--budget", type=float, default=5.0, help="每组的时间预算（秒）")
+    args = parser.parse_args()
+
+    print(f"{'path':>6} {'cache':>6} {'verifications/sec':>18}")
+    cases = [("hs256", make_hs256(args.tokens)), ("rs256", make_rs256(args.tokens))]
+    for name, case in cases:
+        if case is None:
+            print(f"{name:>6}  skipped (cryptography not installed)")
+            continue
+        tokens, verifier = case
+        off = VerifiedTokenCache()
+        off.enabled = False
+        rate_off = run(tokens, verifier, off, args.calls, args.budget)
+        print(f"{name:>6} {'off':>6} {rate_off:>18.0f}")
+
+        on = VerifiedTokenCache()
+        rate_on = run(tokens, verifier, on, args.calls, args.budget)
+        print(f"{name:>6} {'on':>6} {rate_on:>18.0f}   x{rate_on / rate_off:.1f}  {on.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+benchmarks/bench_tts_cache.py
+------------------------------
+TTS 分段并行合成与片段缓存（utils/tts_cache.py）测试，使用假合成器，无需网络。
+
+假合成器耗时 = 固定开销 + 每字符耗时，返回「ID3 标签 + 帧」形式的字节。
+- single request：现状，整段文本一次请求，首段音频要等全部合成完成
+- cold / warm：分段并行合成的首段音频时间（TTFA）与总耗时；再次请求全部命中缓存
+- edited：修改两句后只有附近片段重新合成
+- zipf workload：按热度分布重复请求一批文章，不同缓存容量下的命中率与淘汰次数
+并校验拼接结果（去掉后续 ID3 标签后帧顺序与文本一致）。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_tts_cache.py --sentences 120 --per-char-ms 0.4
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.tts_cache import DiskSegmentCache, iter_speech, split_segments  # noqa: E402
+
+ID3 = b"ID3\x04\x00\x00\x00\x00\x00\x10" + b"\x00" * 16
+
+
+class FakeSynthesizer:
+    def __init__(self, overhead, per_char):
+        self.overhead = overhead
+        self.per_char = per_char
+        self.calls = 0
+        self.chars = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, text, voice, audio_config):
+        with self._lock:
+            self.calls += 1
+            self.chars += len(text)
+        time.sleep(self.overhead + self.per_char * len(text))
+        return ID3 + b"FRAME[" + text.encode("utf-8") + b"]"
+
+
+def article(n, seed):
+    rnd = random.Random(seed)
+    words = "brand content strategy image insight audience story visual campaign growth".split()
+    return " ".join(" ".join(rnd.choice(words) for _ in range(rnd.randint(6, 18))).capitalize() + "."
+                    for _ in range(n))
+
+
+def timed(text, synth, cache, concurrency=8):
+    t0 = time.perf_counter()
+    first = None
+    parts = []
+    for chunk in iter_speech(text, synthesizer=synth, cache=cache, max_concurrency=concurrency, base_delay=0.01):
+        first = first if first is not None else time.perf_counter() - t0
+        parts.append(chunk)
+    audio = b"".join(parts)
+    expected = ID3 + b"".join(b"FRAME[" + s.encode() + b"]" for s in split_segments(text))
+    assert audio == expected, "concatenated audio out of order"
+    return first, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sentences", type=int, default=120)
+    parser.add_argument("--overhead-ms", type=float, default=150)
+    parser.add_argument("--per-char-ms", type=float, default=0.4)
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+    overhead, per_char = args.overhead_ms / 1000, args.per_char_ms / 1000
+
+    text = article(args.sentences, 0)
+    print(f"text: {len(text)} chars, {len(split_segments(text))} segments\n")
+    print(f"{'pass':>16} {'TTFA ms':>9} {'total ms':>9} {'calls':>6} {'hit rate':>9}")
+
+    synth = FakeSynthesizer(overhead, per_char)
+    t0 = time.perf_counter()
+    synth(text, {}, {})
+    single = (time.perf_counter() - t0) * 1000
+    print(f"{'single request':>16} {single:>9.0f} {single:>9.0f} {1:>6} {'-':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DiskSegmentCache(os.path.join(tmp, "tts"), max_bytes=64 * 1024 * 1024)
+
+        def run(name, body):
+            synth = FakeSynthesizer(overhead, per_char)
+            hits, misses = cache.hits, cache.misses
+            first, total = timed(body, synth, cache)
+            looked = cache.hits - hits + cache.misses - misses
+            print(f"{name:>16} {first * 1000:>9.0f} {total * 1000:>9.0f} {synth.calls:>6} "
+                  f"{(cache.hits - hits) / looked:>9.0%}")
+
+        run("cold", text)
+        run("warm", text)
+        sentences = text.split(". ")
+        for i in (len(sentences) // 3, 2 * len(sentences) // 3):
+            sentences[i] = "Revised " + sentences[i]
+        run("edited 2 sent.", ". ".join(sentences))
+
+        print(f"\nzipf workload: {args.requests} requests over {args.articles} articles")
+        print(f"{'cache MB':>9} {'hit rate':>9} {'calls':>7} {'evictions':>10} {'mean TTFA ms':>13}")
+        docs = [article(rnd_n, seed) for seed, rnd_n in enumerate(random.Random(1).choices(range(5, 40), k=args.articles))]
+        weights = [1 / (i + 1) for i in range(args.articles)]
+        picks = random.Random(2).choices(range(args.articles), weights=weights, k=args.requests)
+        total_bytes = sum(len(d) for d in docs) + 40 * sum(len(split_segments(d)) for d in docs)
+        for fraction in (0.1, 0.3, 1.0):
+            cache = DiskSegmentCache(os.path.join(tmp, f"zipf{fraction}"), max_bytes=int(total_bytes * fraction))
+            synth = FakeSynthesizer(overhead / 30, per_char / 30)  # 缩短耗时，只比较命中率
+            ttfa = [timed(docs[i], synth, cache)[0] for i in picks]
+            st = cache.stats()
+            print(f"{cache.max_bytes / 1e6:>9.2f} {st['hits'] / (st['hits'] + st['misses']):>9.0%} "
+                  f"{synth.calls:>7} {st['evictions']:>10} {sum(ttfa) / len(ttfa) * 1000:>13.2f}")
+            assert st["bytes"] <= cache.max_bytes
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+benchmarks/bench_tx_writer.py
+------------------------------
+用进程内 Firestore 替身对比 add_tx 的请求延迟：
+- sync：旧版每条交易记录在请求线程直接写入
+- buffered：utils/tx_writer.TransactionLogWriter 入队后由后台线程批量写入
+
+两种模式下余额都同步写入；结束时校验所有交易记录都已落库。
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/bench_tx_writer.py --latency 0.02 --requests 2000 --threads 16
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.fakes import FakeFirestore, fake_firestore_module as fs  # noqa: E402
+from utils.tx_writer import TransactionLogWriter  # noqa: E402
+
+
+def sync_add_tx(db, uid, amount, meta):
+    db.collection("transactions").add({
+        "uid": uid, "type": "earn" if amount > 0 else "spend",
+        "amount": amount, "meta": meta,
+        "createdAt": fs.SERVER_TIMESTAMP,
+    })
+    db.collection("users").document(uid).set({
+        "points": fs.Increment(amount),
+        "lastActiveAt": fs.SERVER_TIMESTAMP,
+    }, merge=True)
+
+
+def buffered_add_tx(db, writer, uid, amount, meta):
+    db.collection("users").document(uid).set({
+        "points": fs.Increment(amount),
+        "lastActiveAt": fs.SERVER_TIMESTAMP,
+    }, merge=True)
+    writer.log(uid, amount, meta)
+
+
+def run(add_tx, requests, threads, users):
+    def one(i):
+        t0 = time.perf_counter()
+        add_tx(f"u{i % users}", -5, {"module": "bench", "i": i})
+        return (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = sorted(pool.map(one, range(requests)))
+    wall = time.perf_counter() - t0
+    return wall, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def count_tx(db):
+    return sum(1 for _ in db.collection("transactions").stream())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="每次 Firestore RPC 的模拟延迟（秒）")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.2, help="缓冲写入器的刷写间隔（秒）")
+    args = parser.parse_args()
+
+    print(f"{'mode':>9} {'req/s':>9} {'p50(ms)':>9} {'p99(ms)':>9} {'tx docs':>8} {'balance ok':>11}")
+
+    db = FakeFirestore(latency=args.latency)
+    wall, p50, p99 = run(lambda u, a, m: sync_add_tx(db, u, a, m), args.requests, args.threads, args.users)
+    balance_ok = db.collection("users").document("u0").get().to_dict()["points"] == -5 * (args.requests // args.users)
+    print(f"{'sync':>9} {args.requests / wall:>9.0f} {p50:>9.2f} {p99:>9.2f} {count_tx(db):>8} {str(balance_ok):>11}")
+
+    db = FakeFirestore(latency=args.latency)
+    writer = TransactionLogWriter(db, fs=fs, flush_interval=args.interval)
+    wall, p50, p99 = run(lambda u, a, m: buffered_add_tx(db, writer, u, a, m), args.requests, args.threads, args.users)
+    # 余额同步写入：此时无需等待刷写即可读到最终余额
+    balance_ok = db.collection("users").document("u0").get().to_dict()["points"] == -5 * (args.requests // args.users)
+    writer.close()
+    stats = writer.stats()
+    print(f"{'buffered':>9} {args.requests / wall:>9.0f} {p50:>9.2f} {p99:>9.2f} {count_tx(db):>8} {str(balance_ok):>11}")
+    print(f"\nflush stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+benchmarks/fakes.py
+--------------------
+基准测试用的进程内 Firestore 替身。
+
+只实现后端实际用到的 API 子集：collection / document / get / set(merge) /
+update / add / batch / write_option(last_update_time)，以及 firestore 模块级的
+Increment、SERVER_TIMESTAMP 和 api_core 的 FailedPrecondition。每次 RPC 都会
+计数，并可按配置注入延迟，用于统计「每请求往返次数」和延迟。
+"""
+
+import copy
+import itertools
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+SERVER_TIMESTAMP = object()
+
+
+class FailedPrecondition(Exception):
+    """对应 google.api_core.exceptions.FailedPrecondition"""
+
+
+class WriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+def _resolve(old, new):
+    if isinstance(new, Increment):
+        return (old or 0) + new.value
+    if new is SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    return new
+
+
+def _apply(current, data, merge):
+    base = dict(current or {}) if merge else {}
+    for key, value in data.items():
+        base[key] = _resolve(base.get(key), value)
+    return base
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data, update_time=None):
+        self.reference = ref
+        self.id = ref.id
+        self.update_time = update_time
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocumentRef:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def get(self):
+        self._client._rpc("get")
+        with self._client._lock:
+            data = self._client._docs.get(self.path)
+            return FakeSnapshot(self, copy.deepcopy(data), self._client._times.get(self.path))
+
+    def set(self, data, merge=False):
+        batch = self._client.batch()
+        batch.set(self, data, merge=merge)
+        return batch.commit()[0]
+
+    def update(self, data, option=None):
+        batch = self._client.batch()
+        batch.update(self, data, option=option)
+        return batch.commit()[0]
+
+
+class FakeCollectionRef:
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    def document(self, doc_id=None):
+        return FakeDocumentRef(self._client, f"{self.name}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def stream(self):
+        prefix = self.name + "/"
+        for path, data in list(self._client._docs.items()):
+            if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                yield FakeSnapshot(FakeDocumentRef(self._client, path), copy.deepcopy(data), self._client._times.get(path))
+
+
+class FakeWriteBatch:
+    MAX_WRITES = 500
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append((ref.path, data, merge, None))
+
+    def update(self, ref, data, option=None):
+        self._writes.append((ref.path, data, True, option or _MUST_EXIST))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        """整批原子提交：任一前置条件不满足则全部不写入"""
+        if len(self._writes) > self.MAX_WRITES:
+            raise ValueError("maximum 500 writes allowed per request")
+        self._client._rpc("commit")
+        client = self._client
+        with client._lock:
+            for path, _, _, option in self._writes:
+                if option is _MUST_EXIST and path not in client._docs:
+                    raise FailedPrecondition(f"no document to update: {path}")
+                if isinstance(option, WriteOption) and client._times.get(path) != option.last_update_time:
+                    raise FailedPrecondition(f"update_time mismatch: {path}")
+            results = [WriteResult(client._write(path, data, merge)) for path, data, merge, _ in self._writes]
+        self._writes = []
+        return results
+
+
+_MUST_EXIST = object()
+
+
+class FakeFirestore:
+    """
+    latency: 每次 RPC 的模拟网络延迟（秒）
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.rpc_counts = {}
+        self._docs = {}
+        self._times = {}
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def _rpc(self, kind):
+        with self._lock:
+            self.rpc_counts[kind] = self.rpc_counts.get(kind, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _write(self, path, data, merge):
+        with self._lock:
+            self._docs[path] = _apply(self._docs.get(path), data, merge)
+            self._times[path] = next(self._clock)
+            return self._times[path]
+
+    @property
+    def round_trips(self):
+        return sum(self.rpc_counts.values())
+
+    def reset_counts(self):
+        self.rpc_counts = {}
+
+    def collection(self, name):
+        return FakeCollectionRef(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def write_option(self, last_update_time=None):
+        return WriteOption(last_update_time)
+
+
+# 与 google.cloud.firestore 模块同形的命名空间，可直接作为 fs 参数注入
+fake_firestore_module = SimpleNamespace(
+    Increment=Increment,
+    SERVER_TIMESTAMP=SERVER_TIMESTAMP,
+    Client=FakeFirestore,
+)
@@ -0,0 +1,405 @@
+"""
+benchmarks/loadtest.py
+-----------------------
+端到端压测：在本地启动各 Flask 应用（真实路由、真实中间层），下游全部换成
+benchmarks/standins.py 中可配置延迟与错误率的替身，按固定并发的闭环客户端
+（每个客户端一个 keep-alive 连接）驱动真实的请求组合，报告每个路由的吞吐与
+p50 / p95 / p99 延迟，并可输出 JSON 供不同提交之间对比。
+
+目标（--targets）：
+    app        app.py（积分预留、生成缓存、流式、异步任务）
+    root_main  仓库根目录 main.py
+    creative   utils/main.py（Imagen 服务）
+    services   services/ 下的蓝图与处理函数、utils/referral.py
+
+用法（在 SmartPicture-backend 目录下）：
+    python benchmarks/loadtest.py --concurrency 1 8 32 --duration 10 --json-out results.json
+    python benchmarks/loadtest.py --targets app --model-latency 0.5 --model-error-rate 0.02 \\
+        --compare baseline.json
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from werkzeug.serving import WSGIRequestHandler, make_server  # noqa: E402
+
+from benchmarks.standins import StandInConfig, install  # noqa: E402
+
+USERS = 200
+# 多媒体摘要的转写稿：约 2 万 token，切成二十多个片段（重复请求命中摘要缓存）
+TRANSCRIPTS = ["。".join(f"第{n}场发布会第{i}段讲到新品的第{i % 7}项功能与定价策略" for i in range(900))
+               for n in range(3)]
+
+
+class Step:
+    """一次请求；then(status, body) 可返回紧接着发出的下一步（例如轮询异步任务）"""
+
+    def __init__(self, route, method, path, body=None, headers=None, then=None):
+        self.route = route
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+        self.then = then
+
+
+class Target:
+    def __init__(self, name, app, mix, close=None):
+        self.name = name
+        self.app = app
+        self.mix = mix  # [(权重, rnd -> Step)]
+        self.close = close
+
+    def pick(self, rnd):
+        total = sum(w for w, _ in self.mix)
+        x = rnd.random() * total
+        for weight, make in self.mix:
+            x -= weight
+            if x <= 0:
+                return make(rnd)
+        return self.mix[-1][1](rnd)
+
+
+def zipf_prompt(rnd, pool=500):
+    """热门 prompt 反复出现（生成缓存可命中），长尾 prompt 各不相同"""
+    return f"为品牌 #{min(int(rnd.paretovariate(1.2)), pool)} 写一段 AEO 文案"
+
+
+def bearer(uid):
+    return {"Authorization": f"Bearer user:{uid}"}
+
+
+# ----------------------------------------------------------------------
+# 各应用的装配与请求组合
+# ----------------------------------------------------------------------
+def build_app_target(stand_ins, tmp):
+    from benchmarks.fakes import FailedPrecondition, fake_firestore_module
+    from utils.spending import PointsSpender
+    from utils.tx_writer import TransactionLogWriter
+    os.environ.setdefault("JOB_QUEUE", "memory")
+    os.environ.setdefault("JOB_RESULT_DIR", os.path.join(tmp, "job_results"))
+    import app as app_module
+
+    stand_ins.seed_users([f"u{i}" for i in range(USERS)], 10 ** 9)
+    db = stand_ins.firestore
+    tx_log = TransactionLogWriter(db, fs=fake_firestore_module)
+    app_module._tx_log = tx_log
+    app_module._spender = PointsSpender(db, fs=fake_firestore_module, conflict_error=FailedPrecondition,
+                                        log_writer=tx_log)
+    flask_app = app_module.create_app(prewarm="off")
+
+    def uid(rnd):
+        return f"u{rnd.randrange(USERS)}"
+
+    def poll(status, body):
+        if status != 202:
+            return None
+        job_id = json.loads(body)["job_id"]
+        return Step("GET /api/jobs/<id>?wait", "GET", f"/api/jobs/{job_id}?wait=10", headers=poll.headers)
+
+    def submit_job(rnd):
+        poll.headers = bearer(uid(rnd))
+        return Step("POST /api/jobs/generate_image", "POST", "/api/jobs/generate_image",
+                    {"prompt": zipf_prompt(rnd)}, poll.headers, then=poll)
+
+    mix = [
+        (10, lambda rnd: Step("GET /", "GET", "/")),
+        (35, lambda rnd: Step("POST /api/generate_text", "POST", "/api/generate_text",
+                              {"prompt": zipf_prompt(rnd)}, bearer(uid(rnd)))),
+        (10, lambda rnd: Step("POST /api/generate_text (sse)", "POST", "/api/generate_text",
+                              {"prompt": zipf_prompt(rnd), "stream": "sse"}, bearer(uid(rnd)))),
+        (20, lambda rnd: Step("POST /api/generate_image", "POST", "/api/generate_image",
+                              {"prompt": zipf_prompt(rnd)}, bearer(uid(rnd)))),
+        (5, submit_job),
+        (3, lambda rnd: Step("GET /api/gen_cache/stats", "GET", "/api/gen_cache/stats")),
+    ]
+
+    def close():
+        if app_module._jobs is not None:
+            app_module._jobs.stop()
+        tx_log.close()
+    return Target("app", flask_app, mix, close)
+
+
+def build_root_main_target(stand_ins, tmp):
+    spec = importlib.util.spec_from_file_location("root_main", os.path.join(ROOT, "..", "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    mix = [
+        (20, lambda rnd: Step("GET /", "GET", "/")),
+        (80, lambda rnd: Step("POST /generate-text", "POST", "/generate-text", {"prompt": zipf_prompt(rnd)})),
+    ]
+    return Target("root_main", module.app, mix)
+
+
+def build_creative_target(stand_ins, tmp):
+    from utils import main as creative_main
+    mix = [
+        (20, lambda rnd: Step("GET /", "GET", "/")),
+        (80, lambda rnd: Step("POST /generate-image", "POST", "/generate-image", {"prompt": zipf_prompt(rnd)})),
+    ]
+    return Target("creative", creative_main.app, mix)
+
+
+def build_services_target(stand_ins, tmp):
+    from flask import Flask, request
+    from utils import points
+    from utils.auth import generate_token
+    from utils.referral import referral_bp
+    from services import content_assistant, creative_studio, knowledge_base, multimedia_hub, smartpix_capture
+    from services.smart_insights import smart_insights_bp
+
+    points.LEDGER_DIR, points._ledger = os.path.join(tmp, "ledger"), None
+    knowledge_base.KB_INDEX_DIR, knowledge_base._index = os.path.join(tmp, "kb_index"), None
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite")
+    os.environ["SUMMARY_CACHE_PATH"] = os.path.join(tmp, "summaries.sqlite")
+
+    app = Flask("services")
+    for bp in (smart_insights_bp, creative_studio.creative_studio_bp, referral_bp):
+        app.register_blueprint(bp)
+    # 函数式处理器（Cloud Functions 风格，参数为 request）挂到独立路径上
+    handlers = {
+        "/multimedia/process": multimedia_hub.process_media,
+        "/content/analyze": content_assistant.analyze_image,
+        "/capture": smartpix_capture.capture,
+        "/creative/generate": creative_studio.generate_image,
+        "/kb/ingest": knowledge_base.ingest,
+        "/kb/query": knowledge_base.query,
+    }
+    for path, fn in handlers.items():
+        app.add_url_rule(path, path, (lambda fn: lambda: fn(request))(fn), methods=["POST"])
+
+    tokens = [{"Authorization": f"Bearer {generate_token(f'h{i}')}"} for i in range(USERS)]
+    points.get_ledger().apply_many([(f"h{i}", 10 ** 9) for i in range(USERS)])
+    client = app.test_client()
+    for d in range(20):
+        client.post("/kb/ingest", json={"doc_id": f"doc{d}", "text": "品牌内容策略与 AEO 优化。" * 80})
+
+    counter = iter(range(10 ** 12))
+    mix = [
+        (25, lambda rnd: Step("POST /api/generate_text", "POST", "/api/generate_text", {"prompt": zipf_prompt(rnd)})),
+        (10, lambda rnd: Step("POST /api/generate_image (bp)", "POST", "/api/generate_image",
+                              {"prompt": zipf_prompt(rnd)}, rnd.choice(tokens))),
+        (10, lambda rnd: Step("POST /api/referral", "POST", "/api/referral",
+                              {"inviter_id": f"h{rnd.randrange(USERS)}", "invitee_id": f"n{next(counter)}"})),
+        (2, lambda rnd: Step("POST /api/referral/batch", "POST", "/api/referral/batch", {"referrals": [
+            {"inviter_id": f"h{rnd.randrange(USERS)}", "invitee_id": f"b{next(counter)}"} for _ in range(500)]})),
+        (10, lambda rnd: Step("POST /kb/query", "POST", "/kb/query", {"question": zipf_prompt(rnd)})),
+        (8, lambda rnd: Step("POST /multimedia/process", "POST", "/multimedia/process",
+                             {"media_url": "gs://media/demo.mp4", "transcript": TRANSCRIPTS[rnd.randrange(3)]})),
+        (8, lambda rnd: Step("POST /content/analyze", "POST", "/content/analyze",
+                             {"image_url": "gs://media/demo.png"})),
+        (8, lambda rnd: Step("POST /capture", "POST", "/capture", {})),
+        (8, lambda rnd: Step("POST /creative/generate", "POST", "/creative/generate", {"prompt": zipf_prompt(rnd)})),
+    ]
+    return Target("services", app, mix)
+
+
+BUILDERS = {
+    "app": build_app_target,
+    "root_main": build_root_main_target,
+    "creative": build_creative_target,
+    "services": build_services_target,
+}
+
+
+# ----------------------------------------------------------------------
+# 服务与客户端
+# ----------------------------------------------------------------------
+class _KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Server:
+    def __init__(self, app):
+        self.server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=_KeepAliveHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def send(conn, step):
+    body = json.dumps(step.body).encode() if step.body is not None else None
+    headers = dict(step.headers)
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+    conn.request(step.method, step.path, body=body, headers=headers)
+    resp = conn.getresponse()
+    return resp.status, resp.read()
+
+
+def run_level(target, port, concurrency, duration, warmup, seed):
+    """闭环压测：concurrency 个客户端各自串行发请求，持续 duration 秒（前 warmup 秒不计）"""
+    records = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def client(i):
+        rnd = random.Random(seed * 10_000 + i)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        local = []
+        while time.perf_counter() < deadline:
+            step = target.pick(rnd)
+            while step is not None:
+                t0 = time.perf_counter()
+                try:
+                    status, body = send(conn, step)
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                    status, body = 0, b""
+                t1 = time.perf_counter()
+                if t0 >= measure_from and t1 <= deadline:
+                    local.append((step.route, status, t1 - t0))
+                step = step.then(status, body) if step.then else None
+        conn.close()
+        with lock:
+            records.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return records
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def summarize(target, concurrency, duration, records):
+    by_route = defaultdict(list)
+    for route, status, latency in records:
+        by_route[route].append((status, latency))
+    by_route["(all)"] = [(s, l) for _, s, l in records]
+    rows = []
+    for route, items in by_route.items():
+        latencies = sorted(l for _, l in items)
+        statuses = defaultdict(int)
+        for s, _ in items:
+            statuses[str(s)] += 1
+        errors = sum(n for s, n in statuses.items() if s == "0" or int(s) >= 500)
+        rows.append({
+            "target": target, "concurrency": concurrency, "route": route,
+            "requests": len(items), "throughput": len(items) / duration,
+            "errors": errors, "error_rate": errors / len(items) if items else 0.0,
+            "status": dict(statuses),
+            "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        })
+    rows.sort(key=lambda r: (r["route"] != "(all)", r["route"]))
+    return rows
+
+
+def print_rows(rows, baseline=None):
+    print(f"  {'route':<34} {'req':>6} {'req/s':>8} {'err%':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          + ("  Δp95     Δreq/s" if baseline else ""))
+    for r in rows:
+        line = (f"  {r['route']:<34} {r['requests']:>6} {r['throughput']:>8.1f} {r['error_rate'] * 100:>5.1f}% "
+                f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+        base = (baseline or {}).get((r["target"], r["concurrency"], r["route"]))
+        if base:
+            dp95 = (r["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0.0
+            drps = (r["throughput"] / base["throughput"] - 1) * 100 if base["throughput"] else 0.0
+            line += f"  {dp95:+6.1f}%  {drps:+6.1f}%"
+        print(line)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=list(BUILDERS), default=list(BUILDERS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10, help="每个并发级别的测量时长（秒）")
+    parser.add_argument("--warmup", type=float, default=1, help="每个级别开始时不计入结果的时长（秒）")
+    parser.add_argument("--auth-latency", type=float, default=0.002)
+    parser.add_argument("--auth-error-rate", type=float, default=0.0)
+    parser.add_argument("--firestore-latency", type=float, default=0.005)
+    parser.add_argument("--model-latency", type=float, default=0.3)
+    parser.add_argument("--model-error-rate", type=float, default=0.0)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", help="写入机器可读结果")
+    parser.add_argument("--compare", help="与之前 --json-out 的结果对比 p95 与吞吐")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    config = StandInConfig(
+        auth_latency=args.auth_latency, auth_error_rate=args.auth_error_rate,
+        firestore_latency=args.firestore_latency, model_latency=args.model_latency,
+        model_error_rate=args.model_error_rate, embed_latency=args.embed_latency, seed=args.seed,
+    )
+    stand_ins = install(config)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r["target"], r["concurrency"], r["route"]): r for r in json.load(f)["results"]}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.targets:
+            target = BUILDERS[name](stand_ins, tmp)
+            server = Server(target.app)
+            try:
+                for concurrency in args.concurrency:
+                    records = run_level(target, server.port, concurrency, args.duration, args.warmup, args.seed)
+                    rows = summarize(name, concurrency, args.duration, records)
+                    print(f"\n[{name}] concurrency={concurrency}")
+                    print_rows(rows, baseline)
+                    results.extend(rows)
+            finally:
+                server.stop()
+                if target.close:
+                    target.close()
+
+    print(f"\nstand-in calls: {json.dumps(stand_ins.stats(), ensure_ascii=False)}")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({
+                "meta": {
+                    "commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "args": vars(args), "stand_ins": config.as_dict(),
+                },
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"results written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
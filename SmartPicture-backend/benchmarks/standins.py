@@ -0,0 +1,214 @@
+"""
+benchmarks/standins.py
+-----------------------
+压测用的本地服务替身：Firebase Auth、Gemini（google.generativeai）、Imagen，
+以及 benchmarks/fakes.py 中的 Firestore。每个替身都可配置延迟与错误率，
+通过 utils/clients.py 的注册表注入，应用代码无需任何修改。
+
+    stand_ins = install(StandInConfig(model_latency=0.3, model_error_rate=0.01))
+    ...
+    stand_ins.stats()  # 各替身的调用次数与注入的错误数
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict
+
+from benchmarks.fakes import FakeFirestore
+from utils.clients import registry
+
+
+class StandInConfig:
+    """
+    auth_latency / auth_error_rate: verify_id_token
+    firestore_latency: 每次 Firestore RPC
+    model_latency / model_error_rate: Gemini 文本生成与 Imagen；延迟在 ±jitter 比例内随机
+    stream_chunks: 流式生成的片段数（总耗时仍为 model_latency）
+    embed_latency / embed_dim: embed_content
+    """
+
+    def __init__(self, auth_latency=0.002, auth_error_rate=0.0, firestore_latency=0.005,
+                 model_latency=0.3, model_error_rate=0.0, jitter=0.3, stream_chunks=8,
+                 embed_latency=0.05, embed_dim=64, seed=0):
+        self.auth_latency = auth_latency
+        self.auth_error_rate = auth_error_rate
+        self.firestore_latency = firestore_latency
+        self.model_latency = model_latency
+        self.model_error_rate = model_error_rate
+        self.jitter = jitter
+        self.stream_chunks = stream_chunks
+        self.embed_latency = embed_latency
+        self.embed_dim = embed_dim
+        self.seed = seed
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(vars(self))
+
+
+class _Counter:
+    def __init__(self, config: StandInConfig, salt: int):
+        self.config = config
+        self.calls = 0
+        self.errors = 0
+        self._rnd = random.Random(config.seed * 1000 + salt)
+        self._lock = threading.Lock()
+
+    def _tick(self, error_rate: float) -> bool:
+        """计数并决定这次调用是否注入错误"""
+        with self._lock:
+            self.calls += 1
+            fail = self._rnd.random() < error_rate
+            self.errors += fail
+            return fail
+
+    def _delay(self, base: float) -> float:
+        with self._lock:
+            return max(base * (1 + self.config.jitter * (2 * self._rnd.random() - 1)), 0.0)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "errors": self.errors}
+
+
+class FakeFirebaseAuth(_Counter):
+    """firebase_admin.auth 的子集：Token 形如 "user:<uid>"，其他值视为无效"""
+
+    def __init__(self, config):
+        super().__init__(config, 1)
+
+    def verify_id_token(self, token):
+        fail = self._tick(self.config.auth_error_rate)
+        time.sleep(self._delay(self.config.auth_latency))
+        if fail:
+            raise ValueError("auth backend unavailable")
+        if not token.startswith("user:"):
+            raise ValueError("Invalid ID token")
+        now = time.time()
+        return {"uid": token[5:], "sub": token[5:], "iat": now, "exp": now + 3600}
+
+    def revoke_refresh_tokens(self, uid):
+        pass
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    def __init__(self, backend: "FakeGenAI", name: str):
+        self.backend = backend
+        self.name = name
+
+    def _text(self, prompt):
+        return f"[{self.name}] " + " ".join(f"关于「{str(prompt)[:40]}」的第{i}段洞察。" for i in range(6))
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        b = self.backend
+        fail = b._tick(b.config.model_error_rate)
+        latency = b._delay(b.config.model_latency)
+        if not stream:
+            time.sleep(latency)
+            if fail:
+                raise RuntimeError("503 model overloaded")
+            return _FakeResponse(self._text(prompt))
+        return self._stream(self._text(prompt), latency, fail)
+
+    def _stream(self, text, latency, fail):
+        n = max(self.backend.config.stream_chunks, 1)
+        step = -(-len(text) // n)
+        for i in range(n):
+            time.sleep(latency / n)
+            if fail and i == n // 2:
+                raise RuntimeError("503 model overloaded")
+            yield _FakeResponse(text[i * step:(i + 1) * step])
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        b = self.backend
+        fail = b._tick(b.config.model_error_rate)
+        await asyncio.sleep(b._delay(b.config.model_latency))
+        if fail:
+            raise RuntimeError("503 model overloaded")
+        return _FakeResponse(self._text(prompt))
+
+
+class FakeGenAI(_Counter):
+    """google.generativeai 模块的子集：GenerativeModel / embed_content"""
+
+    def __init__(self, config):
+        super().__init__(config, 2)
+        self.embed_calls = 0
+
+    def GenerativeModel(self, name):  # noqa: N802 — 与 SDK 同名
+        return FakeGenerativeModel(self, name)
+
+    def embed_content(self, model, content):
+        texts = content if isinstance(content, list) else [content]
+        with self._lock:
+            self.embed_calls += 1
+        time.sleep(self._delay(self.config.embed_latency))
+        vectors = []
+        for text in texts:
+            digest = hashlib.sha256(f"{model}\x00{text}".encode()).digest()
+            rnd = random.Random(digest)
+            vectors.append([rnd.gauss(0, 1) for _ in range(self.config.embed_dim)])
+        return {"embedding": vectors if isinstance(content, list) else vectors[0]}
+
+    def stats(self):
+        return {**super().stats(), "embed_calls": self.embed_calls}
+
+
+class FakeImagenModel(_Counter):
+    def __init__(self, config, name):
+        super().__init__(config, 3)
+        self.name = name
+
+    def predict(self, prompt):
+        fail = self._tick(self.config.model_error_rate)
+        time.sleep(self._delay(self.config.model_latency))
+        if fail:
+            raise RuntimeError("503 model overloaded")
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:16]
+        image = SimpleNamespace(uri=f"gs://fake-imagen/{self.name}/{digest}.png")
+        return SimpleNamespace(generated_images=[image])
+
+
+class StandIns:
+    def __init__(self, config: StandInConfig):
+        self.config = config
+        self.firestore = FakeFirestore(latency=config.firestore_latency)
+        self.auth = FakeFirebaseAuth(config)
+        self.genai = FakeGenAI(config)
+        self.imagen: Dict[str, FakeImagenModel] = {}
+        self._lock = threading.Lock()
+
+    def imagen_model(self, name="imagen-3.0-pro"):
+        with self._lock:
+            if name not in self.imagen:
+                self.imagen[name] = FakeImagenModel(self.config, name)
+            return self.imagen[name]
+
+    def seed_users(self, uids, points):
+        for uid in uids:
+            self.firestore.collection("users").document(uid).set({"points": points})
+
+    def stats(self):
+        return {
+            "auth": self.auth.stats(),
+            "genai": self.genai.stats(),
+            "imagen": {n: m.stats() for n, m in self.imagen.items()},
+            "firestore_rpcs": dict(self.firestore.rpc_counts),
+        }
+
+
+def install(config: StandInConfig) -> StandIns:
+    """把替身注册进客户端注册表（替换已有实例）"""
+    stand_ins = StandIns(config)
+    registry.register("firestore", lambda: stand_ins.firestore)
+    registry.register("firebase", lambda: stand_ins.auth)
+    registry.register("genai", lambda: stand_ins.genai)
+    registry.register("imagen", stand_ins.imagen_model)
+    return stand_ins
@@ -14,6 +14,6 @@ gcloud run deploy ${SERVICE_NAME} \
   --image ${IMAGE_NAME} \
   --region ${REGION} \
   --allow-unauthenticated \
-  --set-env-vars GOOGLE_API_KEY="你的API密钥"
+  --set-env-vars GOOGLE_API_KEY="你的API密钥",TRUSTED_PROXIES=1
 
 echo "✅ 部署完成！访问 Cloud Run 查看服务。"
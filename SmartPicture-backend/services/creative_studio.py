@@ -1,27 +1,50 @@
-from utils import seo
+from utils.seo import build_seo_response
 from flask import Blueprint, request, jsonify
 from utils.auth import verify_token
-from utils.points import get_points, deduct_points
+from utils.points import deduct_points, add_points
+from utils.ai_client import generate_content
+from utils.media import store_result
+from utils.admission import RateLimited, admit
+from utils.gen_gateway import GatewayOverloaded
 
 
 creative_studio_bp = Blueprint("creative_studio", __name__)
 
+
+def _overloaded(e):
+    error = {"error": "RATE_LIMITED", "scope": e.scope} if isinstance(e, RateLimited) else {"error": "BUSY"}
+    resp = jsonify({**error, "retry_after": e.retry_after})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
+
 @creative_studio_bp.route("/api/generate_image", methods=["POST"])
 def generate_image():
     user_id = verify_token()
     if isinstance(user_id, tuple):  # 返回错误响应
         return user_id
-
-    if get_points(user_id) < 5:
-        return jsonify({"error": "积分不足，请先邀请好友或充值"}), 403
+    try:
+        admit(user_id, "/api/generate_image")
+    except RateLimited as e:
+        return _overloaded(e)
 
     data = request.get_json(force=True)
     prompt = data.get("prompt", "").strip()
     if not prompt:
         return jsonify({"error": "Missing prompt"}), 400
 
-    deduct_points(user_id, 5)
-    image = generate_content(prompt, mode="image")
+    # 检查与扣减在账本锁内原子完成；扣减成功后才生成，失败路径只退回这次扣掉的积分
+    if not deduct_points(user_id, 5):
+        return jsonify({"error": "积分不足，请先邀请好友或充值"}), 403
+    try:
+        image = store_result(generate_content(prompt, mode="image", user=user_id))
+    except GatewayOverloaded as e:
+        add_points(user_id, 5)  # 限流或网关繁忙，未生成图片，退回积分
+        return _overloaded(e)
+    except Exception as e:
+        add_points(user_id, 5)  # 生成或存储失败，退回积分
+        print(f"[Creative Studio Error] {e}")
+        return jsonify({"error": str(e)}), 502
     return jsonify({
         "message": "✅ 图片生成成功，已扣除5积分",
         "image": image
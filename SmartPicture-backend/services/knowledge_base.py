@@ -1,7 +1,79 @@
 from flask import jsonify
-from utils import seo
+from utils.seo import build_seo_response
+from utils.vector_index import VectorIndex
+from utils.embed_cache import embed_many
+import os
+import threading
 
 
+KB_INDEX_DIR = os.environ.get("KB_INDEX_DIR", os.path.join(os.path.dirname(__file__), "../data/kb_index"))
+KB_NPROBE = int(os.environ.get("KB_NPROBE", 8))
+KB_MAX_K = int(os.environ.get("KB_MAX_K", 50))
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(dim=None):
+    """懒加载知识库向量索引；首次入库时按 embedding 维度创建"""
+    global _index
+    if _index is None:
+        with _index_lock:  # 并发的首次请求只创建一个实例，避免各自打开同一目录
+            if _index is None:
+                if not dim and not os.path.exists(os.path.join(KB_INDEX_DIR, "index.json")):
+                    return None
+                _index = VectorIndex(KB_INDEX_DIR, dim=dim, dtype=os.environ.get("KB_INDEX_DTYPE", "float32"),
+                                     nprobe=KB_NPROBE)
+    return _index
+
+
+def _reset_after_fork():
+    global _index_lock
+    _index_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _embed(text):
+    from utils.gemini import embed_text  # 延迟导入：未配置 GOOGLE_API_KEY 时不影响模块加载
+    result = embed_text(text)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result["embedding"]
+
+
+def chunk_text(text, size=500, overlap=50):
+    """按字符切片（带重叠），中文文档不依赖分词"""
+    text = (text or "").strip()
+    step = max(size - overlap, 1)
+    return [text[i:i + size] for i in range(0, max(len(text) - overlap, 1), step)]
+
+
+def ingest(request):
+    data = request.get_json(force=True)
+    doc_id = data.get("doc_id", "")
+    text = data.get("text", "")
+    if not doc_id or not text:
+        return jsonify({"error": "Missing doc_id or text"}), 400
+
+    chunks = chunk_text(text)
+    try:
+        vectors = embed_many(chunks)  # 批量请求；未改动的切片命中内容哈希缓存
+    except Exception as e:
+        print(f"[KB Embed Error] {e}")
+        return jsonify({"error": f"Embedding failed: {e}"}), 502
+    index = get_index(dim=vectors.shape[1])
+    # 重新入库同一文档：先删除旧的多余切片，其余按 chunk id 覆盖
+    current = {f"{doc_id}#{i}" for i in range(len(chunks))}
+    index.delete([i for i in index.ids() if i.rsplit("#", 1)[0] == doc_id and i not in current])
+    index.add(vectors, [
+        {"id": f"{doc_id}#{i}", "doc_id": doc_id, "source": data.get("source", doc_id), "text": c}
+        for i, c in enumerate(chunks)
+    ])
+    return jsonify({"doc_id": doc_id, "chunks": len(chunks), "index": index.stats()})
+
 
 def query(request):
     data = request.get_json(force=True)
@@ -9,10 +81,38 @@ def query(request):
     if not question:
         return jsonify({"error": "Missing question"}), 400
 
+    try:
+        k = int(data["k"]) if data.get("k") is not None else 5
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be an integer"}), 400
+    if k < 1:
+        return jsonify({"error": "k must be positive"}), 400
+    k = min(k, KB_MAX_K)
+
+    index = get_index()
+    if index is None:
+        hits = []
+    else:
+        try:
+            vector = _embed(question)
+        except Exception as e:
+            print(f"[KB Embed Error] {e}")
+            return jsonify({"error": f"Embedding failed: {e}"}), 502
+        hits = index.search(vector, k=k)[0]
+    citations = [
+        {"ref": n, "id": h["id"], "source": h["source"], "score": round(h["score"], 4), "text": h["text"]}
+        for n, h in enumerate(hits, 1)
+    ]
+    if citations:
+        answer = "\n".join(f"[{c['ref']}] {c['text'][:200]}" for c in citations[:3])
+    else:
+        answer = f"知识库中暂未找到与“{question}”相关的内容。"
+
     seo_payload = build_seo_response(
-        data={"answer": f"这是针对你的问题“{question}”的智能回答。"},
+        data={"answer": answer, "citations": citations},
         title="知识库问答 | SmartPicture RAG",
         keywords=["知识检索", "AI问答", "文档理解"],
-        description=f"上传PDF与知识文件，获得带引用的精准回答：{question}"
+        description=f"上传PDF与知识文件，获得带引用的精准回答：{question}",
+        content_type="Article",
     )
     return jsonify(seo_payload)
@@ -1,19 +1,93 @@
 from flask import jsonify
-from utils import seo
+from utils.seo import build_seo_response
+from utils.streaming import format_event, stream_format, streaming_response
+from utils.summarize import TranscriptTooLarge, iter_summary
+from utils.admission import RateLimited, admit, client_key
+import os
 
 
+MEDIA_SUMMARY_CONCURRENCY = int(os.environ.get("MEDIA_SUMMARY_CONCURRENCY", 4))
+# 单次摘要的上限：转写稿字符数（约 250 字 / 分钟，默认约 13 小时）与片段数（即 map 阶段的模型调用数）
+MEDIA_MAX_TRANSCRIPT_CHARS = int(os.environ.get("MEDIA_MAX_TRANSCRIPT_CHARS", 200_000))
+MEDIA_MAX_CHUNKS = int(os.environ.get("MEDIA_MAX_CHUNKS", 300))
+
+
+def _load_transcript(data, media_url):
+    """请求体中的 transcript 优先；否则转写 gs:// 上的 WAV 音频"""
+    transcript = (data.get("transcript") or "").strip()
+    if not transcript and media_url.startswith("gs://") and media_url.lower().endswith(".wav"):
+        from utils.audio import transcribe_audio  # 延迟导入：需要 Speech-to-Text
+        transcript = transcribe_audio(media_url)
+    return transcript
+
+
+def _seo_payload(media_url, result):
+    return build_seo_response(
+        data={"media_url": media_url, **result},
+        title="AI音视频摘要 | SmartPicture 多媒体枢纽",
+        keywords=["AI摘要", "音视频处理", "内容提炼"],
+        description=f"将长视频或音频压缩为行动指南，生成高质量摘要内容。"
+    )
+
+
+def _rate_limited(e):
+    resp = jsonify({"error": "RATE_LIMITED", "scope": e.scope, "retry_after": e.retry_after})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
+
+def _too_large(message):
+    return jsonify({"error": "TRANSCRIPT_TOO_LARGE", "message": message,
+                    "max_chars": MEDIA_MAX_TRANSCRIPT_CHARS, "max_chunks": MEDIA_MAX_CHUNKS}), 413
 
 
 def process_media(request):
+    # 中文按 \uXXXX 转义时每字 6 字节，再留出其他字段的余量
+    if (request.content_length or 0) > MEDIA_MAX_TRANSCRIPT_CHARS * 6 + 4096:
+        return _too_large("request body too large")
     data = request.get_json(force=True)
     media_url = data.get("media_url", "")
     if not media_url:
         return jsonify({"error": "Missing media_url"}), 400
+    # 接口未登录，按客户端地址限流；各片段的模型调用也按该地址参与公平排队。
+    # 宿主应用需 trust_proxies 还原代理之后的地址（见 utils/admission.py）
+    client = client_key(request)
+    try:
+        admit(client, "/multimedia/process")
+    except RateLimited as e:
+        return _rate_limited(e)
+    transcript = _load_transcript(data, media_url)
+    if not transcript:
+        return jsonify({"error": "Missing transcript (only gs:// WAV audio can be transcribed)"}), 400
+    if len(transcript) > MEDIA_MAX_TRANSCRIPT_CHARS:
+        return _too_large(f"transcript has {len(transcript)} chars")
 
-    seo_payload = build_seo_response(
-        data={"summary": f"为 {media_url} 自动生成摘要与片段"},
-        title="AI音视频摘要 | SmartPicture 多媒体枢纽",
-        keywords=["AI摘要", "音视频处理", "内容提炼"],
-        description=f"将长视频或音频压缩为行动指南，生成高质量摘要内容。"
-    )
-    return jsonify(seo_payload)
+    events = iter_summary(transcript, max_concurrency=MEDIA_SUMMARY_CONCURRENCY, user=client,
+                          max_chunks=MEDIA_MAX_CHUNKS)
+    try:
+        plan = next(events)  # 先切分并检查片段数，超限时在调用模型和开始流式响应之前返回 413
+    except TranscriptTooLarge as e:
+        return _too_large(str(e))
+    fmt = stream_format(request, data)
+    if fmt:
+        # 流式：plan / chunk / reduce 进度事件，done 事件携带 SEO 封装
+        def generate():
+            try:
+                yield format_event(fmt, *plan)
+                for event, payload in events:
+                    yield format_event(fmt, event, _seo_payload(media_url, payload) if event == "done" else payload)
+            except Exception as e:
+                print(f"[Media Summary Error] {e}")
+                yield format_event(fmt, "error", {"error": str(e)})
+            finally:
+                events.close()  # 客户端断开时取消尚未开始的片段
+        return streaming_response(generate(), fmt)
+
+    try:
+        result = next(payload for event, payload in events if event == "done")
+    except RateLimited as e:
+        return _rate_limited(e)
+    except Exception as e:
+        print(f"[Media Summary Error] {e}")
+        return jsonify({"error": str(e)}), 502
+    return jsonify(_seo_payload(media_url, result))
@@ -1,40 +1,63 @@
-from flask import Blueprint, request, jsonify
-from utils.seo import build_seo_response
+from flask import Blueprint, Response, request, jsonify
+from utils.seo import build_seo_json, build_seo_response
+from utils.ai_client import cached_generate_content, stream_content
+from utils.streaming import stream_format, stream_generation, streaming_response
+from utils.gen_gateway import GatewayOverloaded
+from utils.admission import RateLimited, admit, client_key, trust_proxies
 import os
 
 
 # ✅ 定义 Flask Blueprint（推荐在 Cloud Run / Flask App 注册）
 smart_insights_bp = Blueprint("smart_insights", __name__)
 
+def _seo_meta(prompt):
+    return dict(
+        title="AI文章生成 | SmartPicture 智能洞察",
+        keywords=["AI内容生成", "AEO优化", "品牌内容中心"],
+        description=f"基于AI的内容生成工具，为品牌提供高质量AEO文章：{prompt[:60]}",
+        content_type="Article",
+    )
+
 @smart_insights_bp.route("/api/generate_text", methods=["POST"])
 def generate_text():
     """
     生成 AI 文本内容并返回带 SEO 元数据的 JSON 响应
     """
     try:
+        # 接口未登录，按客户端地址限流（宿主应用需 trust_proxies 还原代理之后的地址）
+        client = client_key(request)
+        admit(client, "/api/generate_text")
         data = request.get_json(force=True)
         prompt = (data.get("prompt") or "").strip()
 
         if not prompt:
             return jsonify({"error": "Missing prompt"}), 400
 
-        # 🧠 调用 Gemini-Pro 模型
-        model = genai.GenerativeModel("gemini-pro")
-        response = model.generate_content(prompt)
-        content = getattr(response, "text", "").strip()
+        # 🌊 流式模式：逐块推送正文，SEO 封装作为尾部事件发送
+        fmt = stream_format(request, data)
+        if fmt:
+            def on_complete(text):
+                # 正文已逐块下发，尾部只携带 SEO 封装
+                return build_seo_response(**_seo_meta(prompt))
+            return streaming_response(stream_generation(stream_content(prompt, user=client), on_complete, fmt=fmt), fmt)
+
+        # 🧠 调用 Gemini-Pro 模型（相同 prompt 命中缓存或合并为一次上游调用）
+        content, _ = cached_generate_content(prompt, mode="text", model="gemini-pro", user=client)
+        content = (content or "").strip()
 
         if not content:
             return jsonify({"error": "Model returned empty content"}), 500
 
-        # 📈 构建 SEO 响应（调用 utils.seo 模块中的函数）
-        seo_payload = build_seo_response(
-            data={"generated_text": content},
-            title="AI文章生成 | SmartPicture 智能洞察",
-            keywords=["AI内容生成", "AEO优化", "品牌内容中心"],
-            description=f"基于AI的内容生成工具，为品牌提供高质量AEO文章：{prompt[:60]}"
-        )
+        # 📈 构建 SEO 响应（直接序列化为 JSON 字节）
+        body = build_seo_json(data={"generated_text": content}, **_seo_meta(prompt))
+
+        return Response(body, status=200, mimetype="application/json")
 
-        return jsonify(seo_payload), 200
+    except GatewayOverloaded as e:
+        error = {"error": "RATE_LIMITED", "scope": e.scope} if isinstance(e, RateLimited) else {"error": "BUSY"}
+        resp = jsonify({**error, "retry_after": e.retry_after})
+        resp.headers["Retry-After"] = str(e.retry_after)
+        return resp, 429
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -44,7 +67,7 @@ def generate_text():
 if __name__ == "__main__":
     from flask import Flask
 
-    app = Flask(__name__)
+    app = trust_proxies(Flask(__name__))
     app.register_blueprint(smart_insights_bp)
 
     print("🚀 SmartInsights service running at http://127.0.0.1:8080")
@@ -1,5 +1,5 @@
 from flask import jsonify
-from utils import seo
+from utils.seo import build_seo_response
 from utils.ai_client import generate_content
 
 
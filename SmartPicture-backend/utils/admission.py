@@ -0,0 +1,366 @@
+"""
+utils/admission.py
+-------------------
+准入控制：按用户 / 路由的令牌桶 + 按模型的全局预算与加权公平排队。
+
+- admit(uid, route)：进入视图后立即检查，用户总桶（ADMISSION_USER_LIMIT）与该用户在
+  此路由上的桶（ADMISSION_ROUTE_LIMITS）都要有令牌，否则抛出 RateLimited（→ 429 + Retry-After）
+- acquire_model(model, uid)：真正调用上游前（缓存命中不消耗）按 ADMISSION_MODEL_BUDGETS
+  取模型预算；预算用尽时在该模型的公平队列里等待，按 start-time fair queuing 的开始标签
+  出队——同一用户的突发请求标签依次递增，排在其他用户的新请求之后，不会挤占别人；
+  预计等待超过 ADMISSION_MAX_WAIT 秒时立即拒绝并给出 Retry-After
+- 桶状态：默认进程内；ADMISSION_BACKEND=sqlite 时同一主机的多个 worker 共享，
+  =redis 时多实例共享（Lua 脚本原子扣减，时钟取 Redis TIME）
+
+限额格式为 "每秒令牌数:桶容量"，如 ADMISSION_USER_LIMIT=2:30、
+ADMISSION_ROUTE_LIMITS="/api/generate_image=0.5:10"、ADMISSION_MODEL_BUDGETS="gemini-pro=10:20"。
+
+未登录接口按客户端地址限流（client_key）。部署在代理之后时 remote_addr 是代理地址，
+所有匿名用户会共用一个桶：应用需调用 trust_proxies(app)，按 TRUSTED_PROXIES（可信代理层数，
+默认 0 即不信任 X-Forwarded-For；Cloud Run 为 1，App Engine flex 为 2）还原真实客户端地址。
+"""
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.gen_gateway import GatewayOverloaded
+from utils.metrics import metrics
+
+Limit = Tuple[float, float]  # (每秒令牌数, 桶容量)
+
+
+class RateLimited(GatewayOverloaded):
+    """超出限额；scope 为 user / route:<路由> / model:<模型>"""
+
+    def __init__(self, retry_after: float, scope: str):
+        super().__init__(max(1, math.ceil(retry_after)))
+        self.scope = scope
+        self.args = (f"rate limited ({scope}), retry after {self.retry_after}s",)
+
+
+# ----------------------------------------------------------------------
+# 令牌桶存储：take 成功返回 0，否则返回还需等待的秒数（不扣减）；cost 为负时归还令牌
+# ----------------------------------------------------------------------
+def _refill(tokens: float, last: float, now: float, rate: float, burst: float, cost: float) -> Tuple[float, float]:
+    tokens = min(burst, tokens + max(now - last, 0.0) * rate)
+    if tokens >= cost:
+        return min(burst, tokens - cost), 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBucketStore:
+    """进程内令牌桶；超过 max_keys 时淘汰最久未用的桶（相当于该用户的桶被重新装满）"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens, wait = _refill(tokens, last, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBucketStore:
+    """同一主机多个 worker 进程共享的令牌桶（WAL，BEGIN IMMEDIATE 串行化扣减）"""
+
+    def __init__(self, path: str):
+        from utils.jobs import _SQLite
+        self._db = _SQLite(path)
+        self._db.conn().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL)")
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        conn = self._db.conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, ts FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, wait = _refill(*(row or (burst, now)), now, rate, burst, cost)
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens, now))
+        finally:
+            conn.execute("COMMIT")
+        return wait
+
+
+_REDIS_TAKE = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+local s = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = math.min(burst, (tonumber(s[1]) or burst) + math.max(now - (tonumber(s[2]) or now), 0) * rate)
+local wait = 0
+if tokens >= cost then tokens = math.min(burst, tokens - cost) else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """多实例共享的令牌桶；需要安装 redis，桶在装满所需时间后自动过期"""
+
+    def __init__(self, url: str, prefix: str = "admission:"):
+        import redis  # 延迟导入：可选依赖
+        self.prefix = prefix
+        self._script = redis.Redis.from_url(url).register_script(_REDIS_TAKE)
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        return float(self._script(keys=[self.prefix + key], args=[rate, burst, cost]))
+
+
+# ----------------------------------------------------------------------
+# 按模型的公平队列
+# ----------------------------------------------------------------------
+class FairScheduler:
+    """
+    一个模型的全局预算（令牌桶）+ 用户间加权公平排队。
+
+    每个请求的开始标签 S = max(V, 该用户上一个请求的结束标签)，结束标签 F = S + cost / weight，
+    V 为最近出队请求的开始标签；队首（S 最小）请求取预算，取到即出队。
+    """
+
+    def __init__(self, model: str, limit: Limit, store, max_wait: float = 10.0, max_pending: int = 1000):
+        self.model = model
+        self.rate, self.burst = limit
+        self.store = store
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._heap = []  # [开始标签, 序号, cost, uid]
+        self._finish: Dict[str, float] = {}
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self._stats = {"granted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "wait_s": 0.0}
+
+    def _reject(self, retry_after: float, key: str) -> RateLimited:
+        self._stats[key] += 1
+        return RateLimited(retry_after, f"model:{self.model}")
+
+    def acquire(self, uid: str, cost: float = 1.0, weight: float = 1.0, max_wait: Optional[float] = None) -> float:
+        """取得一次调用的预算，返回排队等待的秒数；预计或实际等待超过 max_wait 时抛出 RateLimited"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        cost = min(cost, self.burst)
+        t0 = time.monotonic()
+        deadline = t0 + max_wait
+        key = f"model:{self.model}"
+        with self._cond:
+            if not self._heap and self.store.take(key, self.rate, self.burst, cost) == 0:
+                self._stats["granted"] += 1
+                return 0.0
+            start = max(self._vtime, self._finish.get(uid, 0.0))
+            ahead = sum(e[2] for e in self._heap if e[0] <= start)
+            estimate = (ahead + cost) / self.rate
+            if len(self._heap) >= self.max_pending or estimate > max_wait:
+                raise self._reject(estimate, "rejected")
+            finish = start + cost / weight
+            self._finish[uid] = finish
+            entry = [start, next(self._seq), cost, uid]
+            heapq.heappush(self._heap, entry)
+            self._stats["queued"] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    timeout = deadline - now
+                    if self._heap[0] is entry:
+                        wait = self.store.take(key, self.rate, self.burst, cost)
+                        if wait == 0:
+                            heapq.heappop(self._heap)
+                            self._vtime = start
+                            self._stats["granted"] += 1
+                            self._stats["wait_s"] += now - t0
+                            self._prune()
+                            return now - t0
+                        timeout = min(wait, timeout)
+                    if timeout <= 0:
+                        raise self._reject(max(estimate - (now - t0), 1.0), "timed_out")
+                    self._cond.wait(timeout)
+            except BaseException:
+                if entry in self._heap:
+                    self._heap.remove(entry)
+                    heapq.heapify(self._heap)
+                if self._finish.get(uid) == finish:
+                    self._finish[uid] = start  # 未被服务的请求不计入该用户的份额
+                raise
+            finally:
+                self._cond.notify_all()
+
+    def _prune(self):
+        # 结束标签不超过虚拟时间的用户已无积压，删除后行为不变
+        if len(self._finish) > 2 * len(self._heap) + 1000:
+            self._finish = {u: f for u, f in self._finish.items() if f > self._vtime}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._stats, "wait_s": round(self._stats["wait_s"], 3), "pending": len(self._heap),
+                    "rate": self.rate, "burst": self.burst}
+
+
+# ----------------------------------------------------------------------
+# 组合
+# ----------------------------------------------------------------------
+class AdmissionController:
+    """
+    store: 令牌桶存储（MemoryBucketStore / SQLiteBucketStore / RedisBucketStore）
+    user_limit: 每个用户在所有路由上的总限额；None 表示不限
+    route_limits: {路由: 限额}，按用户分别计数
+    model_budgets: {模型: 限额}，所有用户共享；未列出的模型不排队
+    weights: {uid: 权重}，公平队列中权重越大份额越大，默认 1
+    """
+
+    def __init__(self, store=None, user_limit: Optional[Limit] = (2.0, 30.0),
+                 route_limits: Optional[Dict[str, Limit]] = None,
+                 model_budgets: Optional[Dict[str, Limit]] = None,
+                 max_wait: float = 10.0, max_pending: int = 1000,
+                 weights: Optional[Dict[str, float]] = None):
+        self.store = store or MemoryBucketStore()
+        self.user_limit = user_limit
+        self.route_limits = dict(route_limits or {})
+        self.weights = dict(weights or {})
+        self.schedulers = {m: FairScheduler(m, limit, self.store, max_wait, max_pending)
+                           for m, limit in (model_budgets or {}).items()}
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "rejected_user": 0, "rejected_route": 0}
+
+    def admit(self, uid: str, route: str, cost: float = 1.0) -> None:
+        taken = []
+        try:
+            for key, limit, scope in ((f"route:{route}:{uid}", self.route_limits.get(route), f"route:{route}"),
+                                      (f"user:{uid}", self.user_limit, "user")):
+                if limit is None:
+                    continue
+                rate, burst = limit
+                wait = self.store.take(key, rate, burst, min(cost, burst))
+                if wait:
+                    with self._lock:
+                        self._stats["rejected_route" if scope != "user" else "rejected_user"] += 1
+                    raise RateLimited(wait, scope)
+                taken.append((key, rate, burst))
+        except RateLimited:
+            for key, rate, burst in taken:  # 前面的桶已扣减，拒绝时归还
+                self.store.take(key, rate, burst, -min(cost, burst))
+            raise
+        with self._lock:
+            self._stats["admitted"] += 1
+
+    def acquire_model(self, model: str, uid: Optional[str], cost: float = 1.0) -> float:
+        scheduler = self.schedulers.get(model)
+        if scheduler is None:
+            return 0.0
+        with metrics.stage("model_queue"):
+            return scheduler.acquire(uid or "anonymous", cost, self.weights.get(uid, 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        s["models"] = {m: sch.stats() for m, sch in self.schedulers.items()}
+        return s
+
+
+def parse_limit(value: str) -> Optional[Limit]:
+    """"2:30" → (2.0, 30.0)；"2" → (2.0, 2.0)；空值或 0 表示不限"""
+    if not value or value.strip() in ("0", "off"):
+        return None
+    rate, _, burst = value.partition(":")
+    return float(rate), float(burst or max(float(rate), 1.0))
+
+
+def parse_limits(value: str) -> Dict[str, Limit]:
+    """"/api/generate_image=0.5:10,/api/vision/batch_annotate=0.2:5" """
+    limits = {}
+    for item in filter(None, (s.strip() for s in (value or "").split(","))):
+        name, _, spec = item.rpartition("=")
+        limit = parse_limit(spec)
+        if name and limit:
+            limits[name] = limit
+    return limits
+
+
+def build_from_env() -> Optional[AdmissionController]:
+    if os.environ.get("ADMISSION_ENABLED", "1") == "0":
+        return None
+    backend = os.environ.get("ADMISSION_BACKEND", "memory")
+    if backend == "sqlite":
+        store = SQLiteBucketStore(os.environ.get(
+            "ADMISSION_SQLITE_PATH", os.path.join(os.path.dirname(__file__), "../data/admission.sqlite")))
+    elif backend == "redis":
+        store = RedisBucketStore(os.environ["ADMISSION_REDIS_URL"])
+    else:
+        store = MemoryBucketStore()
+    return AdmissionController(
+        store,
+        user_limit=parse_limit(os.environ.get("ADMISSION_USER_LIMIT", "2:30")),
+        route_limits=parse_limits(os.environ.get("ADMISSION_ROUTE_LIMITS", "")),
+        model_budgets=parse_limits(os.environ.get("ADMISSION_MODEL_BUDGETS", "")),
+        max_wait=float(os.environ.get("ADMISSION_MAX_WAIT", 10)),
+        max_pending=int(os.environ.get("ADMISSION_MAX_PENDING", 1000)),
+    )
+
+
+_controller = None
+_controller_ready = False
+_controller_lock = threading.Lock()
+
+
+def get_admission() -> Optional[AdmissionController]:
+    """懒加载进程内准入控制器；ADMISSION_ENABLED=0 时返回 None"""
+    global _controller, _controller_ready
+    if not _controller_ready:
+        with _controller_lock:
+            if not _controller_ready:
+                _controller, _controller_ready = build_from_env(), True
+    return _controller
+
+
+def admission_stats() -> Dict[str, Any]:
+    """stats 接口与 /metrics 用：只读取已创建的控制器，不会因为一次 GET 连接 Redis 或创建 SQLite 文件"""
+    if not _controller_ready:
+        return {"enabled": os.environ.get("ADMISSION_ENABLED", "1") != "0", "initialized": False}
+    return _controller.stats() if _controller is not None else {"enabled": False}
+
+
+def trust_proxies(app, hops: Optional[int] = None):
+    """按可信代理层数用 ProxyFix 改写 remote_addr；只取 X-Forwarded-For 右侧 hops 层，客户端伪造的前缀无效"""
+    hops = int(os.environ.get("TRUSTED_PROXIES", 0)) if hops is None else hops
+    if hops > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops)
+    return app
+
+
+def client_key(request) -> str:
+    """未登录请求的限流键（remote_addr 需已由 trust_proxies 还原）"""
+    return "ip:" + (request.remote_addr or "unknown")
+
+
+def admit(uid: str, route: str, cost: float = 1.0) -> None:
+    controller = get_admission()
+    if controller is not None:
+        controller.admit(uid, route, cost)
+
+
+def acquire_model(model: str, uid: Optional[str], cost: float = 1.0) -> float:
+    controller = get_admission()
+    return controller.acquire_model(model, uid, cost) if controller is not None else 0.0
+
+
+def _reset_after_fork():
+    # 队列的条件变量可能在 fork 时被其他线程持有，子进程重新创建
+    global _controller, _controller_ready, _controller_lock
+    _controller, _controller_ready, _controller_lock = None, False, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,104 @@
+"""
+utils/ai_client.py
+-------------------
+统一的生成入口：generate_content(prompt, mode="text" | "image")。
+文本走 utils/gemini.py，图像走 Vertex AI Imagen。
+两者都经由异步生成网关（utils/gen_gateway.py）限流执行；GEN_GATEWAY=0 时直接同步调用。
+
+图像结果为字节或 data URI 时存入媒体库（utils/media.py），缓存与返回的都是 /media/<id>。
+上游调用前按 utils/admission.py 取模型预算（user 参与公平排队），缓存命中不消耗预算。
+
+cached_generate_content 在其外层加上生成结果缓存（utils/gen_cache.py），
+缓存目录、TTL 与命中计费策略由环境变量配置：
+    GEN_CACHE_DIR / GEN_CACHE_TTL / GEN_CACHE_MAX_ENTRIES
+    GEN_CACHE_BILLING=full|discount|free / GEN_CACHE_DISCOUNT
+"""
+
+import os
+from typing import Optional, Tuple
+
+from utils.gen_cache import GenerationCache, cache_key
+from utils.gen_gateway import gateway
+from utils.admission import acquire_model
+from utils.media import store_result
+from utils.clients import registry
+from utils.metrics import timed
+
+DEFAULT_MODELS = {"text": "gemini-pro", "image": "imagen-3.0-pro"}
+DEFAULT_TEMPERATURE = 0.7
+
+GATEWAY_ENABLED = os.environ.get("GEN_GATEWAY", "1") != "0"
+GATEWAY_TIMEOUT = float(os.environ.get("GEN_GATEWAY_TIMEOUT", 120))
+
+generation_cache = GenerationCache(
+    max_entries=int(os.environ.get("GEN_CACHE_MAX_ENTRIES", 2048)),
+    ttl=float(os.environ.get("GEN_CACHE_TTL", 24 * 3600)),
+    disk_dir=os.environ.get("GEN_CACHE_DIR") or None,
+    billing=os.environ.get("GEN_CACHE_BILLING", "full"),
+    discount=float(os.environ.get("GEN_CACHE_DISCOUNT", 0.5)),
+)
+
+
+def _generate_image(prompt: str, model: str):
+    """返回图片 URI；未配置输出存储桶时 Imagen 直接返回图片字节"""
+    image = registry.get("imagen", model).predict(prompt).generated_images[0]
+    return getattr(image, "uri", None) or getattr(image, "_image_bytes", None)
+
+
+@timed("generate_content")
+def generate_content(prompt: str, mode: str = "text", model: Optional[str] = None,
+                     temperature: float = DEFAULT_TEMPERATURE, disconnected=None,
+                     user: Optional[str] = None) -> str:
+    """
+    调用上游模型：文本返回生成内容，图像返回图片 URL。
+    网关排队已满或模型预算用尽时抛出 GatewayOverloaded（RateLimited），由调用方返回 429。
+    """
+    model = model or DEFAULT_MODELS[mode]
+    acquire_model(model, user)
+    if mode == "image":
+        if not GATEWAY_ENABLED:
+            return _generate_image(prompt, model)
+        return gateway.call(_generate_image, prompt, model, model=model,
+                            timeout=GATEWAY_TIMEOUT, disconnected=disconnected)
+
+    # 延迟导入：缺少 GOOGLE_API_KEY 时不影响其他模块
+    from utils.gemini import generate_text, generate_text_async
+    if GATEWAY_ENABLED:
+        result = gateway.call(generate_text_async, prompt, model=model, temperature=temperature,
+                              timeout=GATEWAY_TIMEOUT, disconnected=disconnected)
+    else:
+        result = generate_text(prompt, model=model, temperature=temperature)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result["generated_text"]
+
+
+def stream_content(prompt: str, model: Optional[str] = None, temperature: float = DEFAULT_TEMPERATURE,
+                   user: Optional[str] = None):
+    """流式文本生成，逐块 yield 文本片段；模型预算在返回前取得，超限时立即抛出 RateLimited"""
+    from utils.gemini import stream_text  # 延迟导入
+    model = model or DEFAULT_MODELS["text"]
+    acquire_model(model, user)
+    return stream_text(prompt, model=model, temperature=temperature)
+
+
+def generation_key(prompt: str, mode: str = "text", model: Optional[str] = None,
+                   temperature: float = DEFAULT_TEMPERATURE) -> str:
+    return cache_key(prompt, mode, model or DEFAULT_MODELS[mode], temperature)
+
+
+def cached_generate_content(prompt: str, mode: str = "text", model: Optional[str] = None,
+                            temperature: float = DEFAULT_TEMPERATURE, user: Optional[str] = None,
+                            disconnected=None) -> Tuple[str, str]:
+    """
+    返回 (结果, 来源)；来源为 memory / disk / miss / coalesced。
+    相同规范化 prompt 的并发请求只会触发一次上游调用。
+    disconnected() 返回 True 时取消上游调用并抛出 ConnectionAbortedError（见 gen_gateway.client_disconnected）。
+    """
+    key = generation_key(prompt, mode, model, temperature)
+
+    def generate():
+        result = generate_content(prompt, mode=mode, model=model, temperature=temperature, user=user,
+                                  disconnected=disconnected)
+        return store_result(result) if mode == "image" else result
+    return generation_cache.get_or_generate(key, generate)
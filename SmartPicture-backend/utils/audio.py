@@ -1,19 +1,136 @@
+from utils.clients import registry
+
 def transcribe_audio(gcs_uri: str):
+    """转写 gs:// 上的 LINEAR16 WAV；超过 1 分钟的音频自动分段并行转写"""
+    return transcribe_long(gcs_uri)["text"]
+
+def synthesize_speech(text: str, voice_name="en-US-Wavenet-D"):
+    """返回 MP3 字节；长文本分段并行合成，已合成过的片段直接读缓存（见 utils/tts_cache.py）"""
+    from utils.tts_cache import synthesize_long
+    return synthesize_long(text, voice_name=voice_name)
+
+
+# === 长音频分段并行转写 ===
+# 同步 recognize 只接受约 1 分钟以内的音频，且整段串行处理。长音频先在静音处切成
+# 带少量重叠的片段，各片段并行转写（有界并发、失败重试），再按时间戳拼接并去掉重叠部分。
+# 输入为 LINEAR16 单声道 WAV（本地路径、字节或 gs:// URI）。
+MAX_SEGMENT_S = 55.0   # 单段上限，低于 recognize 的 60 秒限制
+SEARCH_WINDOW_S = 10.0  # 在目标切点之前多长范围内寻找最安静的位置
+OVERLAP_S = 1.0         # 相邻片段两侧各多带的音频，避免切点处的词被截断
+FRAME_MS = 30
+
+def load_wav(source):
+    """返回 (int16 样本数组, 采样率)；source 可以是 WAV 字节、本地路径或 gs:// URI"""
+    import io
+    import wave
+    import numpy as np
+    if isinstance(source, str) and source.startswith("gs://"):
+        bucket, _, name = source[len("gs://"):].partition("/")
+        from utils.storage import get_bucket
+        source = get_bucket(bucket).blob(name).download_as_bytes()
+    with wave.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError("only 16-bit PCM WAV is supported")
+        frames = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+        channels, rate = w.getnchannels(), w.getframerate()
+    if channels > 1:
+        frames = frames.reshape(-1, channels).mean(axis=1).astype("<i2")
+    return frames, rate
+
+def plan_segments(samples, sample_rate, max_segment_s=MAX_SEGMENT_S, window_s=SEARCH_WINDOW_S,
+                  overlap_s=OVERLAP_S, frame_ms=FRAME_MS):
+    """
+    在静音处切分：每个目标切点之前 window_s 秒内取能量最低的帧作为边界。
+    返回 [{"index", "start", "end", "core_start", "core_end"}]（单位：样本），
+    core 为该片段独占的区间（互不重叠、首尾相接），start/end 为实际送去转写的区间（含重叠）。
+    """
+    import numpy as np
+    total = len(samples)
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    usable = total // frame * frame
+    energy = np.sqrt(np.mean(samples[:usable].astype(np.float32).reshape(-1, frame) ** 2, axis=1)) \
+        if usable else np.zeros(0, dtype=np.float32)
+    max_len = max(int(max_segment_s * sample_rate) - 2 * int(overlap_s * sample_rate), frame)
+    window = int(window_s * sample_rate)
+    overlap = int(overlap_s * sample_rate)
+
+    bounds = [0]
+    while total - bounds[-1] > max_len:
+        hi = bounds[-1] + max_len
+        lo = max(hi - window, bounds[-1] + frame)
+        f_lo, f_hi = lo // frame, min(hi // frame, len(energy))
+        cut = (f_lo + int(np.argmin(energy[f_lo:f_hi]))) * frame if f_hi > f_lo else hi
+        bounds.append(cut)
+    bounds.append(total)
+    return [
+        {"index": i, "core_start": a, "core_end": b,
+         "start": max(a - overlap, 0), "end": min(b + overlap, total)}
+        for i, (a, b) in enumerate(zip(bounds, bounds[1:]))
+    ]
+
+def speech_backend(pcm: bytes, sample_rate: int, language_code: str = "en-US"):
+    """默认转写后端：同步 recognize（带词级时间戳）。返回 [{"word", "start", "end"}]，时间相对片段起点（秒）"""
     from google.cloud import speech  # 延迟导入
-    client = speech.SpeechClient()
-    audio = speech.RecognitionAudio(uri=gcs_uri)
+    client = registry.get("speech")
     config = speech.RecognitionConfig(
         encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-        language_code="en-US",
+        sample_rate_hertz=sample_rate,
+        language_code=language_code,
+        enable_word_time_offsets=True,
+        enable_automatic_punctuation=True,
     )
-    response = client.recognize(config=config, audio=audio)
-    return " ".join([r.alternatives[0].transcript for r in response.results])
+    response = client.recognize(config=config, audio=speech.RecognitionAudio(content=pcm))
+    return [
+        {"word": w.word, "start": w.start_time.total_seconds(), "end": w.end_time.total_seconds()}
+        for r in response.results if r.alternatives for w in r.alternatives[0].words
+    ]
 
-def synthesize_speech(text: str, voice_name="en-US-Wavenet-D"):
-    from google.cloud import texttospeech  # 延迟导入
-    client = texttospeech.TextToSpeechClient()
-    input_text = texttospeech.SynthesisInput(text=text)
-    voice = texttospeech.VoiceSelectionParams(language_code="en-US", name=voice_name)
-    audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-    response = client.synthesize_speech(input=input_text, voice=voice, audio_config=audio_config)
-    return response.audio_content
+def _owned_words(seg, words, sample_rate):
+    """换算为绝对时间，只保留中点落在本片段独占区间内的词（重叠部分由相邻片段之一负责）"""
+    offset = seg["start"] / sample_rate
+    lo, hi = seg["core_start"] / sample_rate, seg["core_end"] / sample_rate
+    kept = []
+    for w in words:
+        start, end = w["start"] + offset, w["end"] + offset
+        if lo <= (start + end) / 2 < hi:
+            kept.append({"word": w["word"], "start": round(start, 3), "end": round(end, 3)})
+    return kept
+
+def iter_transcript(source, backend=None, language_code="en-US", max_concurrency=8, max_retries=3,
+                    base_delay=1.0, **plan_kw):
+    """
+    分段并行转写，按时间顺序逐段产出部分结果（前面的片段完成后立即产出，不等待全部结束）：
+        {"index", "total", "start", "end", "text", "words"}（时间单位：秒）
+    backend(pcm_bytes, sample_rate, language_code) 返回词级时间戳列表，默认 speech_backend；
+    可注入本地实现用于测试。单段失败按指数退避重试，超过次数后抛出异常。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.embed_cache import _with_retry
+    backend = backend or speech_backend
+    samples, rate = load_wav(source) if not isinstance(source, tuple) else source
+    segments = plan_segments(samples, rate, **plan_kw)
+
+    def run(seg):
+        pcm = samples[seg["start"]:seg["end"]].astype("<i2", copy=False).tobytes()
+        words = _with_retry(lambda: backend(pcm, rate, language_code), max_retries, base_delay, "Transcribe")
+        return _owned_words(seg, words, rate)
+
+    with ThreadPoolExecutor(max(min(max_concurrency, len(segments)), 1)) as pool:
+        futures = [pool.submit(run, seg) for seg in segments]
+        try:
+            for seg, future in zip(segments, futures):
+                words = future.result()
+                yield {
+                    "index": seg["index"], "total": len(segments),
+                    "start": round(seg["core_start"] / rate, 3), "end": round(seg["core_end"] / rate, 3),
+                    "text": " ".join(w["word"] for w in words), "words": words,
+                }
+        finally:
+            for f in futures:  # 调用方提前停止或出错时取消尚未开始的片段
+                f.cancel()
+
+def transcribe_long(source, **kw):
+    """完整转写：{"text", "segments", "words"}"""
+    segments = list(iter_transcript(source, **kw))
+    words = [w for s in segments for w in s["words"]]
+    return {"text": " ".join(w["word"] for w in words), "segments": segments, "words": words}
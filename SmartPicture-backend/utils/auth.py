@@ -1,6 +1,8 @@
 import jwt
 import os
 from flask import request, jsonify
+from utils.token_cache import token_cache
+from utils.metrics import timed
 
 SECRET_KEY = os.environ.get("JWT_SECRET", "supersecret")
 
@@ -8,6 +10,10 @@ def generate_token(user_id):
     """生成用户登录 Token"""
     return jwt.encode({"user_id": user_id}, SECRET_KEY, algorithm="HS256")
 
+def _decode(token):
+    return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+
+@timed("verify_token")
 def verify_token():
     """验证请求头中的 Authorization"""
     auth_header = request.headers.get("Authorization", "")
@@ -16,7 +22,7 @@ def verify_token():
 
     token = auth_header.split(" ")[1]
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        payload = token_cache.verify(token, _decode, namespace="hs256")
         return payload["user_id"]
     except Exception:
         return jsonify({"error": "Token 无效"}), 401
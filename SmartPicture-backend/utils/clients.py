@@ -0,0 +1,189 @@
+"""
+utils/clients.py
+-----------------
+进程级 Google 客户端 / 模型句柄注册表。
+
+Firestore、Firebase Auth、Gemini（google.generativeai）、Vision、Speech、
+Text-to-Speech、Storage 客户端以及 Imagen 模型句柄在首次使用时才导入 SDK 并创建
+（懒加载），之后在整个进程内复用，避免冷启动时的重型导入，以及每次调用都重新做
+凭据发现、gRPC 通道建立与 TLS 握手。
+
+- 线程安全：双重检查加锁，同一句柄只会构造一次
+- fork 安全：gRPC 通道不能跨 fork 使用，gunicorn --preload 后子进程会丢弃
+  父进程创建的实例并重新懒加载
+- 可选预热：CLIENT_WARMUP="firestore,firebase,vision" 时在启动阶段提前构造
+"""
+
+import inspect
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+class ClientRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Callable[..., Any]] = {}
+        self._fills: Dict[str, Dict[int, Tuple[Any, ...]]] = {}
+        self._instances: Dict[Tuple[Hashable, ...], Any] = {}
+        self._locks: Dict[Tuple[Hashable, ...], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.constructions: Dict[str, int] = {}
+
+    def register(self, name: str, factory: Callable[..., Any]) -> None:
+        """注册工厂函数；已存在的实例会被丢弃，下次 get 时用新工厂创建"""
+        fills = _default_fills(factory)
+        with self._lock:
+            self._factories[name] = factory
+            self._fills[name] = fills
+            for key in [k for k in self._instances if k[0] == name]:
+                del self._instances[key]
+
+    def get(self, name: str, *args: Hashable) -> Any:
+        """获取（必要时创建）实例；args 用于区分同一工厂的不同句柄，例如模型名"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        fills = self._fills.get(name)
+        # 缓存键按工厂参数补齐默认值：get("imagen") 与 get("imagen", "imagen-3.0-pro") 共用同一句柄
+        key = (name, *args, *fills[len(args)]) if fills and len(args) in fills else (name, *args)
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            factory = self._factories.get(name)
+            if factory is None:
+                raise KeyError(f"No client factory registered for '{name}'")
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        # 每个键单独加锁：构造慢的客户端不会阻塞其他客户端的获取
+        with key_lock:
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = factory(*args)
+                self._instances[key] = instance
+                self.constructions[name] = self.constructions.get(name, 0) + 1
+        return instance
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """提前构造客户端；返回每个客户端的结果（ok 或错误信息），失败不影响启动"""
+        results = {}
+        for name in names if names is not None else list(self._factories):
+            try:
+                self.get(name)
+                results[name] = "ok"
+            except Exception as e:
+                print(f"[Client Warmup Error] {name}: {e}")
+                results[name] = str(e)
+        return results
+
+    def warm_up_from_env(self, var: str = "CLIENT_WARMUP") -> Dict[str, str]:
+        names = [n.strip() for n in os.environ.get(var, "").split(",") if n.strip()]
+        return self.warm_up(names) if names else {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._instances.clear()
+            self._locks.clear()
+
+    def _after_fork(self):
+        # 子进程中父进程的锁状态与 gRPC 通道都不可用，全部重建
+        self._lock = threading.Lock()
+        self._instances = {}
+        self._locks = {}
+        self._pid = os.getpid()
+
+
+def _default_fills(factory: Callable[..., Any]) -> Dict[int, Tuple[Any, ...]]:
+    """{已传位置参数个数: 需补齐的默认值}；含 *args / 仅关键字参数的工厂不补齐"""
+    try:
+        params = list(inspect.signature(factory).parameters.values())
+    except (TypeError, ValueError):
+        return {}
+    if any(p.kind not in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params):
+        return {}
+    fills = {}
+    for n in range(len(params) - 1, -1, -1):
+        if params[n].default is inspect.Parameter.empty:
+            break
+        fills[n] = tuple(p.default for p in params[n:])
+    return fills
+
+
+# ----------------------------------------------------------------------
+# 默认工厂（SDK 均延迟导入）
+# ----------------------------------------------------------------------
+def _firestore_client():
+    from google.cloud import firestore
+    return firestore.Client()
+
+
+def _firebase_auth():
+    import firebase_admin
+    from firebase_admin import auth
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app()
+    return auth
+
+
+def _genai():
+    import google.generativeai as genai
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        raise EnvironmentError("❌ GOOGLE_API_KEY 未设置，请在 Cloud Run 或本地环境中配置。")
+    genai.configure(api_key=api_key)
+    return genai
+
+
+def _vision_client():
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient()
+
+
+def _speech_client():
+    from google.cloud import speech
+    return speech.SpeechClient()
+
+
+def _tts_client():
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient()
+
+
+def _storage_client():
+    from google.cloud import storage
+    return storage.Client()
+
+
+def _pubsub_publisher():
+    from google.cloud import pubsub_v1
+    return pubsub_v1.PublisherClient()
+
+
+def _pubsub_subscriber():
+    from google.cloud import pubsub_v1
+    return pubsub_v1.SubscriberClient()
+
+
+def _imagen_model(model_name: str = "imagen-3.0-pro"):
+    from google.cloud import aiplatform
+    aiplatform.init(
+        project=os.getenv("PROJECT_ID", "alert-autumn-467806-j3"),
+        location=os.getenv("REGION", "us-central1"),
+    )
+    return aiplatform.ImageGenerationModel.from_pretrained(model_name)
+
+
+registry = ClientRegistry()
+registry.register("firestore", _firestore_client)
+registry.register("firebase", _firebase_auth)
+registry.register("genai", _genai)
+registry.register("vision", _vision_client)
+registry.register("speech", _speech_client)
+registry.register("tts", _tts_client)
+registry.register("storage", _storage_client)
+registry.register("pubsub_publisher", _pubsub_publisher)
+registry.register("pubsub_subscriber", _pubsub_subscriber)
+registry.register("imagen", _imagen_model)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry._after_fork)
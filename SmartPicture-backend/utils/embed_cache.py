@@ -0,0 +1,161 @@
+"""
+utils/embed_cache.py
+---------------------
+批量 embedding 与内容寻址缓存。
+
+- 键：SHA-256(模型名 + 文本)，同一段文本在同一模型下只向上游请求一次
+- 存储：SQLite（WAL），向量以 float32 小端字节串存为 BLOB，跨进程、跨重启复用
+- 批量：去重后只把未命中的文本按上游单次上限（Gemini 为 100 条）切批，
+  多批在线程池中并行请求
+- 重试：单批失败按指数退避 + 抖动重试，超过次数后抛出最后一次异常
+
+文档重新入库时，未改动的切片全部命中缓存，不再产生上游调用。
+"""
+
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_MODEL = "textembedding-gecko@003"
+MAX_BATCH = 100  # batchEmbedContents 单次上限
+
+_SQL_CHUNK = 500  # 单条 SELECT ... IN (...) 的参数个数，低于 SQLite 变量上限
+
+
+def content_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    path: SQLite 文件路径
+    每个线程使用独立连接；WAL 模式下读写互不阻塞，多个 worker 可共享同一文件。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL,"
+                " vec BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        conn = self._conn()
+        for s in range(0, len(keys), _SQL_CHUNK):
+            part = keys[s:s + _SQL_CHUNK]
+            rows = conn.execute(
+                f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype="<f4")
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]) -> None:
+        now = time.time()
+        rows = []
+        for key, vec in items.items():
+            arr = np.asarray(vec, dtype="<f4")
+            rows.append((key, model, len(arr), arr.tobytes(), now))
+        with self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+
+    def stats(self) -> Dict[str, int]:
+        count = self._conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"entries": count, "hits": self.hits, "misses": self.misses}
+
+
+def _with_retry(fn: Callable, max_retries: int, base_delay: float, label: str = "Embedding"):
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(base_delay * 2 ** attempt, 10.0) * (0.5 + random.random())
+            print(f"[{label} Retry] attempt {attempt + 1}: {e}; retry in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def embed_many(
+    texts: Sequence[str],
+    model: str = DEFAULT_MODEL,
+    embedder: Optional[Callable[[List[str], str], List[Sequence[float]]]] = None,
+    cache: Optional[EmbeddingCache] = None,
+    batch_size: int = MAX_BATCH,
+    max_concurrency: int = 4,
+    max_retries: int = 4,
+    base_delay: float = 0.5,
+) -> np.ndarray:
+    """
+    批量生成 embedding，返回 (len(texts), dim) 的 float32 矩阵，行顺序与输入一致。
+    embedder(texts, model) 返回同样顺序的向量列表；默认调用 utils.gemini.embed_texts。
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    if embedder is None:
+        from utils.gemini import embed_texts as embedder  # 延迟导入：需要 GOOGLE_API_KEY
+    cache = cache if cache is not None else get_embedding_cache()
+
+    keys = [content_key(t, model) for t in texts]
+    unique = dict(zip(keys, texts))  # 输入中重复的文本只请求一次
+    found = cache.get_many(list(unique))
+    missing = [k for k in unique if k not in found]
+
+    def run(batch_keys):
+        vectors = _with_retry(lambda: embedder([unique[k] for k in batch_keys], model), max_retries, base_delay)
+        if len(vectors) != len(batch_keys):
+            raise RuntimeError(f"embedder returned {len(vectors)} vectors for {len(batch_keys)} texts")
+        fresh = dict(zip(batch_keys, vectors))
+        cache.put_many(model, fresh)  # 每批完成即落盘，中途失败时已完成的批次不会重复付费
+        return fresh
+
+    batches = [missing[s:s + batch_size] for s in range(0, len(missing), batch_size)]
+    if len(batches) == 1:
+        found.update((k, np.asarray(v, dtype=np.float32)) for k, v in run(batches[0]).items())
+    elif batches:
+        with ThreadPoolExecutor(min(max_concurrency, len(batches))) as pool:
+            for fresh in pool.map(run, batches):
+                found.update((k, np.asarray(v, dtype=np.float32)) for k, v in fresh.items())
+
+    return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """懒加载默认缓存（EMBED_CACHE_PATH，默认 data/embeddings.sqlite）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(os.environ.get(
+                "EMBED_CACHE_PATH", os.path.join(os.path.dirname(__file__), "../data/embeddings.sqlite")))
+        return _cache
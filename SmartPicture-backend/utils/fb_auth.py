@@ -1,12 +1,54 @@
-import firebase_admin
-from firebase_admin import auth, credentials
+import os
+from utils.clients import registry
+from utils.metrics import timed
+from utils.token_cache import token_cache, SigningKeyCache, fetch_google_certs
 
-if not firebase_admin._apps:
-    firebase_admin.initialize_app()
+# firebase_admin 在首次验证时才导入并 initialize_app（registry "firebase"），
+# 导入本模块不触发网络或凭据发现
 
+# FIREBASE_LOCAL_VERIFY=1 时用缓存的 Google 公钥在本地验证签名，
+# 否则交给 firebase_admin（其内部同样会缓存证书）
+PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
+LOCAL_VERIFY = os.environ.get("FIREBASE_LOCAL_VERIFY") == "1" and bool(PROJECT_ID)
+signing_keys = SigningKeyCache(fetch_google_certs)
+
+def warm_up():
+    """预热：初始化 firebase_admin，本地验证模式下启动公钥刷新线程"""
+    if LOCAL_VERIFY:
+        signing_keys.start()
+    else:
+        registry.get("firebase")
+
+def _verify_locally(token: str) -> dict:
+    """与 firebase_admin 相同的校验项：RS256 签名、aud、iss、exp、iat、sub"""
+    import jwt
+    signing_keys.start()  # 已在运行时为空操作；fork 后的子进程在这里重启刷新线程
+    key = signing_keys.get(jwt.get_unverified_header(token).get("kid"))
+    if key is None:
+        raise ValueError("Unknown signing key")
+    decoded = jwt.decode(
+        token, key, algorithms=["RS256"],
+        audience=PROJECT_ID,
+        issuer=f"https://securetoken.google.com/{PROJECT_ID}",
+        options={"require": ["exp", "iat", "sub"]},
+    )
+    if not decoded.get("sub") or len(decoded["sub"]) > 128:
+        raise ValueError("Invalid sub claim")
+    decoded["uid"] = decoded["sub"]
+    return decoded
+
+def _verify(token: str) -> dict:
+    return _verify_locally(token) if LOCAL_VERIFY else registry.get("firebase").verify_id_token(token)
+
+@timed("verify_token")
 def verify_token(authorization_header: str):
     if not authorization_header or not authorization_header.startswith("Bearer "):
         raise ValueError("Missing Authorization")
     token = authorization_header.split(" ")[1]
-    decoded = auth.verify_id_token(token)
+    decoded = token_cache.verify(token, _verify, namespace="firebase")
     return decoded["uid"]
+
+def revoke_user(uid: str):
+    """撤销用户的刷新令牌，并清除本进程中该用户的已验证 Token 缓存"""
+    registry.get("firebase").revoke_refresh_tokens(uid)
+    token_cache.revoke(uid)
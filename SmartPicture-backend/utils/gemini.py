@@ -5,16 +5,16 @@ utils/gemini.py
 支持多类型任务：文本生成、图像分析、文本嵌入等。
 """
 
-import os
-import google.generativeai as genai
 from flask import jsonify
+from utils.clients import registry
 
-# 初始化 Gemini API
-API_KEY = os.environ.get("GOOGLE_API_KEY")
-if not API_KEY:
-    raise EnvironmentError("❌ GOOGLE_API_KEY 未设置，请在 Cloud Run 或本地环境中配置。")
 
-genai.configure(api_key=API_KEY)
+def _genai():
+    """
+    首次调用时才导入并配置 google.generativeai（见 utils/clients.py）。
+    缺少 GOOGLE_API_KEY 时在调用处抛出 EnvironmentError，而不是导入本模块时。
+    """
+    return registry.get("genai")
 
 
 def generate_text(prompt: str, model: str = "gemini-pro", temperature: float = 0.7) -> dict:
@@ -25,7 +25,7 @@ def generate_text(prompt: str, model: str = "gemini-pro", temperature: float = 0
         return {"error": "Prompt 不能为空"}
 
     try:
-        model_instance = genai.GenerativeModel(model)
+        model_instance = _genai().GenerativeModel(model)
         response = model_instance.generate_content(prompt, generation_config={"temperature": temperature})
         return {"generated_text": response.text.strip()}
     except Exception as e:
@@ -33,6 +33,38 @@ def generate_text(prompt: str, model: str = "gemini-pro", temperature: float = 0
         return {"error": str(e)}
 
 
+async def generate_text_async(prompt: str, model: str = "gemini-pro", temperature: float = 0.7) -> dict:
+    """
+    generate_text 的异步版本，供 utils/gen_gateway.py 在事件循环上调用
+    """
+    if not prompt.strip():
+        return {"error": "Prompt 不能为空"}
+
+    try:
+        model_instance = _genai().GenerativeModel(model)
+        response = await model_instance.generate_content_async(prompt, generation_config={"temperature": temperature})
+        return {"generated_text": response.text.strip()}
+    except Exception as e:
+        print(f"[Gemini Text Error] {e}")
+        return {"error": str(e)}
+
+
+def stream_text(prompt: str, model: str = "gemini-pro", temperature: float = 0.7):
+    """
+    流式生成：generate_content(stream=True)，逐块 yield 文本片段。
+    出错时直接抛出异常，由调用方决定如何通知客户端。
+    """
+    if not prompt.strip():
+        raise ValueError("Prompt 不能为空")
+
+    model_instance = _genai().GenerativeModel(model)
+    response = model_instance.generate_content(prompt, generation_config={"temperature": temperature}, stream=True)
+    for chunk in response:
+        text = getattr(chunk, "text", "")
+        if text:
+            yield text
+
+
 def analyze_image(image_base64: str, prompt: str = "Describe this image") -> dict:
     """
     使用 Gemini Pro Vision 分析图像
@@ -42,7 +74,7 @@ def analyze_image(image_base64: str, prompt: str = "Describe this image") -> dic
         return {"error": "缺少图像输入"}
 
     try:
-        model_instance = genai.GenerativeModel("gemini-pro-vision")
+        model_instance = _genai().GenerativeModel("gemini-pro-vision")
         response = model_instance.generate_content([prompt, {"mime_type": "image/png", "data": image_base64}])
         return {"analysis": response.text.strip()}
     except Exception as e:
@@ -54,19 +86,29 @@ def embed_text(text: str, model: str = "textembedding-gecko@003") -> dict:
     """
     使用 Gemini Text Embedding 模型生成语义向量。
     可用于 RAG（检索增强生成）或相似度搜索。
+    结果按内容哈希缓存（utils/embed_cache.py），相同文本不会重复请求。
     """
     if not text.strip():
         return {"error": "文本不能为空"}
 
     try:
-        embed = genai.embed_content(model=model, content=text)
-        vector = embed["embedding"]
+        from utils.embed_cache import embed_many
+        vector = embed_many([text], model=model)[0].tolist()
         return {"embedding": vector, "dimension": len(vector)}
     except Exception as e:
         print(f"[Gemini Embedding Error] {e}")
         return {"error": str(e)}
 
 
+def embed_texts(texts: list, model: str = "textembedding-gecko@003") -> list:
+    """
+    一次请求批量生成多段文本的向量（上限 100 条），按输入顺序返回。
+    出错时直接抛出异常，由 utils/embed_cache.embed_many 负责重试。
+    """
+    embed = _genai().embed_content(model=model, content=list(texts))
+    return embed["embedding"]
+
+
 def safe_json_response(data: dict, status: int = 200):
     """
     返回 Flask 安全 JSON 响应（自动设置 Content-Type）
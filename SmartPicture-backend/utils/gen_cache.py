@@ -0,0 +1,226 @@
+"""
+utils/gen_cache.py
+-------------------
+生成结果缓存（文本 / 图像）。
+
+- 键：规范化后的 prompt + mode + model + temperature 的 SHA-256
+- 两级存储：进程内 LRU（带 TTL）+ 本地磁盘（带 TTL，跨 worker 共享）
+- single-flight：同一键的并发请求只触发一次上游调用，其余请求等待结果
+- 计费策略：命中缓存时按 full / discount / free 收费
+- 统计：内存命中、磁盘命中、未命中、合并请求数与命中率
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+_WS = re.compile(r"\s+")
+
+BILLING_POLICIES = ("full", "discount", "free")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """NFKC 归一化（全角/半角统一）并折叠空白；不改变大小写，避免改变生成语义"""
+    return _WS.sub(" ", unicodedata.normalize("NFKC", prompt or "")).strip()
+
+
+def cache_key(prompt: str, mode: str, model: str, temperature: float) -> str:
+    raw = json.dumps(
+        [normalize_prompt(prompt), mode, model, round(float(temperature), 3)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class GenerationCache:
+    """
+    max_entries: 内存 LRU 条目上限
+    ttl: 结果有效期（秒），内存与磁盘共用
+    disk_dir: 磁盘缓存目录；为 None 时只用内存
+    billing: 命中缓存时的计费策略 full / discount / free
+    discount: billing=discount 时按原价的比例收费
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl: float = 24 * 3600,
+        disk_dir: Optional[str] = None,
+        billing: str = "full",
+        discount: float = 0.5,
+    ):
+        if billing not in BILLING_POLICIES:
+            raise ValueError(f"billing must be one of {BILLING_POLICIES}")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.billing = billing
+        self.discount = discount
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 查询 / 生成
+    # ------------------------------------------------------------------
+    def lookup(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """只查缓存，返回 (结果, 来源)；来源为 memory / disk，未命中返回 (None, None)"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return entry[1], "memory"
+                del self._memory[key]
+
+        entry = self._read_disk(key, now)
+        if entry is not None:
+            self._remember(key, entry[1], entry[0])
+            with self._lock:
+                self._stats["disk_hits"] += 1
+            return entry[1], "disk"
+        return None, None
+
+    def get_or_generate(self, key: str, generate: Callable[[], Any]) -> Tuple[Any, str]:
+        """
+        返回 (结果, 来源)，来源为 memory / disk / miss / coalesced。
+        同一键已有请求在生成时，当前线程等待其结果而不是再次调用上游。
+        """
+        value, source = self.lookup(key)
+        if source:
+            return value, source
+
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None and key in self._memory:
+                # 上一个生成者恰好在 lookup 之后完成
+                self._stats["memory_hits"] += 1
+                return self._memory[key][1], "memory"
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if isinstance(flight.error, ConnectionAbortedError):
+                # 发起者的客户端断开后上游调用被取消，等待者自己重新生成
+                return self.get_or_generate(key, generate)
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "coalesced"
+
+        try:
+            flight.value = generate()
+            self.put(key, flight.value)
+            return flight.value, "miss"
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        self._remember(key, value, now)
+        self._write_disk(key, value, now)
+
+    # ------------------------------------------------------------------
+    # 计费与统计
+    # ------------------------------------------------------------------
+    def cost_for(self, base_cost: int, source: Optional[str]) -> int:
+        """按计费策略计算本次应收积分；未命中与合并请求均按原价"""
+        if source not in ("memory", "disk") or self.billing == "full":
+            return base_cost
+        if self.billing == "free":
+            return 0
+        return int(round(base_cost * self.discount))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s["memory_entries"] = len(self._memory)
+            s["in_flight"] = len(self._flights)
+        hits = s["memory_hits"] + s["disk_hits"]
+        requests = hits + s["misses"] + s["coalesced"]
+        s["hit_ratio"] = round(hits / requests, 4) if requests else 0.0
+        s["upstream_saved_ratio"] = round((hits + s["coalesced"]) / requests, 4) if requests else 0.0
+        return s
+
+    # ------------------------------------------------------------------
+    # 存储层
+    # ------------------------------------------------------------------
+    def _remember(self, key, value, created):
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry["created"] >= self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry["created"], entry["value"]
+
+    def _write_disk(self, key, value, created):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created": created, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except (OSError, TypeError) as e:
+            print(f"[GenCache Disk Error] {e}")
+
+    def prune_disk(self) -> int:
+        """删除磁盘上已过期的条目，返回删除数量"""
+        if not self.disk_dir:
+            return 0
+        removed, now = 0, time.time()
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json") and self._read_disk(name[:-5], now) is None:
+                    removed += 1
+        return removed
@@ -0,0 +1,259 @@
+"""
+utils/gen_gateway.py
+---------------------
+异步生成网关：在独立线程的 asyncio 事件循环上执行模型调用。
+
+- 全局信号量限制同时在途的上游调用数，另有按模型的并发上限
+- 有界排队：在途 + 排队超过上限时立即抛出 GatewayOverloaded（带 Retry-After
+  建议秒数），由 Flask 处理器转换为 429
+- Flask 处理器通过 call() / submit() 从同步线程提交任务；等待超时或
+  客户端断开时取消对应的 asyncio 任务，不再占用上游并发
+- 支持协程函数（如 generate_content_async）与普通同步函数（放入线程池执行）
+"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import os
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class GatewayOverloaded(Exception):
+    """排队已满，客户端应在 retry_after 秒后重试"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"generation gateway overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def client_disconnected(environ) -> Optional[Callable[[], bool]]:
+    """
+    由 WSGI environ 中的客户端 socket 构造 disconnected() 检查（werkzeug / gunicorn 会放入 environ）。
+    请求体已读完后 socket 可读且读到 EOF 即视为客户端已断开；拿不到 socket 时返回 None。
+    """
+    sock = environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+    if sock is None:
+        return None
+
+    def disconnected() -> bool:
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            # 可读但有数据是同一连接上的下一个请求（keep-alive / pipelining），不算断开
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+        except (OSError, ValueError):
+            return True
+    return disconnected
+
+
+class GenerationGateway:
+    """
+    max_concurrency: 全局同时在途的上游调用上限
+    model_limits: {模型名: 并发上限}，未列出的模型使用 default_model_limit
+    max_queue: 允许排队等待的任务数，超过即拒绝（429）
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        model_limits: Optional[Dict[str, int]] = None,
+        default_model_limit: int = 32,
+        max_queue: int = 256,
+    ):
+        self.max_concurrency = max_concurrency
+        self.model_limits = dict(model_limits or {})
+        self.default_model_limit = default_model_limit
+        self.max_queue = max_queue
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._global_sem: Optional[asyncio.Semaphore] = None
+        self._model_sems: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._admitted = 0  # 在途 + 排队
+        self._avg_latency = 1.0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    # ------------------------------------------------------------------
+    # 提交
+    # ------------------------------------------------------------------
+    def submit(self, fn: Callable[..., Any], *args, model: str = "default", **kwargs) -> concurrent.futures.Future:
+        """
+        提交一次模型调用，立即返回 concurrent.futures.Future。
+        fn 可以是协程函数，也可以是同步函数。
+        """
+        loop = self._ensure_loop()
+        with self._lock:
+            if self._admitted >= self.max_concurrency + self.max_queue:
+                self._stats["rejected"] += 1
+                raise GatewayOverloaded(self._retry_after())
+            self._admitted += 1
+            self._stats["submitted"] += 1
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._run(fn, args, kwargs, model), loop)
+        except BaseException:
+            self._release(None)
+            raise
+        # 在 Future 完成（含开始执行前就被取消）时归还排队名额
+        future.add_done_callback(self._release)
+        return future
+
+    def call(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        model: str = "default",
+        timeout: Optional[float] = None,
+        disconnected: Optional[Callable[[], bool]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        同步等待结果。超时、调用线程被中断或 disconnected() 返回 True 时
+        取消上游任务。
+        """
+        future = self.submit(fn, *args, model=model, **kwargs)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        poll = 0.1 if disconnected else None
+        try:
+            while True:
+                wait = poll
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise concurrent.futures.TimeoutError()
+                    wait = remaining if wait is None else min(wait, remaining)
+                try:
+                    return future.result(wait)
+                except concurrent.futures.TimeoutError:
+                    if future.done():
+                        raise
+                    if disconnected is not None and disconnected():
+                        raise ConnectionAbortedError("client disconnected")
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "admitted": self._admitted,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "avg_latency_s": round(self._avg_latency, 4),
+            }
+
+    # ------------------------------------------------------------------
+    # 事件循环
+    # ------------------------------------------------------------------
+    async def _run(self, fn, args, kwargs, model):
+        model_sem = self._model_sem(model)
+        # 先占模型名额再占全局名额：等待某个模型的任务不会占住全局并发
+        await model_sem.acquire()
+        try:
+            await self._global_sem.acquire()
+        except BaseException:
+            model_sem.release()
+            raise
+        started = time.monotonic()
+
+        def release():
+            self._global_sem.release()
+            model_sem.release()
+
+        if inspect.iscoroutinefunction(fn):
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                self._finish(started, ok=False)
+                raise
+            finally:
+                release()
+            self._finish(started, ok=True)
+            return result
+
+        # 同步函数在线程池中执行，取消等待无法中断线程：名额一直占到线程真正结束，
+        # 否则超时 / 断开后线程仍在调用上游，按模型的并发上限就失效了
+        inner = asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+        def on_done(f):
+            release()
+            self._finish(started, ok=f.exception() is None)
+        inner.add_done_callback(on_done)
+        return await asyncio.shield(inner)
+
+    def _finish(self, started, ok):
+        with self._lock:
+            if ok:
+                self._stats["completed"] += 1
+                # 指数滑动平均，用于估算 Retry-After；只计真正完成的调用
+                self._avg_latency = 0.9 * self._avg_latency + 0.1 * (time.monotonic() - started)
+            else:
+                self._stats["failed"] += 1
+
+    def _release(self, future):
+        with self._lock:
+            self._admitted -= 1
+            if future is not None and future.cancelled():
+                self._stats["cancelled"] += 1
+
+    def _model_sem(self, model):
+        sem = self._model_sems.get(model)
+        if sem is None:
+            sem = self._model_sems[model] = asyncio.Semaphore(
+                self.model_limits.get(model, self.default_model_limit)
+            )
+        return sem
+
+    def _retry_after(self) -> int:
+        # 排队中的任务预计需要 (排队数 / 并发数) 轮，每轮约 avg_latency 秒
+        rounds = max(self._admitted - self.max_concurrency, 1) / max(self.max_concurrency, 1)
+        return max(1, int(rounds * self._avg_latency + 0.999))
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            # gunicorn fork 后事件循环线程不会被继承，在子进程中重新创建
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _serve():
+                asyncio.set_event_loop(loop)
+                loop.set_default_executor(ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="gateway-sync"))
+                self._global_sem = asyncio.Semaphore(self.max_concurrency)
+                self._model_sems = {}
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_serve, name="generation-gateway", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop, self._pid, self._admitted = loop, os.getpid(), 0
+            return loop
+
+    def close(self) -> None:
+        if self._loop is not None and self._pid == os.getpid():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+        self._loop = None
+
+
+# 进程内共享实例，并发上限可通过环境变量调整
+gateway = GenerationGateway(
+    max_concurrency=int(os.environ.get("GEN_GATEWAY_CONCURRENCY", 64)),
+    model_limits={
+        "gemini-pro": int(os.environ.get("GEN_GATEWAY_GEMINI_LIMIT", 48)),
+        "imagen-3.0-pro": int(os.environ.get("GEN_GATEWAY_IMAGEN_LIMIT", 8)),
+    },
+    max_queue=int(os.environ.get("GEN_GATEWAY_QUEUE", 256)),
+)
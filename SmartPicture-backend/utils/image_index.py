@@ -0,0 +1,480 @@
+"""
+utils/image_index.py
+---------------------
+图片指纹去重：重复或轻微改动（重新压缩、缩放、调色、小范围标注）的图片复用已有的分析结果，
+不再请求 Vision / Gemini。
+
+- 指纹：pHash（32×32 灰度 DCT 低频 8×8 与中位数比较）+ dHash（9×8 相邻像素差）各 64 位，
+  另记原始字节的 SHA-256
+- 判定：pHash 汉明距离 ≤ IMAGE_DEDUP_MAX_DISTANCE（默认 8）且 dHash ≤ IMAGE_DEDUP_DHASH_DISTANCE
+  （默认 12）视为同一张图；OCR 这类对细节敏感的分析只复用字节完全相同的图片
+- 查找：多索引哈希（MIH），64 位分 4 段 16 位。距离 ≤ r 的两个哈希至少有一段距离 ≤ r // 4
+  （抽屉原理），每段只需在有序数组上二分查找这些取值，再对候选做 64 位 popcount 校验；
+  新加入的指纹先放在增量区线性扫描，积累到一定数量后合并重建
+- 存储：SQLite（WAL）保存指纹与各类分析结果，启动时载入内存索引；其他 worker 写入的新指纹
+  在查找时按 id 增量读取
+
+环境变量：IMAGE_DEDUP_ENABLED（默认 1）、IMAGE_DEDUP_PATH、IMAGE_DEDUP_MAX_DISTANCE、
+IMAGE_DEDUP_DHASH_DISTANCE、IMAGE_DEDUP_URL_ALLOWLIST（允许服务端下载指纹的 http(s) 主机，逗号分隔，
+默认为空：只处理 gs://、/media/<id> 与 data URI）。其他来源或指纹计算失败时直接分析，不做缓存。
+"""
+
+import base64
+import hashlib
+import io
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+from array import array
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np  # 运行时在用到的函数里延迟导入，不拖慢 import app
+
+CHUNKS = 4
+CHUNK_BITS = 16
+MAX_DOWNLOAD = 20 * 1024 * 1024
+
+
+class Fingerprint(NamedTuple):
+    phash: int
+    dhash: int
+    sha256: str
+
+
+# ----------------------------------------------------------------------
+# 感知哈希
+# ----------------------------------------------------------------------
+def _dct_matrix(n: int) -> "np.ndarray":
+    import numpy as np
+    k = np.arange(n)[:, None]
+    return np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+
+
+_dct32 = None
+
+
+def _bits_to_int(bits: "np.ndarray") -> int:
+    import numpy as np
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def phash(img) -> int:
+    from PIL import Image
+    import numpy as np
+    global _dct32
+    if _dct32 is None:
+        _dct32 = _dct_matrix(32)
+    pixels = np.asarray(img.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_dct32 @ pixels @ _dct32.T)[:8, :8]
+    return _bits_to_int(low > np.median(low))
+
+
+def dhash(img) -> int:
+    from PIL import Image
+    import numpy as np
+    pixels = np.asarray(img.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def fingerprint(data: bytes) -> Fingerprint:
+    from PIL import Image  # 延迟导入：Pillow 为可选依赖
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (128, 128))  # JPEG 解码时直接降采样
+        img = img.convert("RGB") if img.mode in ("P", "PA") else img
+        return Fingerprint(phash(img), dhash(img), hashlib.sha256(data).hexdigest())
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _url_allowlist() -> List[str]:
+    return [h.strip().lower() for h in os.environ.get("IMAGE_DEDUP_URL_ALLOWLIST", "").split(",") if h.strip()]
+
+
+def fingerprintable(uri: str) -> bool:
+    """
+    只为服务端自己能安全读取的来源计算指纹：gs://、/media/<id>、data URI，
+    以及 IMAGE_DEDUP_URL_ALLOWLIST 中列出的 http(s) 主机。其他 URL 直接交给 Vision，
+    不在服务端下载（避免借此访问元数据服务或内网地址，也避免同一图片下载两遍）。
+    """
+    if uri.startswith(("gs://", "/media/", "data:")):
+        return True
+    if uri.startswith(("http://", "https://")):
+        from urllib.parse import urlsplit
+        host = (urlsplit(uri).hostname or "").lower()
+        return bool(host) and host in _url_allowlist()
+    return False
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        raise ValueError(f"redirect not followed ({code})")
+
+
+def load_image_bytes(uri: str) -> bytes:
+    """读取 fingerprintable() 允许的来源；http(s) 不跟随重定向，超过 MAX_DOWNLOAD 即放弃"""
+    if not fingerprintable(uri):
+        raise ValueError(f"Unsupported image URI: {uri[:40]}")
+    if uri.startswith("gs://"):
+        from utils.storage import get_bucket
+        bucket, _, name = uri[5:].partition("/")
+        data = get_bucket(bucket).blob(name).download_as_bytes(start=0, end=MAX_DOWNLOAD)  # end 含端点
+        if len(data) > MAX_DOWNLOAD:
+            raise ValueError("image too large to fingerprint")
+        return data
+    if uri.startswith("/media/"):
+        from utils.media import media_path
+        path = media_path(uri)
+        if path is None:
+            raise FileNotFoundError(uri)
+        if os.path.getsize(path) > MAX_DOWNLOAD:
+            raise ValueError("image too large to fingerprint")
+        with open(path, "rb") as f:
+            return f.read()
+    if uri.startswith("data:"):
+        if len(uri) > MAX_DOWNLOAD * 4 // 3 + 100:
+            raise ValueError("image too large to fingerprint")
+        return base64.b64decode(uri[uri.index(",") + 1:])
+    opener = urllib.request.build_opener(_NoRedirect)
+    with opener.open(uri, timeout=10) as resp:
+        if int(resp.headers.get("Content-Length") or 0) > MAX_DOWNLOAD:
+            raise ValueError("image too large to fingerprint")
+        data = resp.read(MAX_DOWNLOAD + 1)
+    if len(data) > MAX_DOWNLOAD:
+        raise ValueError("image too large to fingerprint")
+    return data
+
+
+# ----------------------------------------------------------------------
+# 多索引哈希
+# ----------------------------------------------------------------------
+def _popcount(values: "np.ndarray") -> "np.ndarray":
+    """uint64 数组逐元素 popcount；np.bitwise_count 需要 NumPy 2.0，1.x 上按字节查表"""
+    import numpy as np
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    table = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1, dtype=np.uint8)
+    return table[np.ascontiguousarray(values, dtype=np.uint64).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+_probe_cache: Dict[int, "np.ndarray"] = {}
+
+
+def _probes(radius: int) -> "np.ndarray":
+    """16 位内汉明重量 ≤ radius 的全部掩码（radius=2 时 137 个）"""
+    if radius not in _probe_cache:
+        import numpy as np
+        masks = [0]
+        for r in range(1, radius + 1):
+            masks += [sum(1 << b for b in bits) for bits in itertools.combinations(range(CHUNK_BITS), r)]
+        _probe_cache[radius] = np.array(masks, dtype=np.uint16)
+    return _probe_cache[radius]
+
+
+class MultiIndexHash:
+    """
+    64 位哈希的近邻查找；位置即插入顺序，调用方用它对齐自己的元数据。
+    merge_every: 增量区达到该数量（或已索引数量的 1/8，取较大者）时合并重建
+    """
+
+    def __init__(self, merge_every: int = 4096):
+        self.merge_every = merge_every
+        self._codes = array("Q")
+        self._indexed = 0
+        import numpy as np
+        self._snapshot = np.empty(0, np.uint64)
+        self._chunks: List[Tuple["np.ndarray", "np.ndarray"]] = []  # 每段：(各取值的起始偏移, 按取值排序的位置)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def add(self, code: int) -> int:
+        with self._lock:
+            self._codes.append(code)
+            pending = len(self._codes) - self._indexed
+            if pending >= max(self.merge_every, self._indexed // 8):
+                self._rebuild()
+            return len(self._codes) - 1
+
+    def add_many(self, codes: Sequence[int]) -> None:
+        with self._lock:
+            self._codes.extend(codes)
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        import numpy as np
+        codes = np.frombuffer(self._codes, dtype=np.uint64).copy()
+        chunks = []
+        for c in range(CHUNKS):
+            values = ((codes >> np.uint64(c * CHUNK_BITS)) & np.uint64(0xFFFF)).astype(np.uint16)
+            order = np.argsort(values, kind="stable")
+            # starts[v]..starts[v + 1] 为取值 v 在 order 中的区间，查找时直接取下标，不用二分
+            starts = np.searchsorted(values[order], np.arange(1 << CHUNK_BITS, dtype=np.uint32))
+            chunks.append((np.append(starts, len(codes)), order.astype(np.int64)))
+        # 已索引部分是不可变快照，查找时无需持锁复制
+        self._snapshot, self._chunks, self._indexed = codes, chunks, len(codes)
+
+    def search(self, code: int, max_distance: int) -> "Tuple[np.ndarray, np.ndarray]":
+        """返回 (位置, 距离)，按距离升序"""
+        import numpy as np
+        q = np.uint64(code)
+        with self._lock:
+            snapshot, chunks, indexed = self._snapshot, self._chunks, self._indexed
+            pending = np.array(self._codes[indexed:], dtype=np.uint64)
+        probes = _probes(max_distance // CHUNKS)
+        found = []
+        for c, (starts, order) in enumerate(chunks):
+            keys = np.uint16((code >> (c * CHUNK_BITS)) & 0xFFFF) ^ probes
+            lo = starts[keys]
+            counts = starts[keys + np.uint32(1)] - lo
+            total = int(counts.sum())
+            if total:
+                offsets = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(total)
+                found.append(order[offsets])
+        # 同一位置可能在多段命中，校验距离后再去重（候选数千，先去重反而更慢）
+        candidates = np.concatenate(found) if found else np.empty(0, np.int64)
+        # 增量区线性扫描，位置接在已索引部分之后
+        candidates = np.concatenate([candidates, np.arange(indexed, indexed + len(pending), dtype=np.int64)])
+        distances = _popcount(np.concatenate([snapshot[candidates[:len(candidates) - len(pending)]],
+                                                     pending]) ^ q)
+        keep = distances <= max_distance
+        candidates, first = np.unique(candidates[keep], return_index=True)
+        distances = distances[keep][first]
+        rank = np.argsort(distances, kind="stable")
+        return candidates[rank], distances[rank].astype(np.int64)
+
+    def scan(self, code: int, max_distance: int) -> "Tuple[np.ndarray, np.ndarray]":
+        """线性扫描（基准对照）"""
+        import numpy as np
+        with self._lock:
+            codes = np.frombuffer(self._codes, dtype=np.uint64).copy()
+        distances = _popcount(codes ^ np.uint64(code))
+        hits = np.nonzero(distances <= max_distance)[0]
+        rank = np.argsort(distances[hits], kind="stable")
+        return hits[rank], distances[hits][rank].astype(np.int64)
+
+
+# ----------------------------------------------------------------------
+# 持久化索引 + 分析结果
+# ----------------------------------------------------------------------
+def _signed(v: int) -> int:
+    return v - (1 << 64) if v >= 1 << 63 else v
+
+
+def _unsigned(v: int) -> int:
+    return v + (1 << 64) if v < 0 else v
+
+
+class ImageDedupIndex:
+    """
+    path: SQLite 文件路径
+    max_distance / dhash_distance: 近重复判定阈值（汉明距离）
+    """
+
+    def __init__(self, path: str, max_distance: int = 8, dhash_distance: int = 12, refresh_interval: float = 1.0):
+        self.path = path
+        self.max_distance = max_distance
+        self.dhash_distance = dhash_distance
+        self.refresh_interval = refresh_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._mih = MultiIndexHash()
+        self._ids = array("q")
+        self._dhashes = array("Q")
+        self._last_id = 0
+        self._refreshed = 0.0
+        self._stats = {"lookups": 0, "exact_hits": 0, "near_hits": 0, "misses": 0, "added": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, phash INTEGER NOT NULL,"
+                     " dhash INTEGER NOT NULL, sha256 TEXT NOT NULL UNIQUE, created_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS results (image_id INTEGER NOT NULL, kind TEXT NOT NULL,"
+                     " result TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (image_id, kind))")
+        self._refresh(force=True)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _refresh(self, force: bool = False) -> None:
+        """载入其他进程（或启动前）写入的指纹"""
+        now = time.monotonic()
+        if not force and now - self._refreshed < self.refresh_interval:
+            return
+        self._refreshed = now
+        rows = self._conn().execute("SELECT id, phash, dhash FROM images WHERE id > ? ORDER BY id",
+                                    (self._last_id,)).fetchall()
+        if rows:
+            with self._lock:
+                self._append([(i, _unsigned(p), _unsigned(d)) for i, p, d in rows if i > self._last_id],
+                             bulk=len(rows) > 1000)
+
+    def _append(self, rows, bulk=False) -> None:
+        if not rows:
+            return
+        self._ids.extend(r[0] for r in rows)
+        self._dhashes.extend(r[2] for r in rows)
+        if bulk:
+            self._mih.add_many([r[1] for r in rows])
+        else:
+            for r in rows:
+                self._mih.add(r[1])
+        self._last_id = max(self._last_id, rows[-1][0])
+
+    def find(self, fp: Fingerprint, kind: str, exact: bool = False) -> Optional[Tuple[Any, int]]:
+        """返回 (已存的分析结果, pHash 距离)；没有可复用的结果时返回 None"""
+        self._refresh()
+        conn = self._conn()
+        row = conn.execute("SELECT r.result FROM images i JOIN results r ON r.image_id = i.id"
+                           " WHERE i.sha256 = ? AND r.kind = ?", (fp.sha256, kind)).fetchone()
+        if row:
+            self._count("exact_hits")
+            return json.loads(row[0]), 0
+        if exact:
+            self._count("misses")
+            return None
+        positions, distances = self._mih.search(fp.phash, self.max_distance)
+        with self._lock:
+            matches = [(int(d), self._ids[p]) for p, d in zip(positions.tolist(), distances.tolist())
+                       if hamming(self._dhashes[p], fp.dhash) <= self.dhash_distance]
+        for start in range(0, len(matches), 500):
+            part = matches[start:start + 500]
+            found = dict(conn.execute(
+                f"SELECT image_id, result FROM results WHERE kind = ? AND image_id IN ({','.join('?' * len(part))})",
+                [kind, *(i for _, i in part)]).fetchall())
+            for distance, image_id in part:  # 已按距离升序
+                if image_id in found:
+                    self._count("near_hits")
+                    return json.loads(found[image_id]), distance
+        self._count("misses")
+        return None
+
+    def add(self, fp: Fingerprint, kind: str, result: Any) -> None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("INSERT OR IGNORE INTO images (phash, dhash, sha256, created_at) VALUES (?, ?, ?, ?)",
+                     (_signed(fp.phash), _signed(fp.dhash), fp.sha256, now))
+        image_id = conn.execute("SELECT id FROM images WHERE sha256 = ?", (fp.sha256,)).fetchone()[0]
+        conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                     (image_id, kind, json.dumps(result, ensure_ascii=False), now))
+        with self._lock:
+            if image_id > self._last_id:
+                # 中间可能夹着其他进程写入的 id，一并读入保持顺序
+                rows = conn.execute("SELECT id, phash, dhash FROM images WHERE id > ? ORDER BY id",
+                                    (self._last_id,)).fetchall()
+                self._append([(i, _unsigned(p), _unsigned(d)) for i, p, d in rows])
+            self._stats["added"] += 1
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        s["images"] = len(self._mih)
+        hits = s["exact_hits"] + s["near_hits"]
+        s["hit_ratio"] = round(hits / s["lookups"], 4) if s["lookups"] else 0.0
+        return s
+
+
+# ----------------------------------------------------------------------
+# 带去重的分析
+# ----------------------------------------------------------------------
+_index = None
+_index_ready = False
+_index_lock = threading.Lock()
+
+
+def get_image_index() -> Optional[ImageDedupIndex]:
+    """懒加载：IMAGE_DEDUP_PATH（默认 data/image_index.sqlite）；IMAGE_DEDUP_ENABLED=0 时为 None"""
+    global _index, _index_ready
+    if not _index_ready:
+        with _index_lock:
+            if not _index_ready:
+                if os.environ.get("IMAGE_DEDUP_ENABLED", "1") != "0":
+                    _index = ImageDedupIndex(
+                        os.environ.get("IMAGE_DEDUP_PATH",
+                                       os.path.join(os.path.dirname(__file__), "../data/image_index.sqlite")),
+                        max_distance=int(os.environ.get("IMAGE_DEDUP_MAX_DISTANCE", 8)),
+                        dhash_distance=int(os.environ.get("IMAGE_DEDUP_DHASH_DISTANCE", 12)),
+                    )
+                _index_ready = True
+    return _index
+
+
+_pillow = None
+
+
+def _pillow_available() -> bool:
+    global _pillow
+    if _pillow is None:
+        import importlib.util
+        _pillow = importlib.util.find_spec("PIL") is not None
+        if not _pillow:
+            print("[Image Dedup] Pillow is not installed; image dedup disabled")
+    return _pillow
+
+
+def index_stats() -> Dict[str, Any]:
+    """/metrics 与 stats 接口用：索引尚未创建时返回零值，不会因为一次 GET 创建数据库"""
+    if _index is None:
+        return {"lookups": 0, "exact_hits": 0, "near_hits": 0, "misses": 0, "added": 0, "images": 0,
+                "hit_ratio": 0.0}
+    return _index.stats()
+
+
+def fingerprint_uri(uri: str) -> Optional[Fingerprint]:
+    """
+    读取并计算指纹；来源不在允许范围、未安装 Pillow（下载前检查）或读取 / 解码失败时
+    返回 None，调用方直接分析
+    """
+    if not _pillow_available() or not fingerprintable(uri):
+        return None
+    try:
+        return fingerprint(load_image_bytes(uri))
+    except Exception as e:
+        print(f"[Image Dedup Error] {uri[:80]}: {e}")
+        return None
+
+
+def analyze_deduplicated(image_uri: str, kind: str, analyze: Callable[[], Any], exact: bool = False) -> Any:
+    """
+    kind 区分不同的分析（如 "labels"、"labels,safe_search:10"），结果须可 JSON 序列化。
+    命中近重复图片时返回已存的结果，否则调用 analyze() 并存入索引。
+    """
+    index = get_image_index()
+    fp = fingerprint_uri(image_uri) if index is not None else None
+    if fp is None:
+        return analyze()
+    hit = index.find(fp, kind, exact=exact)
+    if hit is not None:
+        return hit[0]
+    result = analyze()
+    index.add(fp, kind, result)
+    return result
+
+
+def _reset_after_fork():
+    # SQLite 连接按 pid 重建；锁在 fork 时可能处于持有状态，重新创建
+    global _index_lock
+    _index_lock = threading.Lock()
+    if _index is not None:
+        _index._lock = threading.Lock()
+        _index._mih._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
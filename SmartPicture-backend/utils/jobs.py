@@ -0,0 +1,497 @@
+"""
+utils/jobs.py
+--------------
+异步图像生成任务：提交即返回 job id，由 worker 从队列中取任务执行。
+
+- 队列（可插拔）：
+    memory   进程内 queue.Queue，适合单实例 / 本地开发
+    sqlite   本地文件队列，带可见性超时（worker 崩溃后任务会被重新投递），多进程可共享
+    pubsub   Google Cloud Pub/Sub（生产），worker 可以是独立的 Cloud Run 服务
+- 任务状态（可插拔）：memory / sqlite / firestore（集合 image_jobs）
+- 结果：模型返回 URL 时直接记录；返回字节时写入存储（GCS 或本地目录）
+- 积分：提交时预留，成功后提交、失败后退款；状态流转 queued → running → succeeded / failed，
+  只有把任务从 running 改为终态的一方负责结算，重复投递不会重复扣费或退款
+- 客户端轮询或长轮询 status(job_id, wait=秒)
+
+环境变量：
+    JOB_QUEUE=memory|sqlite|pubsub    JOB_STORE=memory|sqlite|firestore（默认随队列）
+    JOB_SQLITE_PATH                   JOB_PUBSUB_TOPIC / JOB_PUBSUB_SUBSCRIPTION
+    JOB_WORKERS（进程内 worker 线程数，pubsub 默认 0）
+    JOB_RESULT_BUCKET / JOB_RESULT_DIR
+
+独立 worker 进程：
+    python -m utils.jobs --workers 4
+"""
+
+import base64
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.clients import registry
+
+TERMINAL = ("succeeded", "failed")
+MAX_WAIT = 30.0  # 长轮询单次最长等待（秒）
+
+
+# ----------------------------------------------------------------------
+# 队列
+# ----------------------------------------------------------------------
+class InProcessQueue:
+    def __init__(self):
+        self._q: "queue.Queue[str]" = queue.Queue()
+
+    def put(self, job_id: str) -> None:
+        self._q.put(job_id)
+
+    def get(self, timeout: float):
+        """返回 (job_id, 回执) 或 None"""
+        try:
+            job_id = self._q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return job_id, job_id
+
+    def ack(self, receipt) -> None:
+        pass
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+
+class _SQLite:
+    """每线程一个连接的 SQLite 封装（WAL）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+class SQLiteQueue:
+    """
+    get 时把任务租出 visibility_timeout 秒；ack 前 worker 崩溃，租约到期后任务重新可见。
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = 300.0, poll_interval: float = 0.05):
+        self._db = _SQLite(path)
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._db.conn().execute(
+            "CREATE TABLE IF NOT EXISTS job_queue (job_id TEXT PRIMARY KEY, available_at REAL NOT NULL)")
+
+    def put(self, job_id: str) -> None:
+        self._db.conn().execute("INSERT OR REPLACE INTO job_queue VALUES (?, ?)", (job_id, time.time()))
+
+    def get(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        conn = self._db.conn()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT job_id FROM job_queue WHERE available_at <= ? ORDER BY available_at LIMIT 1",
+                    (now,)).fetchone()
+                if row:
+                    conn.execute("UPDATE job_queue SET available_at = ? WHERE job_id = ?",
+                                 (now + self.visibility_timeout, row[0]))
+            finally:
+                conn.execute("COMMIT")
+            if row:
+                return row[0], row[0]
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def ack(self, receipt) -> None:
+        self._db.conn().execute("DELETE FROM job_queue WHERE job_id = ?", (receipt,))
+
+    def depth(self) -> int:
+        return self._db.conn().execute("SELECT COUNT(*) FROM job_queue").fetchone()[0]
+
+
+class PubSubQueue:
+    """Pub/Sub：发布 job id，worker 同步 pull；ack 前超时的消息由 Pub/Sub 重新投递"""
+
+    def __init__(self, topic: str, subscription: str):
+        self.topic = topic
+        self.subscription = subscription
+
+    def put(self, job_id: str) -> None:
+        registry.get("pubsub_publisher").publish(self.topic, job_id.encode()).result(timeout=30)
+
+    def get(self, timeout: float):
+        subscriber = registry.get("pubsub_subscriber")
+        response = subscriber.pull(request={"subscription": self.subscription, "max_messages": 1},
+                                   timeout=max(timeout, 1.0))
+        if not response.received_messages:
+            return None
+        msg = response.received_messages[0]
+        return msg.message.data.decode(), msg.ack_id
+
+    def ack(self, receipt) -> None:
+        registry.get("pubsub_subscriber").acknowledge(
+            request={"subscription": self.subscription, "ack_ids": [receipt]})
+
+    def depth(self) -> int:
+        return -1  # 由 Pub/Sub 监控指标提供
+
+
+# ----------------------------------------------------------------------
+# 任务状态
+# ----------------------------------------------------------------------
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._cond:
+            self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """queued / running（重新投递）→ running；已是终态时返回 None"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job["status"] in TERMINAL:
+                return None
+            job.update(status="running", attempts=job.get("attempts", 0) + 1, updated_at=time.time())
+            self._cond.notify_all()
+            return dict(job)
+
+    def finish(self, job_id: str, status: str, **fields) -> bool:
+        """running → 终态；返回 False 表示已被其他 worker 结束"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job["status"] != "running":
+                return False
+            job.update(fields, status=status, updated_at=time.time())
+            self._cond.notify_all()
+            return True
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.monotonic()
+                if not job or job["status"] in TERMINAL or remaining <= 0:
+                    return dict(job) if job else None
+                self._cond.wait(remaining)
+
+
+class _PollingWait:
+    poll_interval = 0.25
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if not job or job["status"] in TERMINAL or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+
+class SQLiteJobStore(_PollingWait):
+    def __init__(self, path: str, poll_interval: float = 0.1):
+        self._db = _SQLite(path)
+        self.poll_interval = poll_interval
+        self._db.conn().execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL)")
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._db.conn().execute("INSERT INTO jobs VALUES (?, ?, ?)",
+                                (job["id"], job["status"], json.dumps(job, ensure_ascii=False)))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.conn().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _transition(self, job_id, allowed, status, fields, count_attempt=False):
+        conn = self._db.conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            job = json.loads(row[0]) if row else None
+            if not job or job["status"] not in allowed:
+                return None
+            job.update(fields, status=status, updated_at=time.time())
+            if count_attempt:
+                job["attempts"] = job.get("attempts", 0) + 1
+            conn.execute("UPDATE jobs SET status = ?, data = ? WHERE id = ?",
+                         (status, json.dumps(job, ensure_ascii=False), job_id))
+            return job
+        finally:
+            conn.execute("COMMIT")
+
+    def claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._transition(job_id, ("queued", "running"), "running", {}, count_attempt=True)
+
+    def finish(self, job_id: str, status: str, **fields) -> bool:
+        return self._transition(job_id, ("running",), status, fields) is not None
+
+
+class FirestoreJobStore(_PollingWait):
+    """状态存放在 Firestore；状态流转用 last_update_time 前置条件保证只有一方成功"""
+
+    def __init__(self, db=None, collection: str = "image_jobs"):
+        self._db = db
+        self.collection = collection
+
+    @property
+    def db(self):
+        return self._db or registry.get("firestore")
+
+    def _ref(self, job_id):
+        return self.db.collection(self.collection).document(job_id)
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._ref(job["id"]).set(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        snap = self._ref(job_id).get()
+        return snap.to_dict() if snap.exists else None
+
+    def _transition(self, job_id, allowed, status, fields, count_attempt=False):
+        snap = self._ref(job_id).get()
+        job = snap.to_dict() if snap.exists else None
+        if not job or job["status"] not in allowed:
+            return None
+        job.update(fields, status=status, updated_at=time.time())
+        if count_attempt:
+            job["attempts"] = job.get("attempts", 0) + 1
+        try:
+            batch = self.db.batch()
+            batch.update(self._ref(job_id), job, option=self.db.write_option(last_update_time=snap.update_time))
+            batch.commit()
+        except Exception as e:  # 前置条件失败：其他 worker 已先改动
+            print(f"[Job Transition Conflict] {job_id}: {e}")
+            return None
+        return job
+
+    def claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._transition(job_id, ("queued", "running"), "running", {}, count_attempt=True)
+
+    def finish(self, job_id: str, status: str, **fields) -> bool:
+        return self._transition(job_id, ("running",), status, fields) is not None
+
+
+# ----------------------------------------------------------------------
+# 结果存储
+# ----------------------------------------------------------------------
+def inline_result(job: Dict[str, Any], result: Any) -> str:
+    """默认：URL 原样返回，字节编码为 data URI（与同步接口返回 URL 或 Base64 一致）"""
+    if isinstance(result, str):
+        return result
+    return "data:image/png;base64," + base64.b64encode(result).decode("ascii")
+
+
+def local_result_sink(directory: str) -> Callable[[Dict[str, Any], Any], str]:
+    os.makedirs(directory, exist_ok=True)
+
+    def sink(job, result):
+        if isinstance(result, str):
+            return result
+        path = os.path.join(directory, f"{job['id']}.png")
+        with open(path, "wb") as f:
+            f.write(result)
+        return f"file://{os.path.abspath(path)}"
+    return sink
+
+
+def gcs_result_sink(bucket_name: str, prefix: str = "jobs/") -> Callable[[Dict[str, Any], Any], str]:
+    def sink(job, result):
+        if isinstance(result, str):
+            return result
+        from utils.storage import upload_bytes
+        return upload_bytes(bucket_name, result, f"{prefix}{job['id']}.png", content_type="image/png")
+    return sink
+
+
+# ----------------------------------------------------------------------
+# 任务管理
+# ----------------------------------------------------------------------
+class JobManager:
+    """
+    store / queue: 上面的任意实现
+    generate(prompt, **params): 返回图片 URL 或图片字节
+    spender: PointsSpender；为 None 时不计费（例如 utils/main.py 的独立服务）
+    result_sink(job, result): 把生成结果落到存储，返回可访问的地址
+    """
+
+    def __init__(self, store, queue, generate: Callable[..., Any], spender=None,
+                 result_sink: Optional[Callable[[Dict[str, Any], Any], str]] = None):
+        self.store = store
+        self.queue = queue
+        self.generate = generate
+        self.spender = spender
+        self.result_sink = result_sink or inline_result
+        self._workers: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+
+    def submit(self, uid: str, prompt: str, cost: int = 0, params: Optional[Dict[str, Any]] = None,
+               kind: str = "image") -> Dict[str, Any]:
+        """预留积分（余额不足时抛出 InsufficientPoints）并入队，立即返回任务"""
+        job_id = uuid.uuid4().hex
+        reservation = None
+        if self.spender is not None and cost:
+            reservation = self.spender.reserve(uid, cost, {"module": "jobs", "job_id": job_id, "prompt": prompt})
+        now = time.time()
+        job = {
+            "id": job_id, "uid": uid, "kind": kind, "prompt": prompt, "params": params or {},
+            "status": "queued", "cost": cost, "attempts": 0, "result": None, "error": None,
+            "reservation": reservation.to_dict() if reservation else None,
+            "created_at": now, "updated_at": now,
+        }
+        try:
+            self.store.create(job)
+            self.queue.put(job_id)
+        except Exception:
+            if reservation is not None:
+                self.spender.refund(reservation, reason="enqueue failed")
+            raise
+        return job
+
+    def status(self, job_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        if wait > 0:
+            return self.store.wait(job_id, min(wait, MAX_WAIT))
+        return self.store.get(job_id)
+
+    def process_one(self, timeout: float = 1.0) -> bool:
+        """取一个任务执行；队列为空时返回 False"""
+        item = self.queue.get(timeout)
+        if item is None:
+            return False
+        job_id, receipt = item
+        job = self.store.claim(job_id)
+        if job is None:  # 已结束（重复投递）或不存在
+            self.queue.ack(receipt)
+            return True
+        reservation = self.spender.restore(job["reservation"]) if self.spender and job.get("reservation") else None
+        try:
+            result = self.generate(job["prompt"], **job.get("params", {}))
+            location = self.result_sink(job, result)
+        except Exception as e:
+            if self.store.finish(job_id, "failed", error=str(e)) and reservation is not None:
+                self.spender.refund(reservation, reason=f"{type(e).__name__}: {e}")
+            with self._lock:
+                self.failed += 1
+        else:
+            if self.store.finish(job_id, "succeeded", result=location) and reservation is not None:
+                self.spender.commit(reservation, {"result": location})
+        with self._lock:
+            self.processed += 1
+        self.queue.ack(receipt)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.process_one(timeout=0.5)
+            except Exception as e:  # 队列 / 存储暂时不可用：稍后重试，不让 worker 退出
+                print(f"[Job Worker Error] {e}")
+                self._stop.wait(1.0)
+
+    def start_workers(self, n: int) -> None:
+        for i in range(n):
+            t = threading.Thread(target=self._run, name=f"job-worker-{len(self._workers)}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        for t in self._workers:
+            t.join(timeout)
+        self._workers = []
+        self._stop = threading.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "queue_depth": self.queue.depth(),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """返回给客户端的字段（不含预留明细）"""
+    return {k: job.get(k) for k in ("id", "status", "result", "error", "created_at", "updated_at", "attempts")}
+
+
+def build_from_env(generate: Callable[..., Any], spender=None) -> JobManager:
+    """按 JOB_* 环境变量组装队列、状态存储与结果存储"""
+    kind = os.environ.get("JOB_QUEUE", "memory")
+    data_dir = os.path.join(os.path.dirname(__file__), "../data")
+    sqlite_path = os.environ.get("JOB_SQLITE_PATH", os.path.join(data_dir, "jobs.sqlite"))
+    if kind == "sqlite":
+        q = SQLiteQueue(sqlite_path)
+    elif kind == "pubsub":
+        q = PubSubQueue(os.environ["JOB_PUBSUB_TOPIC"], os.environ["JOB_PUBSUB_SUBSCRIPTION"])
+    else:
+        q = InProcessQueue()
+
+    store_kind = os.environ.get("JOB_STORE", {"sqlite": "sqlite", "pubsub": "firestore"}.get(kind, "memory"))
+    if store_kind == "sqlite":
+        store = SQLiteJobStore(sqlite_path)
+    elif store_kind == "firestore":
+        store = FirestoreJobStore()
+    else:
+        store = MemoryJobStore()
+
+    bucket = os.environ.get("JOB_RESULT_BUCKET")
+    sink = gcs_result_sink(bucket) if bucket else local_result_sink(
+        os.environ.get("JOB_RESULT_DIR", os.path.join(data_dir, "job_results")))
+    return JobManager(store, q, generate, spender=spender, result_sink=sink)
+
+
+def default_workers() -> int:
+    default = "0" if os.environ.get("JOB_QUEUE") == "pubsub" else "2"
+    return int(os.environ.get("JOB_WORKERS", default))
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(description="异步图像生成 worker（按 JOB_* 环境变量连接队列）")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from utils.ai_client import cached_generate_content
+    from utils.spending import PointsSpender
+
+    manager = build_from_env(lambda prompt, **kw: cached_generate_content(prompt, mode="image", **kw)[0],
+                             spender=PointsSpender(registry.get("firestore")))
+    manager.start_workers(args.workers)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    print(f"🚀 job workers running: {args.workers}")
+    try:
+        while not stopped.wait(30):
+            print(f"[Job Worker Stats] {manager.stats()}")
+    except KeyboardInterrupt:
+        pass
+    manager.stop()
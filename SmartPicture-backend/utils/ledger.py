@@ -0,0 +1,349 @@
+"""
+utils/ledger.py
+----------------
+追加写（append-only）积分账本引擎。
+
+- 每次变更只向 points.log 追加一行小记录：{"u": 用户ID, "d": 变动值}
+- 内存中维护 用户 → 余额 的索引，读操作 O(1)
+- 通过 flock 文件锁 + 日志增量追读，保证多个 gunicorn worker 之间
+  deduct 的「检查并扣减」是原子的，不会丢失更新
+- 日志条数超过阈值时压缩为快照（points.snapshot.json），启动时由
+  快照 + 日志重放恢复索引
+- 带键记录（apply_unique）：一行同时记下若干变动、幂等键与元数据，
+  键已存在的记录不会重复记入（用于邀请奖励等只能发放一次的变动）
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：仅保证进程内互斥
+    fcntl = None
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "../data")
+
+LOG_NAME = "points.log"
+SNAPSHOT_NAME = "points.snapshot.json"
+LOCK_NAME = "points.lock"
+
+
+class PointsLedger:
+    """
+    基于追加日志的积分账本。
+
+    data_dir: 日志、快照与锁文件所在目录
+    compact_every: 自上次快照以来累计多少条日志后自动压缩
+    fsync: 每次追加后是否 fsync（更安全，但写入更慢）
+    legacy_file: 旧版 users.json，首次启动且无账本时导入为初始快照
+    """
+
+    def __init__(
+        self,
+        data_dir: str = DATA_DIR,
+        compact_every: int = 100_000,
+        fsync: bool = False,
+        legacy_file: Optional[str] = None,
+    ):
+        self.data_dir = data_dir
+        self.log_path = os.path.join(data_dir, LOG_NAME)
+        self.snapshot_path = os.path.join(data_dir, SNAPSHOT_NAME)
+        self.lock_path = os.path.join(data_dir, LOCK_NAME)
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.legacy_file = legacy_file
+
+        self._mutex = threading.RLock()
+        self._pid = None
+        self._lock_fd = None
+        self._log_fd = None
+        self._log_ino = None
+        self._offset = 0
+        self._gen = 0
+        self._records = 0
+        self._balances: Dict[str, int] = {}
+        self._keys: Dict[str, Dict[str, Any]] = {}
+
+        os.makedirs(data_dir, exist_ok=True)
+        self._open()
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def get(self, user_id: str) -> int:
+        with self._locked(exclusive=False):
+            self._catch_up()
+            return self._balances.get(user_id, 0)
+
+    def add(self, user_id: str, amount: int) -> int:
+        """增加（或减少）积分，返回变动后的余额"""
+        with self._locked(exclusive=True):
+            self._catch_up()
+            self._append([(user_id, amount)])
+            return self._balances[user_id]
+
+    def deduct(self, user_id: str, cost: int) -> bool:
+        """原子的「检查并扣减」：余额不足返回 False，不写日志"""
+        with self._locked(exclusive=True):
+            self._catch_up()
+            if self._balances.get(user_id, 0) < cost:
+                return False
+            self._append([(user_id, -cost)])
+            return True
+
+    def apply_many(self, changes: Iterable[Tuple[str, int]]) -> None:
+        """在一次加锁与一次写入中批量记入多条变动（整体原子追加）"""
+        changes = [(uid, int(delta)) for uid, delta in changes]
+        if not changes:
+            return
+        with self._locked(exclusive=True):
+            self._catch_up()
+            self._append(changes)
+
+    def apply_unique(
+        self, entries: Sequence[Tuple[Sequence[str], Sequence[Tuple[str, int]], Dict[str, Any]]]
+    ) -> List[Tuple[bool, Optional[str], Optional[Dict[str, Any]]]]:
+        """
+        批量记入带键的变动：entries 为 (keys, changes, meta)。
+        任一键已存在（包括同批中更早的条目）时跳过该条目；其余条目一次加锁、一次写入整体原子追加。
+        返回与输入对应的 (是否记入, 命中的已有键, 已有条目的 meta)。
+        """
+        results: List[Tuple[bool, Optional[str], Optional[Dict[str, Any]]]] = []
+        with self._locked(exclusive=True):
+            self._catch_up()
+            seen: Dict[str, Dict[str, Any]] = {}
+            lines = []
+            for keys, changes, meta in entries:
+                hit = next((k for k in keys if k in self._keys or k in seen), None)
+                if hit is not None:
+                    results.append((False, hit, self._keys.get(hit, seen.get(hit))))
+                    continue
+                for k in keys:
+                    seen[k] = meta
+                lines.append({"k": list(keys), "c": [[uid, int(d)] for uid, d in changes], "m": meta})
+                results.append((True, None, None))
+            if lines:
+                self._append_records(lines)
+        return results
+
+    def lookup_key(self, key: str) -> Optional[Dict[str, Any]]:
+        """返回带键记录的 meta；不存在时返回 None"""
+        with self._locked(exclusive=False):
+            self._catch_up()
+            return self._keys.get(key)
+
+    def balances(self) -> Dict[str, int]:
+        """返回当前全部余额的副本"""
+        with self._locked(exclusive=False):
+            self._catch_up()
+            return dict(self._balances)
+
+    def compact(self) -> None:
+        """把当前索引写成快照，并以新一代的空日志替换旧日志"""
+        with self._locked(exclusive=True):
+            self._catch_up()
+            self._compact()
+
+    def close(self) -> None:
+        with self._mutex:
+            for fd in (self._log_fd, self._lock_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._log_fd = self._lock_fd = None
+            self._pid = None
+
+    def __len__(self) -> int:
+        return len(self.balances())
+
+    # ------------------------------------------------------------------
+    # 锁与恢复
+    # ------------------------------------------------------------------
+    def _open(self):
+        """打开锁文件并从快照 + 日志恢复索引（fork 后会重新执行）"""
+        self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._pid = os.getpid()
+        with self._locked(exclusive=True):
+            if (
+                self.legacy_file
+                and os.path.exists(self.legacy_file)
+                and not os.path.exists(self.snapshot_path)
+                and not os.path.exists(self.log_path)
+            ):
+                self._import_legacy()
+            self._reload(repair=True)
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._mutex:
+            if self._pid != os.getpid():
+                # gunicorn preload 后 fork：flock 绑定在打开的文件描述上，
+                # 子进程必须重新打开，否则各 worker 共享同一把锁
+                for fd in (self._log_fd, self._lock_fd):
+                    if fd is not None:
+                        os.close(fd)
+                self._log_fd = self._lock_fd = None
+                self._open()
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _import_legacy(self):
+        with open(self.legacy_file, "r") as f:
+            legacy = json.load(f)
+        balances = {uid: int((user or {}).get("points", 0)) for uid, user in legacy.items()}
+        self._write_snapshot(balances, gen=1)
+
+    def _reload(self, repair: bool = False):
+        """从快照重建索引，然后重放当前日志"""
+        gen, balances, keys = 1, {}, {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                snap = json.load(f)
+            gen, balances, keys = snap.get("gen", 1), snap.get("balances", {}), snap.get("keys", {})
+
+        if self._log_fd is not None:
+            os.close(self._log_fd)
+            self._log_fd = None
+
+        log_gen = self._read_log_gen()
+        if log_gen is None or log_gen < gen:
+            # 没有日志，或压缩时在替换日志前崩溃：旧日志已并入快照，丢弃
+            self._new_log(gen)
+
+        self._log_fd = os.open(self.log_path, os.O_RDWR | os.O_APPEND)
+        self._log_ino = os.fstat(self._log_fd).st_ino
+        self._gen = gen
+        self._balances = balances
+        self._keys = keys
+        self._offset = 0
+        self._records = 0
+
+        if repair:
+            # 截掉崩溃时留下的半行，避免后续追加与其拼接成坏记录
+            data = os.pread(self._log_fd, os.fstat(self._log_fd).st_size, 0)
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                os.ftruncate(self._log_fd, end)
+        self._catch_up()
+
+    def _read_log_gen(self) -> Optional[int]:
+        if not os.path.exists(self.log_path):
+            return None
+        with open(self.log_path, "rb") as f:
+            header = f.readline()
+        try:
+            return int(json.loads(header)["gen"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _catch_up(self):
+        """读取其他进程追加的新记录；如日志已被压缩替换则整体重载"""
+        try:
+            ino = os.stat(self.log_path).st_ino
+        except FileNotFoundError:
+            ino = None
+        if ino != self._log_ino:
+            self._reload()
+            return
+
+        size = os.fstat(self._log_fd).st_size
+        if size <= self._offset:
+            return
+        chunk = os.pread(self._log_fd, size - self._offset, self._offset)
+        end = chunk.rfind(b"\n") + 1  # 只消费完整的行
+        if not end:
+            return
+        for line in chunk[:end].splitlines():
+            self._apply_line(line)
+        self._offset += end
+
+    def _apply_line(self, line: bytes):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            return
+        if "k" in rec:  # 带键记录
+            self._apply_keyed(rec)
+            self._records += 1
+            return
+        uid = rec.get("u")
+        if uid is None:  # 日志头 {"gen": n}
+            return
+        self._balances[uid] = self._balances.get(uid, 0) + rec["d"]
+        self._records += 1
+
+    def _apply_keyed(self, rec):
+        for uid, delta in rec["c"]:
+            self._balances[uid] = self._balances.get(uid, 0) + delta
+        for k in rec["k"]:
+            self._keys[k] = rec.get("m") or {}
+
+    # ------------------------------------------------------------------
+    # 写入与压缩（调用方须持有排他锁且已 _catch_up）
+    # ------------------------------------------------------------------
+    def _append(self, changes: List[Tuple[str, int]]):
+        data = b"".join(
+            json.dumps({"u": uid, "d": delta}, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+            for uid, delta in changes
+        )
+        self._write(data)
+        for uid, delta in changes:
+            self._balances[uid] = self._balances.get(uid, 0) + delta
+        self._records += len(changes)
+        self._maybe_compact()
+
+    def _append_records(self, records: List[Dict[str, Any]]):
+        data = b"".join(
+            json.dumps(rec, ensure_ascii=False, separators=(",", ":")).encode() + b"\n" for rec in records
+        )
+        self._write(data)
+        for rec in records:
+            self._apply_keyed(rec)
+        self._records += len(records)
+        self._maybe_compact()
+
+    def _write(self, data: bytes):
+        os.write(self._log_fd, data)
+        if self.fsync:
+            os.fsync(self._log_fd)
+        self._offset += len(data)
+
+    def _maybe_compact(self):
+        if self.compact_every and self._records >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        gen = self._gen + 1
+        self._write_snapshot(self._balances, gen, self._keys)
+        self._new_log(gen)
+        os.close(self._log_fd)
+        self._log_fd = os.open(self.log_path, os.O_RDWR | os.O_APPEND)
+        self._log_ino = os.fstat(self._log_fd).st_ino
+        self._offset = os.fstat(self._log_fd).st_size
+        self._gen = gen
+        self._records = 0
+
+    def _write_snapshot(self, balances: Dict[str, int], gen: int, keys: Optional[Dict[str, Any]] = None):
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"gen": gen, "balances": balances, "keys": keys or {}}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+
+    def _new_log(self, gen: int):
+        tmp = self.log_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(json.dumps({"gen": gen}).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.log_path)
@@ -1,17 +1,39 @@
 """
 Service: Creative Studio
 Purpose: Generate brand-consistent, commercial-grade visuals via Vertex AI Imagen 3
-Endpoint: /generate-image
+Endpoint: /generate-image（body 带 "async": true 或请求头 Prefer: respond-async 时返回 202 与任务状态地址）
+          /jobs/<job_id>（?wait=N 长轮询）
 Runtime: Flask on Cloud Run
 """
 
+import threading
+
 from flask import Flask, request, jsonify
-import os
-from google.cloud import aiplatform
+from utils.clients import registry
+from utils import jobs
 
 app = Flask(__name__)
-PROJECT_ID = os.getenv("PROJECT_ID", "alert-autumn-467806-j3")
-LOCATION = os.getenv("REGION", "us-central1")
+
+# PROJECT_ID / REGION 由 utils/clients.py 中的 imagen 工厂在首次创建模型句柄时读取
+# 可选预热：CLIENT_WARMUP="imagen" 时在启动阶段加载模型句柄
+registry.warm_up_from_env()
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+def _predict(prompt, **_):
+    return registry.get("imagen", "imagen-3.0-pro").predict(prompt).generated_images[0].uri
+
+def get_jobs():
+    """懒加载任务管理器（JOB_* 环境变量）；独立服务不计费，不预留积分"""
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                manager = jobs.build_from_env(_predict)
+                manager.start_workers(jobs.default_workers())
+                _jobs = manager
+    return _jobs
 
 @app.route("/")
 def home():
@@ -24,14 +46,26 @@ def generate_image():
     prompt = data.get("prompt")
     if not prompt:
         return jsonify({"error": "Missing prompt"}), 400
+    if data.get("async") or "respond-async" in request.headers.get("Prefer", ""):
+        # 任务模式：立即返回，worker 从队列取任务生成，客户端轮询 /jobs/<id>
+        job = get_jobs().submit("anonymous", prompt)
+        status_url = f"/jobs/{job['id']}"
+        resp = jsonify({"job_id": job["id"], "status": job["status"], "status_url": status_url})
+        resp.headers["Location"] = status_url
+        return resp, 202
     try:
-        aiplatform.init(project=PROJECT_ID, location=LOCATION)
-        model = aiplatform.ImageGenerationModel.from_pretrained("imagen-3.0-pro")
-        result = model.predict(prompt)
         return jsonify({
             "prompt": prompt,
-            "image_url": result.generated_images[0].uri,
+            "image_url": _predict(prompt),
             "model": "Vertex AI Imagen 3.0 Pro"
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """任务状态；?wait=N 时长轮询最多 N 秒（上限 30），任务结束立即返回"""
+    job = get_jobs().status(job_id, wait=request.args.get("wait", default=0, type=float))
+    if not job:
+        return jsonify({"error": "NOT_FOUND"}), 404
+    return jsonify(jobs.public_view(job))
@@ -0,0 +1,333 @@
+"""
+utils/media.py
+---------------
+生成图片的存储与二进制下发，替代 JSON 里的 Base64。
+
+- 原图：按内容 SHA-256 只存一份（MEDIA_DIR/originals/<id>）；设置 MEDIA_BUCKET 时同时上传到
+  存储桶，本地缺失（由其他实例生成）时从存储桶取回
+- 下发：GET /media/<id>，send_file 直接交给 wsgi.file_wrapper（gunicorn 下为 sendfile，
+  不经过 Python 拷贝）；强 ETag 由内容哈希与变体参数组成，Cache-Control immutable，
+  If-None-Match → 304、Range → 206 由 werkzeug 处理
+- 变体：?w=512&format=webp|avif|jpeg|png|auto，Pillow 按需生成；宽度向上取整到 VARIANT_WIDTHS
+  的档位且不放大，同一变体的并发请求只生成一次；变体目录按总大小 LRU 淘汰（MEDIA_VARIANT_MAX_MB）
+- format=auto 按 Accept 依次选择 AVIF、WebP、原格式，响应带 Vary: Accept
+- store_result：把模型返回的字节 / data URI（MEDIA_INGEST_GCS=1 时还有 gs:// URI）
+  转成 /media/<id>；其他 URL 原样返回
+"""
+
+import base64
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from flask import Blueprint, abort, jsonify, request, send_file
+
+VARIANT_WIDTHS = (64, 128, 256, 384, 512, 768, 1024, 1536, 2048)
+MAX_AGE = 365 * 24 * 3600
+
+# 格式名 → (Pillow 格式, MIME, 保存参数)
+FORMATS = {
+    "avif": ("AVIF", "image/avif", {"quality": 55, "speed": 8}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+    "png": ("PNG", "image/png", {"optimize": True}),
+}
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+_MEDIA_ID = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URI = re.compile(r"^data:([\w/+.-]+)?(;base64)?,", re.I)
+
+
+def sniff(head: bytes) -> str:
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return "application/octet-stream"
+
+
+def _supported(fmt: str) -> bool:
+    if fmt not in ("avif", "webp"):
+        return True
+    from PIL import features  # 延迟导入：Pillow 为可选依赖
+    return features.check(fmt)
+
+
+class MediaStore:
+    """
+    directory: 本地根目录（originals/ 与 variants/）
+    variant_max_bytes: 变体目录总大小上限，按最近访问淘汰
+    bucket: 可选的存储桶名，原图同时写入 {prefix}<id>
+    """
+
+    def __init__(self, directory: str, variant_max_bytes: int = 1024 * 1024 * 1024,
+                 bucket: Optional[str] = None, prefix: str = "media/"):
+        self.originals = os.path.join(directory, "originals")
+        self.variants = os.path.join(directory, "variants")
+        self.variant_max_bytes = variant_max_bytes
+        self.bucket = bucket
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._stats = {"stored": 0, "deduplicated": 0, "variant_hits": 0, "variants_built": 0, "evictions": 0}
+        os.makedirs(self.originals, exist_ok=True)
+        os.makedirs(self.variants, exist_ok=True)
+        files = []
+        for name in os.listdir(self.variants):
+            if not name.endswith(".tmp"):
+                st = os.stat(os.path.join(self.variants, name))
+                files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+        self._total = sum(self._entries.values())
+
+    # ------------------------------------------------------------------
+    # 原图
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put(self, data: bytes) -> str:
+        """存入原图，返回内容哈希；相同内容只写一次"""
+        media_id = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.originals, media_id)
+        if os.path.exists(path):
+            with self._lock:
+                self._stats["deduplicated"] += 1
+            return media_id
+        self._write(path, data)
+        if self.bucket:
+            from utils.storage import upload_bytes
+            upload_bytes(self.bucket, data, self.prefix + media_id, content_type=sniff(data[:16]))
+        with self._lock:
+            self._stats["stored"] += 1
+        return media_id
+
+    def original_path(self, media_id: str) -> Optional[str]:
+        path = os.path.join(self.originals, media_id)
+        if os.path.exists(path):
+            return path
+        if not self.bucket:
+            return None
+        from utils.storage import get_bucket
+        try:
+            data = get_bucket(self.bucket).blob(self.prefix + media_id).download_as_bytes()
+        except Exception as e:
+            if type(e).__name__ != "NotFound":
+                print(f"[Media Error] {e}")
+            return None
+        if hashlib.sha256(data).hexdigest() != media_id:
+            return None
+        self._write(path, data)
+        return path
+
+    # ------------------------------------------------------------------
+    # 变体
+    # ------------------------------------------------------------------
+    def variant_path(self, media_id: str, width: Optional[int], fmt: str) -> Optional[str]:
+        """返回变体文件路径（按需生成）；原图不存在时返回 None"""
+        name = f"{media_id}-w{width or 0}.{fmt}"
+        path = os.path.join(self.variants, name)
+        with self._lock:
+            if name in self._entries and os.path.exists(path):
+                self._entries.move_to_end(name)
+                self._stats["variant_hits"] += 1
+                return path
+            building = self._building.setdefault(name, threading.Lock())
+        with building:  # 同一变体只生成一次，其余请求等待后直接命中
+            with self._lock:
+                if name in self._entries and os.path.exists(path):
+                    self._entries.move_to_end(name)
+                    self._stats["variant_hits"] += 1
+                    return path
+            try:
+                original = self.original_path(media_id)
+                if original is None:
+                    return None
+                data = self._render(original, width, fmt)
+                self._write(path, data)
+                self._add(name, len(data))
+                return path
+            finally:
+                with self._lock:
+                    self._building.pop(name, None)
+
+    @staticmethod
+    def _render(original: str, width: Optional[int], fmt: str) -> bytes:
+        import io
+        from PIL import Image
+        pil_format, _, options = FORMATS[fmt]
+        with Image.open(original) as img:
+            if width and width < img.width:
+                img.draft("RGB", (width, img.height * width // img.width))  # JPEG 解码时直接降采样
+                img.thumbnail((width, img.height), Image.LANCZOS, reducing_gap=3.0)
+            if pil_format == "JPEG" and img.mode != "RGB":
+                img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+                img = img.convert("RGBA")
+            out = io.BytesIO()
+            img.save(out, pil_format, **options)
+            return out.getvalue()
+
+    def _add(self, name: str, size: int) -> None:
+        with self._lock:
+            self._total += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._stats["variants_built"] += 1
+            while self._total > self.variant_max_bytes and len(self._entries) > 1:
+                old, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                self._stats["evictions"] += 1
+                try:
+                    os.remove(os.path.join(self.variants, old))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "variants": len(self._entries), "variant_bytes": self._total}
+
+
+def snap_width(width: int) -> int:
+    for w in VARIANT_WIDTHS:
+        if w >= width:
+            return w
+    return VARIANT_WIDTHS[-1]
+
+
+def negotiate(accept) -> Optional[str]:
+    """format=auto：按 Accept 中显式列出的类型选择 AVIF > WebP（*/* 不算），都没有时返回 None（原格式）"""
+    listed = {value for value, quality in accept if quality > 0}
+    for fmt in ("avif", "webp"):
+        if FORMATS[fmt][1] in listed and _supported(fmt):
+            return fmt
+    return None
+
+
+# ----------------------------------------------------------------------
+# 模型结果 → /media/<id>
+# ----------------------------------------------------------------------
+def media_url(media_id: str) -> str:
+    return f"/media/{media_id}"
+
+
+def store_result(result: Any) -> Any:
+    """字节 / data URI（以及开启时的 gs:// URI）存入媒体库并返回 /media/<id>，其他结果原样返回"""
+    store = get_media_store()
+    if store is None:
+        if isinstance(result, (bytes, bytearray)):
+            return "data:image/png;base64," + base64.b64encode(result).decode("ascii")
+        return result
+    data = None
+    if isinstance(result, (bytes, bytearray)):
+        data = bytes(result)
+    elif isinstance(result, str):
+        m = _DATA_URI.match(result)
+        if m and m.group(2):
+            data = base64.b64decode(result[m.end():])
+        elif result.startswith("gs://") and os.environ.get("MEDIA_INGEST_GCS") == "1":
+            from utils.storage import get_bucket
+            bucket, _, name = result[5:].partition("/")
+            try:
+                data = get_bucket(bucket).blob(name).download_as_bytes()
+            except Exception as e:
+                print(f"[Media Error] {e}")
+                return result
+    return media_url(store.put(data)) if data is not None else result
+
+
+def media_path(result: Any) -> Optional[str]:
+    """store_result 返回的 /media/<id> 对应的本地原图路径；其他结果返回 None"""
+    store = get_media_store()
+    if store is None or not isinstance(result, str) or not result.startswith("/media/"):
+        return None
+    media_id = result[len("/media/"):]
+    return store.original_path(media_id) if _MEDIA_ID.match(media_id) else None
+
+
+_store = None
+_store_ready = False
+_store_lock = threading.Lock()
+
+
+def get_media_store() -> Optional[MediaStore]:
+    """懒加载：MEDIA_DIR（默认 data/media）、MEDIA_VARIANT_MAX_MB（默认 1024）、MEDIA_BUCKET；MEDIA_ENABLED=0 时为 None"""
+    global _store, _store_ready
+    if not _store_ready:
+        with _store_lock:
+            if not _store_ready:
+                if os.environ.get("MEDIA_ENABLED", "1") != "0":
+                    _store = MediaStore(
+                        os.environ.get("MEDIA_DIR", os.path.join(os.path.dirname(__file__), "../data/media")),
+                        int(os.environ.get("MEDIA_VARIANT_MAX_MB", 1024)) * 1024 * 1024,
+                        bucket=os.environ.get("MEDIA_BUCKET") or None,
+                    )
+                _store_ready = True
+    return _store
+
+
+# ----------------------------------------------------------------------
+# 下发
+# ----------------------------------------------------------------------
+media_bp = Blueprint("media", __name__)
+
+
+def send_media(path: str, mimetype: str, etag: str, vary: bool = False):
+    resp = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=MAX_AGE)
+    resp.cache_control.immutable = True
+    if vary:
+        resp.vary.add("Accept")
+    return resp
+
+
+@media_bp.get("/media/<media_id>")
+def serve_media(media_id):
+    """GET /media/<id>?w=512&format=webp|avif|jpeg|png|auto"""
+    store = get_media_store()
+    if store is None or not _MEDIA_ID.match(media_id):
+        abort(404)
+    width = request.args.get("w", type=int)
+    fmt = (request.args.get("format") or "").lower() or None
+    auto = fmt == "auto"
+    if auto:
+        fmt = negotiate(request.accept_mimetypes)
+    elif fmt is not None and (fmt not in FORMATS or not _supported(fmt)):
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    if width is not None and width <= 0:
+        return jsonify({"error": "Invalid width"}), 400
+    width = snap_width(width) if width else None
+
+    original = store.original_path(media_id)
+    if original is None:
+        abort(404)
+    if width is None and fmt is None:
+        with open(original, "rb") as f:
+            mimetype = sniff(f.read(16))
+        return send_media(original, mimetype, media_id, vary=auto)
+    if fmt is None:  # 只缩放：保持原格式（GIF 等无法写回的格式转为 PNG）
+        with open(original, "rb") as f:
+            fmt = {"image/jpeg": "jpeg", "image/webp": "webp", "image/avif": "avif"}.get(sniff(f.read(16)), "png")
+    path = store.variant_path(media_id, width, fmt)
+    if path is None:
+        abort(404)
+    return send_media(path, FORMATS[fmt][1], f"{media_id}-w{width or 0}-{fmt}", vary=auto)
+
+
+@media_bp.get("/api/media/stats")
+def media_stats():
+    store = get_media_store()
+    return jsonify(store.stats() if store is not None else {"enabled": False})
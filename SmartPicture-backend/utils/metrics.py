@@ -0,0 +1,338 @@
+"""
+utils/metrics.py
+-----------------
+轻量请求埋点：请求中间件 + 阶段计时器 + 固定分桶直方图，Prometheus 文本格式导出。
+
+- 直方图：固定上界（秒），observe 只做一次二分查找和三次加法；标签组合在首次出现时创建
+- 阶段：@timed("verify_token") 或 with metrics.stage("...")，同时记入当前请求的分解，
+  慢请求（METRICS_SLOW_MS，默认 1000）打印一行各阶段耗时
+- 请求：http_request_duration_seconds{method, route, status}，route 取 URL 规则
+  （/api/jobs/<job_id>），不会因路径参数产生大量时间序列；流式响应只计到视图返回
+- 采样剖析：METRICS_PROFILE_RATE（默认 0）比例的请求开启 cProfile，耗时超过慢请求阈值时
+  把 .prof 写入 METRICS_PROFILE_DIR，最多保留 METRICS_PROFILE_KEEP 个；同一时刻只剖析一个请求
+- 其他组件的 stats() 通过 register_gauges 以 gauge 形式一并导出
+- METRICS_ENABLED=0 时计时器直接调用原函数，中间件不注册
+"""
+
+import bisect
+import functools
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_METRIC = "http_request_duration_seconds"
+STAGE_METRIC = "smartpicture_stage_duration_seconds"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        lock = self._lock
+        lock.acquire()  # 显式 acquire / release 比 with 语句少一次上下文管理器协议的开销
+        try:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+        finally:
+            lock.release()
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+_INF = 'le="+Inf"'
+_INVALID_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class _RequestLocal(threading.local):
+    # 类属性作为默认值：请求之外读取 stages 时不走 AttributeError 分支（getattr 默认值很慢）
+    stages = None
+
+
+class Metrics:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, enabled: bool = True):
+        self.buckets = tuple(buckets)
+        self.enabled = enabled
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, str] = {
+            REQUEST_METRIC: "HTTP request latency by route",
+            STAGE_METRIC: "Latency of instrumented request stages",
+        }
+        self._gauges: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+        self._stage_hists: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._local = _RequestLocal()
+
+    # ------------------------------------------------------------------
+    # 记录
+    # ------------------------------------------------------------------
+    def histogram(self, name: str, labels: Labels = ()) -> Histogram:
+        key = (name, labels)
+        h = self._histograms.get(key)
+        if h is None:
+            with self._lock:
+                h = self._histograms.setdefault(key, Histogram(self.buckets))
+        return h
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        self.histogram(name, labels).observe(value)
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def register_gauges(self, prefix: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """导出 stats() 中的数值字段为 {prefix}_{字段} gauge；重复注册同一前缀时替换"""
+        with self._lock:
+            self._gauges = [(p, f) for p, f in self._gauges if p != prefix] + [(prefix, stats)]
+
+    def stage(self, name: str) -> "_StageTimer":
+        hist = self._stage_hists.get(name)
+        if hist is None:
+            hist = self._stage_hists.setdefault(name, self.histogram(STAGE_METRIC, (("stage", name),)))
+        return _StageTimer(self, name, hist)
+
+    def timed(self, name: str):
+        """函数装饰器：每次调用记为一个阶段"""
+        def decorator(fn):
+            hist = self.histogram(STAGE_METRIC, (("stage", name),))
+            observe, local, clock = hist.observe, self._local, time.perf_counter
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                t0 = clock()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    # 与 _record_stage 相同，内联以省去每次调用的方法查找
+                    elapsed = clock() - t0
+                    observe(elapsed)
+                    stages = local.stages
+                    if stages is not None:
+                        stages.append((name, elapsed))
+            return wrapper
+        return decorator
+
+    def _record_stage(self, name: str, hist: Histogram, elapsed: float) -> None:
+        hist.observe(elapsed)
+        stages = self._local.stages
+        if stages is not None:
+            stages.append((name, elapsed))
+
+    # ------------------------------------------------------------------
+    # 请求
+    # ------------------------------------------------------------------
+    def begin_request(self) -> None:
+        self._local.stages = []
+
+    def end_request(self) -> List[Tuple[str, float]]:
+        stages = self._local.stages or []
+        self._local.stages = None
+        return stages
+
+    # ------------------------------------------------------------------
+    # 导出
+    # ------------------------------------------------------------------
+    def render(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = list(self._gauges)
+        lines: List[str] = []
+        last = None
+        for (name, labels), h in histograms:
+            counts, total, count = h.snapshot()
+            if not count:
+                continue
+            if name != last:
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                last = name
+            cumulative = 0
+            for bound, n in zip(h.bounds, counts):
+                cumulative += n
+                le = f'le="{bound:g}"'
+                lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, _INF)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.9g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        last = None
+        for (name, labels), value in counters:
+            if name != last:
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                last = name
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for prefix, stats in gauges:
+            try:
+                values = stats() or {}
+            except Exception as e:
+                print(f"[Metrics Error] {prefix}: {e}")
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)):
+                    name = _INVALID_NAME.sub("_", f"{prefix}_{key}")
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "hist", "t0")
+
+    def __init__(self, metrics: Metrics, name: str, hist: Histogram):
+        self.metrics = metrics
+        self.name = name
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.metrics.enabled:
+            self.metrics._record_stage(self.name, self.hist, time.perf_counter() - self.t0)
+        return False
+
+
+metrics = Metrics(enabled=os.environ.get("METRICS_ENABLED", "1") != "0")
+timed = metrics.timed
+
+
+# ----------------------------------------------------------------------
+# Flask 中间件
+# ----------------------------------------------------------------------
+class _Profiler:
+    """按比例采样 cProfile；cProfile 不支持多个剖析器同时启用，一次只剖析一个请求"""
+
+    def __init__(self, rate: float, directory: str, keep: int):
+        self.rate = rate
+        self.directory = directory
+        self.keep = keep
+        self._busy = threading.Lock()
+        self._seq = itertools.count()
+
+    def maybe_start(self):
+        if self.rate <= 0 or random.random() >= self.rate or not self._busy.acquire(blocking=False):
+            return None
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # 其他剖析工具（调试器、覆盖率）已启用
+            self._busy.release()
+            return None
+        return profiler
+
+    def finish(self, profiler, label: str, elapsed: float, slow: bool) -> Optional[str]:
+        profiler.disable()
+        try:
+            if not slow:
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._seq):06d}-{label}-{elapsed * 1000:.0f}ms.prof")
+            profiler.dump_stats(path)
+            self._prune()
+            return path
+        finally:
+            self._busy.release()
+
+    def _prune(self):
+        files = sorted(f for f in os.listdir(self.directory) if f.endswith(".prof"))
+        for name in files[:max(len(files) - self.keep, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+def init_app(app, registry: Metrics = metrics, path: str = "/metrics") -> None:
+    """注册请求计时钩子与 /metrics；METRICS_ENABLED=0 时不做任何事"""
+    if not registry.enabled:
+        return
+    from flask import Response, g, request
+
+    slow = float(os.environ.get("METRICS_SLOW_MS", 1000)) / 1000
+    profiler = _Profiler(
+        float(os.environ.get("METRICS_PROFILE_RATE", 0)),
+        os.environ.get("METRICS_PROFILE_DIR", os.path.join(os.path.dirname(__file__), "../data/profiles")),
+        int(os.environ.get("METRICS_PROFILE_KEEP", 50)),
+    )
+    registry.describe("smartpicture_slow_requests_total", "Requests slower than METRICS_SLOW_MS")
+    registry.describe("smartpicture_profiles_total", "cProfile dumps written for slow sampled requests")
+
+    @app.before_request
+    def _start_timer():
+        registry.begin_request()
+        g._metrics_profile = profiler.maybe_start()
+        g._metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _stop_timer(response):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is None:
+            return response
+        elapsed = time.perf_counter() - t0
+        stages = registry.end_request()
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        registry.observe(REQUEST_METRIC, elapsed,
+                         (("method", request.method), ("route", route), ("status", str(response.status_code))))
+        is_slow = elapsed >= slow
+        prof = g.pop("_metrics_profile", None)
+        if prof is not None:
+            label = re.sub(r"[^a-zA-Z0-9]+", "_", route).strip("_") or "root"
+            if profiler.finish(prof, label, elapsed, is_slow):
+                registry.inc("smartpicture_profiles_total")
+        if is_slow:
+            registry.inc("smartpicture_slow_requests_total", (("route", route),))
+            breakdown = " ".join(f"{name}={dt * 1000:.1f}ms" for name, dt in stages)
+            print(f"[Slow Request] {request.method} {route} {elapsed * 1000:.0f}ms {breakdown}")
+        return response
+
+    @app.teardown_request
+    def _release_profiler(exc):
+        # after_request 未执行（例如钩子本身抛出异常）时也要停止剖析、释放锁
+        prof = g.pop("_metrics_profile", None)
+        if prof is not None:
+            profiler.finish(prof, "aborted", 0.0, False)
+        registry.end_request()
+
+    @app.get(path)
+    def _metrics_endpoint():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -1,42 +1,91 @@
-import json, os, random
+import os, random, threading
+from utils.ledger import PointsLedger
+from utils.metrics import timed
 
 DATA_FILE = os.path.join(os.path.dirname(__file__), "../data/users.json")
+LEDGER_DIR = os.environ.get("POINTS_LEDGER_DIR", os.path.join(os.path.dirname(__file__), "../data"))
 
-def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {}
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_ledger():
+    """懒加载进程内账本（首次使用时从快照 + 日志恢复，并导入旧版 users.json）"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            # 并发的首个请求只能有一个去回放日志，否则会各持一份内存余额
+            if _ledger is None:
+                _ledger = PointsLedger(
+                    LEDGER_DIR,
+                    compact_every=int(os.environ.get("POINTS_LEDGER_COMPACT_EVERY", 100_000)),
+                    fsync=os.environ.get("POINTS_LEDGER_FSYNC") == "1",
+                    legacy_file=DATA_FILE,
+                )
+    return _ledger
+
+def _reset_after_fork():
+    # fork 时锁可能正被其他线程持有，子进程换一把新锁
+    global _ledger_lock
+    _ledger_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def load_data():
+    """兼容旧接口：返回 {user_id: {"points": n}} 形式的全量数据"""
+    return {uid: {"points": pts} for uid, pts in get_ledger().balances().items()}
 
+@timed("get_points")
 def get_points(user_id):
-    data = load_data()
-    return data.get(user_id, {}).get("points", 0)
+    return get_ledger().get(user_id)
 
 def add_points(user_id, amount):
-    data = load_data()
-    user = data.get(user_id, {"points": 0, "invited_by": None})
-    user["points"] += amount
-    data[user_id] = user
-    save_data(data)
+    get_ledger().add(user_id, amount)
 
 def deduct_points(user_id, cost):
-    data = load_data()
-    user = data.get(user_id, {"points": 0})
-    if user["points"] < cost:
-        return False
-    user["points"] -= cost
-    data[user_id] = user
-    save_data(data)
-    return True
-
-def handle_referral(inviter_id, invitee_id):
-    """裂变逻辑：分享双方都得奖励"""
-    reward_inviter = random.randint(5, 10)
-    reward_invitee = random.randint(3, 8)
-    add_points(inviter_id, reward_inviter)
-    add_points(invitee_id, reward_invitee)
-    return {"inviter_reward": reward_inviter, "invitee_reward": reward_invitee}
+    return get_ledger().deduct(user_id, cost)
+
+def handle_referral(inviter_id, invitee_id, idempotency_key=None):
+    """裂变逻辑：分享双方都得奖励；与批量接口同一规则（拒绝自我邀请、每个被邀请人只奖励一次）"""
+    return handle_referrals([{"inviter_id": inviter_id, "invitee_id": invitee_id,
+                              "idempotency_key": idempotency_key}])[0]
+
+def handle_referrals(pairs):
+    """
+    批量邀请奖励：pairs 为 [{"inviter_id", "invitee_id", "idempotency_key"(可选)}]。
+    每个被邀请人只能获得一次邀请奖励；同一幂等键重试返回首次发放的结果，不重复发放。
+    整批有效奖励在一次加锁、一次写入中原子记入。返回与输入顺序一致的逐条结果，status 为：
+        applied / replayed / duplicate（被邀请人已被邀请过）/ conflict（幂等键已用于其他邀请）
+        / self_referral / invalid
+    """
+    results, entries, pending = [], [], []
+    for pair in pairs:
+        pair = pair if isinstance(pair, dict) else {}
+        inviter = str(pair.get("inviter_id") or "").strip()
+        invitee = str(pair.get("invitee_id") or "").strip()
+        key = pair.get("idempotency_key")
+        result = {"inviter_id": inviter, "invitee_id": invitee, "idempotency_key": key}
+        results.append(result)
+        if not inviter or not invitee:
+            result["status"] = "invalid"
+        elif inviter == invitee:
+            result["status"] = "self_referral"
+        else:
+            meta = {"inviter": inviter, "invitee": invitee, "idem": key,
+                    "inviter_reward": random.randint(5, 10), "invitee_reward": random.randint(3, 8)}
+            keys = ([f"idem:referral:{key}"] if key else []) + [f"referral:{invitee}"]
+            changes = [(inviter, meta["inviter_reward"]), (invitee, meta["invitee_reward"])]
+            entries.append((keys, changes, meta))
+            pending.append((result, meta))
+
+    for (result, meta), (applied, hit, existing) in zip(pending, get_ledger().apply_unique(entries)):
+        if applied:
+            result.update(status="applied", inviter_reward=meta["inviter_reward"], invitee_reward=meta["invitee_reward"])
+        elif hit.startswith("idem:") and (existing["inviter"], existing["invitee"]) == (meta["inviter"], meta["invitee"]):
+            result.update(status="replayed", inviter_reward=existing["inviter_reward"],
+                          invitee_reward=existing["invitee_reward"])
+        elif hit.startswith("idem:"):
+            result["status"] = "conflict"
+        else:
+            result.update(status="duplicate", referred_by=existing["inviter"])
+    return results
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from utils.points import handle_referral
+from utils.points import handle_referral, handle_referrals
 
 referral_bp = Blueprint("referral", __name__)
 
@@ -13,8 +13,35 @@ def referral():
     if not inviter or not invitee:
         return jsonify({"error": "缺少邀请人或被邀请人 ID"}), 400
 
-    result = handle_referral(inviter, invitee)
-    return jsonify({
-        "message": "🎉 邀请成功！双方已获得奖励",
-        "details": result
-    }), 200
+    result = handle_referral(inviter, invitee, data.get("idempotency_key"))
+    status = result["status"]
+    if status in ("applied", "replayed"):
+        return jsonify({
+            "message": "🎉 邀请成功！双方已获得奖励",
+            "details": result
+        }), 200
+    if status == "self_referral":
+        return jsonify({"error": "不能邀请自己", "details": result}), 400
+    if status == "duplicate":
+        return jsonify({"error": "该用户已被邀请过", "details": result}), 409
+    if status == "conflict":
+        return jsonify({"error": "幂等键已用于其他邀请", "details": result}), 409
+    return jsonify({"error": "缺少邀请人或被邀请人 ID", "details": result}), 400
+
+MAX_BATCH = 10_000
+
+@referral_bp.route("/api/referral/batch", methods=["POST"])
+def referral_batch():
+    """批量邀请：按幂等键去重，拒绝自我邀请与重复邀请，有效奖励一次原子记入，逐条返回结果"""
+    data = request.get_json(force=True)
+    pairs = data.get("referrals") if isinstance(data, dict) else None
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify({"error": "缺少 referrals 列表"}), 400
+    if len(pairs) > MAX_BATCH:
+        return jsonify({"error": f"单次最多 {MAX_BATCH} 条"}), 400
+
+    results = handle_referrals(pairs)
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return jsonify({"results": results, "counts": counts}), 200
@@ -1,8 +1,49 @@
 # utils/seo.py
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
+import json
 import re
 
+from utils.metrics import timed
+
+
+DEFAULT_KEYWORDS = ("AI", "SmartPicture", "Growth", "Content", "SEO", "AEO")
+HREFLANGS = ("zh-CN", "en-US", "ja-JP")
+
+# 按顺序匹配：先图片、再视频、音频、文本
+_CONTENT_HINTS = (
+    ("ImageObject", ("jpg", "jpeg", "png", "webp", "image")),
+    ("VideoObject", ("mp4", "video", "clip", "youtube")),
+    ("AudioObject", ("mp3", "audio", "podcast")),
+    ("Article", ("text", "content", "article", "blog")),
+)
+_SCHEMA_TYPES = {t for t, _ in _CONTENT_HINTS} | {"CreativeWork"}
+_DECLARED_TYPE_FIELDS = ("@type", "content_type", "mime_type", "type")
+# 只检查短字符串值（URL、MIME、文件名）；正文与 base64 图片不参与识别
+_MAX_HINT_VALUE = 256
+_MAX_HINT_ITEMS = 8
+
+_TITLE_PATTERN = re.compile(r"(AI|智能|SmartPicture|Growth|Content|工具)")
+
+_PUBLISHER = {"@type": "Organization", "name": "AI Growth Tools Matrix", "url": "https://ai-growth-tools.com"}
+_AUTHOR = {"@type": "Organization", "name": "SmartPicture AI"}
+
+
+def _collect_hints(value: Any, parts: List[str], depth: int = 0) -> None:
+    if isinstance(value, dict):
+        for i, (k, v) in enumerate(value.items()):
+            if i >= _MAX_HINT_ITEMS * 4:
+                break
+            parts.append(str(k))
+            if depth < 2:
+                _collect_hints(v, parts, depth + 1)
+    elif isinstance(value, (list, tuple)):
+        for v in value[:_MAX_HINT_ITEMS]:
+            _collect_hints(v, parts, depth + 1)
+    elif isinstance(value, str) and len(value) <= _MAX_HINT_VALUE:
+        parts.append(value)
+
 
 def detect_content_type(data: Dict[str, Any]) -> str:
     """
@@ -12,19 +53,24 @@ def detect_content_type(data: Dict[str, Any]) -> str:
     - 音频类 → AudioObject
     - 文本类 → Article
     - 其他 → CreativeWork
+
+    依据声明字段（@type / content_type / mime_type）、字段名与短字符串值识别，
+    不再对整个负载做 str()，长文章与 base64 图片的开销与负载大小无关。
     """
     if not data:
         return "CreativeWork"
 
-    content_str = str(data).lower()
-    if any(k in content_str for k in ["jpg", "jpeg", "png", "webp", "image"]):
-        return "ImageObject"
-    if any(k in content_str for k in ["mp4", "video", "clip", "youtube"]):
-        return "VideoObject"
-    if any(k in content_str for k in ["mp3", "audio", "podcast"]):
-        return "AudioObject"
-    if any(k in content_str for k in ["text", "content", "article", "blog"]):
-        return "Article"
+    for field in _DECLARED_TYPE_FIELDS:
+        declared = data.get(field)
+        if isinstance(declared, str) and declared in _SCHEMA_TYPES:
+            return declared
+
+    parts: List[str] = []
+    _collect_hints(data, parts)
+    signature = " ".join(parts).lower()
+    for content_type, hints in _CONTENT_HINTS:
+        if any(k in signature for k in hints):
+            return content_type
 
     return "CreativeWork"
 
@@ -49,7 +95,7 @@ def evaluate_seo_health(title: str, description: str, keywords: List[str]) -> Di
         score -= 10
         suggestions.append("关键词数量较少，建议至少提供3-5个。")
 
-    if not re.search(r"(AI|智能|SmartPicture|Growth|Content|工具)", title):
+    if not _TITLE_PATTERN.search(title):
         score -= 5
         suggestions.append("标题中缺少核心品牌词或主题关键词。")
 
@@ -59,6 +105,136 @@ def evaluate_seo_health(title: str, description: str, keywords: List[str]) -> Di
     }
 
 
+@lru_cache(maxsize=1024)
+def _cached_health(title: str, description: str, keywords: tuple) -> Dict[str, Any]:
+    # 各服务的标题 / 关键词基本固定，评分结果可以复用（返回值按只读对待）
+    return evaluate_seo_health(title, description, list(keywords))
+
+
+# 复用同一个编码器：json.dumps 带非默认参数时每次调用都会新建 JSONEncoder
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _dumps(value: Any) -> bytes:
+    return _encode(value).encode("utf-8")
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+class SeoEnvelopeBuilder:
+    """
+    预编译的 SEO 封装器：provider / publisher / author / hreflang 等与请求无关的部分
+    按 canonical + lang + region 只构建一次，并预先编码为 JSON 片段。
+    - build()：返回 dict，与 build_seo_response 结构一致（嵌套的静态部分为共享对象，只读）
+    - build_json()：直接拼接 UTF-8 JSON 字节，跳过中间 dict 与 Flask 的排序序列化。
+      data 只序列化一次；MB 级 ASCII 负载（base64 图片）的耗时由这一次序列化主导，
+      与 jsonify 持平，收益主要在小负载与中文长文（输出不做 \\uXXXX 转义，体积约减半）
+    """
+
+    def __init__(self, canonical: str, lang: str, region: str):
+        self.canonical = canonical
+        self.lang = lang
+        self.region = region
+        self._provider = {"@type": "Organization", "name": "SmartPicture Growth Hub", "url": canonical}
+        self._hreflang_links = [{"hreflang": h, "href": f"{canonical}/{h}"} for h in HREFLANGS]
+
+        self._j_lang = _dumps(lang)
+        self._j_region = _dumps(region)
+        self._j_canonical = _dumps(canonical)
+        self._j_orgs = (b',"provider":' + _dumps(self._provider) + b',"publisher":' + _dumps(_PUBLISHER)
+                        + b',"author":' + _dumps(_AUTHOR) + b"}")
+        self._j_hreflang_links = _dumps(self._hreflang_links)
+
+    @staticmethod
+    def _prepare(data, title, description, keywords, content_type):
+        keywords = tuple(keywords) if keywords else DEFAULT_KEYWORDS
+        description = (description or "")[:180]
+        content_type = content_type or detect_content_type(data)
+        return keywords, description, content_type, _cached_health(title, description, keywords)
+
+    def build(
+        self,
+        data: Optional[Dict[str, Any]] = None,
+        title: str = "AI Generated Content",
+        description: str = "",
+        keywords: Optional[List[str]] = None,
+        content_type: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        keywords, description, content_type, seo_eval = self._prepare(data, title, description, keywords, content_type)
+        now = _utc_now()
+        response = {
+            "status": "ok",
+            "title": title,
+            "description": description,
+            "keywords": ", ".join(keywords),
+            "canonical": self.canonical,
+            "hreflang": self.lang,
+            "region": self.region,
+            "created_at": now,
+            "structured_data": {
+                "@context": "https://schema.org",
+                "@type": content_type,
+                "headline": title,
+                "description": description,
+                "keywords": list(keywords),
+                "inLanguage": self.lang,
+                "contentLocation": self.region,
+                "datePublished": now,
+                "provider": self._provider,
+                "publisher": _PUBLISHER,
+                "author": _AUTHOR,
+            },
+            "hreflang_links": self._hreflang_links,
+            "seo_analysis": seo_eval,
+        }
+        if data:
+            response["data"] = data
+        return response
+
+    def build_json(
+        self,
+        data: Optional[Dict[str, Any]] = None,
+        title: str = "AI Generated Content",
+        description: str = "",
+        keywords: Optional[List[str]] = None,
+        content_type: Optional[str] = None,
+    ) -> bytes:
+        keywords, description, content_type, seo_eval = self._prepare(data, title, description, keywords, content_type)
+        j_title, j_desc, j_now = _dumps(title), _dumps(description), _dumps(_utc_now())
+        parts = [
+            b'{"status":"ok","title":', j_title,
+            b',"description":', j_desc,
+            b',"keywords":', _dumps(", ".join(keywords)),
+            b',"canonical":', self._j_canonical,
+            b',"hreflang":', self._j_lang,
+            b',"region":', self._j_region,
+            b',"created_at":', j_now,
+            b',"structured_data":{"@context":"https://schema.org","@type":', _dumps(content_type),
+            b',"headline":', j_title,
+            b',"description":', j_desc,
+            b',"keywords":', _dumps(keywords),
+            b',"inLanguage":', self._j_lang,
+            b',"contentLocation":', self._j_region,
+            b',"datePublished":', j_now,
+            self._j_orgs,
+            b',"hreflang_links":', self._j_hreflang_links,
+            b',"seo_analysis":', _dumps(seo_eval),
+        ]
+        if data:
+            parts += [b',"data":', _dumps(data)]
+        parts.append(b"}")
+        return b"".join(parts)
+
+
+@lru_cache(maxsize=64)
+def envelope_builder(canonical: str = "https://ai-growth-tools.com", lang: str = "zh-CN", region: str = "CN") -> SeoEnvelopeBuilder:
+    """按 canonical / lang / region 复用预编译的封装器"""
+    return SeoEnvelopeBuilder(canonical, lang, region)
+
+
+@timed("build_seo_response")
 def build_seo_response(
     data: Optional[Dict[str, Any]] = None,
     title: str = "AI Generated Content",
@@ -67,72 +243,28 @@ def build_seo_response(
     lang: str = "zh-CN",
     region: str = "CN",
     canonical: str = "https://ai-growth-tools.com",
+    content_type: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     🚀 SmartPicture Growth Hub
-    智能 SEO + AEO + GEO 响应封装器（v4）
-    - 自动识别内容类型
+    智能 SEO + AEO + GEO 响应封装器（v5）
+    - 自动识别内容类型（也可通过 content_type 显式声明）
     - 自动生成结构化Schema
     - 自动计算SEO健康度评分
     - 自动添加多语言与GEO信息
     """
+    return envelope_builder(canonical, lang, region).build(data, title, description, keywords, content_type)
 
-    keywords = keywords or ["AI", "SmartPicture", "Growth", "Content", "SEO", "AEO"]
-    description = (description or "")[:180]
-    content_type = detect_content_type(data)
-
-    # 计算SEO健康度
-    seo_eval = evaluate_seo_health(title, description, keywords)
-
-    # Schema.org 结构化数据
-    structured_data = {
-        "@context": "https://schema.org",
-        "@type": content_type,
-        "headline": title,
-        "description": description,
-        "keywords": keywords,
-        "inLanguage": lang,
-        "contentLocation": region,
-        "datePublished": datetime.utcnow().isoformat() + "Z",
-        "provider": {
-            "@type": "Organization",
-            "name": "SmartPicture Growth Hub",
-            "url": canonical
-        },
-        "publisher": {
-            "@type": "Organization",
-            "name": "AI Growth Tools Matrix",
-            "url": "https://ai-growth-tools.com"
-        },
-        "author": {
-            "@type": "Organization",
-            "name": "SmartPicture AI"
-        }
-    }
 
-    # 多语言 GEO hreflang 支持
-    hreflang_links = [
-        {"hreflang": "zh-CN", "href": f"{canonical}/zh-CN"},
-        {"hreflang": "en-US", "href": f"{canonical}/en-US"},
-        {"hreflang": "ja-JP", "href": f"{canonical}/ja-JP"},
-    ]
-
-    # 最终封装响应
-    response = {
-        "status": "ok",
-        "title": title,
-        "description": description,
-        "keywords": ", ".join(keywords),
-        "canonical": canonical,
-        "hreflang": lang,
-        "region": region,
-        "created_at": datetime.utcnow().isoformat() + "Z",
-        "structured_data": structured_data,
-        "hreflang_links": hreflang_links,
-        "seo_analysis": seo_eval,  # ← 包含分数与建议
-    }
-
-    if data:
-        response["data"] = data
-
-    return response
+def build_seo_json(
+    data: Optional[Dict[str, Any]] = None,
+    title: str = "AI Generated Content",
+    description: str = "",
+    keywords: Optional[List[str]] = None,
+    lang: str = "zh-CN",
+    region: str = "CN",
+    canonical: str = "https://ai-growth-tools.com",
+    content_type: Optional[str] = None,
+) -> bytes:
+    """与 build_seo_response 相同，但直接返回 UTF-8 JSON 字节，可作为 Flask Response 的 body"""
+    return envelope_builder(canonical, lang, region).build_json(data, title, description, keywords, content_type)
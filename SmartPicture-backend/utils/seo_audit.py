@@ -0,0 +1,325 @@
+"""
+utils/seo_audit.py
+-------------------
+批量 SEO / AEO 审计：对文章库（data/insights.json）或大型 JSONL 导出逐条调用
+evaluate_seo_health 与 detect_content_type。
+
+- 流式读取：JSON 数组与 JSONL 都不会整体载入内存
+- 进程池并行：记录按批分发；JSONL 行以原始文本分发，解析也在子进程中完成；
+  在途批次数有上限，读入速度不会超过消化速度。workers ≤ 1（或单核机器上未指定）时
+  在当前进程内逐批审计——单个 worker 的进程池只多出跨进程传输与序列化，比直接计算慢
+- 增量输出：结果按输入顺序逐批写入 JSONL 或 CSV
+- 增量重跑：--state 记录每条记录的内容哈希，下次运行跳过未变化的记录并沿用上次输出中的结果；
+  状态文件定期落盘，中途崩溃不会丢失全部进度
+
+用法（在 SmartPicture-backend 目录下）：
+    python -m utils.seo_audit ../data/insights.json -o audit.jsonl
+    python -m utils.seo_audit export.jsonl -o audit.csv --state audit.state --workers 8
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.seo import detect_content_type, evaluate_seo_health
+
+CSV_FIELDS = ("id", "hash", "content_type", "seo_score", "title", "suggestions", "error")
+
+_READ_CHUNK = 1 << 20
+STATE_SAVE_INTERVAL = 5.0  # 秒
+_PREVIOUS: Dict[str, str] = {}
+_FORMAT = "jsonl"
+
+
+# ----------------------------------------------------------------------
+# 读取
+# ----------------------------------------------------------------------
+def _iter_json_array(f) -> Iterator[Any]:
+    """逐个解析顶层 JSON 数组中的元素，缓冲区只保留尚未解析的部分"""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(_READ_CHUNK)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    fill()
+    skip(" \t\r\n﻿")
+    if buf[pos:pos + 1] != "[":
+        raise ValueError("Expected a JSON array or JSONL input")
+    pos += 1
+    while True:
+        skip(" \t\r\n,")
+        if pos >= len(buf):
+            raise ValueError("Unexpected end of JSON array")
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()  # 元素跨越了缓冲区边界
+            continue
+        # 数字等标量在边界处可能被截断，多读一块再解析
+        if end == len(buf) and not eof:
+            fill()
+            continue
+        pos = end
+        yield item
+
+
+def iter_records(path: str) -> Iterator[Any]:
+    """按文件内容识别 JSON 数组或 JSONL；JSONL 逐行返回原始文本（由子进程解析）"""
+    with open(path, encoding="utf-8") as f:
+        head = f.read(64).lstrip("﻿ \t\r\n")
+        f.seek(0)
+        if head.startswith("["):
+            yield from _iter_json_array(f)
+            return
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ----------------------------------------------------------------------
+# 审计（在子进程中执行）
+# ----------------------------------------------------------------------
+def content_hash(record: Dict[str, Any]) -> str:
+    raw = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def audit_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """对单条记录评分；字段兼容 insights.json（seoTitle / seoDescription / summary）"""
+    title = record.get("seoTitle") or record.get("title") or ""
+    description = record.get("seoDescription") or record.get("description") or record.get("summary") or ""
+    keywords = record.get("keywords") or []
+    if isinstance(keywords, str):
+        keywords = [k.strip() for k in keywords.split(",") if k.strip()]
+    health = evaluate_seo_health(title, description, keywords)
+    return {
+        "content_type": detect_content_type(record),
+        "seo_score": health["seo_score"],
+        "title": title,
+        "suggestions": health["suggestions"],
+    }
+
+
+def _init_worker(previous: Dict[str, str], fmt: str):
+    global _PREVIOUS, _FORMAT
+    _PREVIOUS, _FORMAT = previous, fmt
+
+
+def format_rows(rows: List[Dict[str, Any]], fmt: str) -> str:
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore").writerows(
+            {**r, "suggestions": "；".join(r.get("suggestions") or [])} for r in rows)
+        return buf.getvalue()
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+
+
+def _audit_batch(batch: List[Any], offset: int) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]], int, int]:
+    """
+    返回 (输出片段, [(id, hash)], 跳过数, 错误数)。输出片段按输入顺序排列：
+    ("text", 已格式化的行) 或 ("carry", id)——后者为未变化的记录，由父进程写入上次的结果。
+    输出在子进程中格式化，父进程只负责按顺序写入与更新状态。
+    """
+    pieces, rows, hashes, skipped, errors = [], [], [], 0, 0
+
+    def flush():
+        if rows:
+            pieces.append(("text", format_rows(rows, _FORMAT)))
+            rows.clear()
+
+    for i, item in enumerate(batch, offset):
+        try:
+            if isinstance(item, str):
+                record = json.loads(item)
+                # JSONL 直接对原始行取哈希，省去一次排序序列化
+                digest = hashlib.blake2b(item.strip().encode(), digest_size=16).hexdigest()
+            else:
+                record, digest = item, None
+            if not isinstance(record, dict):
+                raise ValueError("record is not an object")
+        except ValueError as e:
+            rows.append({"id": f"#{i}", "hash": None, "error": str(e)})
+            errors += 1
+            continue
+        rid = str(record.get("id") or record.get("slug") or f"#{i}")
+        digest = digest or content_hash(record)
+        if _PREVIOUS.get(rid) == digest:
+            skipped += 1
+            flush()
+            pieces.append(("carry", rid))
+            continue
+        rows.append({"id": rid, "hash": digest, **audit_record(record), "error": None})
+        hashes.append((rid, digest))
+    flush()
+    return pieces, hashes, skipped, errors
+
+
+# ----------------------------------------------------------------------
+# 输出与状态
+# ----------------------------------------------------------------------
+def load_state(path: Optional[str]) -> Dict[str, str]:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_previous_rows(path: str, fmt: str) -> Dict[str, str]:
+    """
+    上次输出中每条成功记录的已格式化文本（按 id）。跳过的记录原样带到新输出中；
+    输出文件不存在或无法解析时返回空字典，此时所有记录都会重新审计。
+    """
+    rows: Dict[str, str] = {}
+    if path == "-" or not os.path.exists(path):
+        return rows
+    try:
+        with open(path, encoding="utf-8", newline="") as f:
+            if fmt == "csv":
+                for row in csv.DictReader(f):
+                    if row.get("id") and not row.get("error"):
+                        buf = io.StringIO()
+                        csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore").writerow(row)
+                        rows[row["id"]] = buf.getvalue()
+            else:
+                for line in f:
+                    row = json.loads(line)
+                    if row.get("id") and not row.get("error"):
+                        rows[str(row["id"])] = line if line.endswith("\n") else line + "\n"
+    except (ValueError, csv.Error, AttributeError) as e:
+        print(f"[SEO Audit] previous output unreadable, re-auditing everything: {e}", file=sys.stderr)
+        return {}
+    return rows
+
+
+def save_state(path: str, state: Dict[str, str]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def run_audit(
+    input_path: str,
+    output_path: str,
+    fmt: str = "jsonl",
+    workers: Optional[int] = None,
+    batch_size: int = 2000,
+    state_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    执行审计并返回统计：total / scored / skipped / errors / seconds。
+    使用 state_path 时，未变化的记录沿用上次输出中的结果（输出到 stdout 时只输出变化的记录）；
+    状态文件每 STATE_SAVE_INTERVAL 秒落盘一次，中途崩溃后重跑只会重新审计缺少结果的记录。
+    """
+    previous = load_state(state_path)
+    state = dict(previous)
+    carried: Dict[str, str] = {}
+    if previous and output_path != "-":
+        # 先读入上次的结果再覆盖写输出；只跳过确实能带过来结果的记录
+        carried = load_previous_rows(output_path, fmt)
+        previous = {rid: h for rid, h in previous.items() if rid in carried}
+    stats = {"total": 0, "scored": 0, "skipped": 0, "errors": 0}
+    workers = workers or os.cpu_count() or 1
+    last_save = time.monotonic()
+    out = open(output_path, "w", encoding="utf-8", newline="") if output_path != "-" else sys.stdout
+    if fmt == "csv":
+        out.write(",".join(CSV_FIELDS) + "\r\n")
+    t0 = time.perf_counter()
+
+    def collect(result):
+        nonlocal last_save
+        pieces, hashes, skipped, errors = result
+        stats["skipped"] += skipped
+        stats["errors"] += errors
+        stats["scored"] += len(hashes)
+        state.update(hashes)
+        out.write("".join(value if kind == "text" else carried.get(value, "") for kind, value in pieces))
+        out.flush()
+        if state_path and time.monotonic() - last_save >= STATE_SAVE_INTERVAL:
+            save_state(state_path, state)
+            last_save = time.monotonic()
+
+    try:
+        if workers <= 1:
+            _init_worker(previous, fmt)
+            try:
+                for batch in _batches(iter_records(input_path), batch_size):
+                    offset = stats["total"]
+                    stats["total"] += len(batch)
+                    collect(_audit_batch(batch, offset))
+            finally:
+                _init_worker({}, "jsonl")
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(previous, fmt)) as pool:
+                in_flight = deque()
+                for batch in _batches(iter_records(input_path), batch_size):
+                    in_flight.append(pool.submit(_audit_batch, batch, stats["total"]))
+                    stats["total"] += len(batch)
+                    # 限制在途批次，按提交顺序写出
+                    while len(in_flight) >= workers * 2:
+                        collect(in_flight.popleft().result())
+                while in_flight:
+                    collect(in_flight.popleft().result())
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if state_path:
+        save_state(state_path, state)
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量 SEO / AEO 审计（JSON 数组或 JSONL）")
+    parser.add_argument("input", help="JSON 数组或 JSONL 文件")
+    parser.add_argument("-o", "--output", default="-", help="输出文件，默认 stdout")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="默认按输出文件扩展名判断")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数；≤1 时在当前进程内审计")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--state", help="内容哈希状态文件；存在时跳过未变化的记录")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    stats = run_audit(args.input, args.output, fmt, args.workers, args.batch_size, args.state)
+    print(json.dumps(stats, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
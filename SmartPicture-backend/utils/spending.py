@@ -0,0 +1,187 @@
+"""
+utils/spending.py
+------------------
+Firestore 积分消费：预留（reserve）→ 提交（commit）/ 退款（refund）。
+
+- reserve：一次原子批量提交，同时扣减 users/{uid}.points 并写入
+  transactions/{id}（status=reserved）。通过 last_update_time 前置条件
+  做乐观并发控制：余额在读取后被其他请求改动时整批提交失败并重试，
+  因此不会超扣。进程内缓存每个用户最近一次已知的余额与 update_time，
+  热路径上预留只需一次往返。
+- commit / refund：模型调用结束后用一次批量写完成结算；生成失败时
+  spend() 会自动退款。传入 log_writer 时，commit 只是交易日志的状态
+  变更，交给后台批量写入；退款涉及余额，始终同步写。
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from utils.metrics import timed
+
+
+class InsufficientPoints(Exception):
+    """余额不足以支付本次消费"""
+
+    def __init__(self, balance: int, cost: int):
+        super().__init__(f"INSUFFICIENT_POINTS: balance={balance}, cost={cost}")
+        self.balance = balance
+        self.cost = cost
+
+
+class ReservationConflict(Exception):
+    """并发冲突重试次数耗尽"""
+
+
+class Reservation:
+    def __init__(self, uid: str, cost: int, tx_ref, meta: Dict[str, Any]):
+        self.uid = uid
+        self.cost = cost
+        self.tx_ref = tx_ref
+        self.meta = meta
+        self.status = "reserved"
+
+    @property
+    def tx_id(self) -> str:
+        return self.tx_ref.id
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可序列化形式，用于在其他进程（例如异步任务 worker）中结算"""
+        return {"uid": self.uid, "cost": self.cost, "tx_id": self.tx_id, "meta": self.meta}
+
+
+class PointsSpender:
+    """
+    db: firestore.Client（或进程内替身）
+    fs: 提供 Increment / SERVER_TIMESTAMP 的模块，默认 google.cloud.firestore
+    conflict_error: 前置条件失败时抛出的异常类型，默认 api_core 的 FailedPrecondition
+    log_writer: 可选的 TransactionLogWriter，用于缓冲 commit 写入
+    """
+
+    def __init__(self, db, fs=None, conflict_error=None, log_writer=None,
+                 max_retries: int = 5, cache_size: int = 10_000):
+        if fs is None:
+            from google.cloud import firestore as fs
+        if conflict_error is None:
+            from google.api_core.exceptions import FailedPrecondition as conflict_error
+        self.db = db
+        self.fs = fs
+        self.conflict_error = conflict_error
+        self.log_writer = log_writer
+        self.max_retries = max_retries
+        self.cache_size = cache_size
+        self._known: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 余额缓存（只用于省掉读取；正确性由前置条件保证）
+    # ------------------------------------------------------------------
+    def _remember(self, uid, balance, update_time):
+        with self._lock:
+            self._known[uid] = (balance, update_time)
+            self._known.move_to_end(uid)
+            while len(self._known) > self.cache_size:
+                self._known.popitem(last=False)
+
+    def _forget(self, uid):
+        with self._lock:
+            self._known.pop(uid, None)
+
+    def _lookup(self, uid):
+        with self._lock:
+            return self._known.get(uid)
+
+    def _read(self, uid):
+        snap = self.db.collection("users").document(uid).get()
+        balance = (snap.to_dict() or {}).get("points", 0)
+        if snap.exists:
+            self._remember(uid, balance, snap.update_time)
+        return balance, snap.update_time
+
+    # ------------------------------------------------------------------
+    # 预留 / 结算
+    # ------------------------------------------------------------------
+    @timed("points_reserve")
+    def reserve(self, uid: str, cost: int, meta: Optional[Dict[str, Any]] = None) -> Reservation:
+        meta = meta or {}
+        user_ref = self.db.collection("users").document(uid)
+        for _ in range(self.max_retries):
+            known = self._lookup(uid)
+            balance, update_time = known if known else self._read(uid)
+            if balance < cost and known:
+                # 缓存可能落后于其他实例的充值，余额不足时以最新读取为准
+                balance, update_time = self._read(uid)
+            if balance < cost:
+                raise InsufficientPoints(balance, cost)
+
+            tx_ref = self.db.collection("transactions").document()
+            batch = self.db.batch()
+            batch.update(user_ref, {
+                "points": self.fs.Increment(-cost),
+                "lastActiveAt": self.fs.SERVER_TIMESTAMP,
+            }, option=self.db.write_option(last_update_time=update_time))
+            batch.set(tx_ref, {
+                "uid": uid, "type": "spend", "amount": -cost, "meta": meta,
+                "status": "reserved",
+                "createdAt": self.fs.SERVER_TIMESTAMP,
+            })
+            try:
+                results = batch.commit()
+            except self.conflict_error:
+                self._forget(uid)
+                continue
+            self._remember(uid, balance - cost, results[0].update_time)
+            return Reservation(uid, cost, tx_ref, meta)
+        raise ReservationConflict(f"too much contention reserving points for {uid}")
+
+    def restore(self, data: Dict[str, Any]) -> Reservation:
+        """由 Reservation.to_dict() 的结果重建预留，之后可正常 commit / refund"""
+        tx_ref = self.db.collection("transactions").document(data["tx_id"])
+        return Reservation(data["uid"], data["cost"], tx_ref, data.get("meta") or {})
+
+    @timed("points_commit")
+    def commit(self, reservation: Reservation, meta: Optional[Dict[str, Any]] = None) -> None:
+        """确认消费：一次批量写把交易标记为 committed"""
+        update = {"status": "committed", "settledAt": self.fs.SERVER_TIMESTAMP}
+        if meta:
+            update["meta"] = {**reservation.meta, **meta}
+        if self.log_writer is not None:
+            self.log_writer.update(reservation.tx_ref, update)
+        else:
+            batch = self.db.batch()
+            batch.update(reservation.tx_ref, update)
+            batch.commit()
+        reservation.status = "committed"
+
+    @timed("points_refund")
+    def refund(self, reservation: Reservation, reason: str = "") -> None:
+        """退款：一次批量写同时返还积分并把交易标记为 refunded"""
+        batch = self.db.batch()
+        batch.set(self.db.collection("users").document(reservation.uid), {
+            "points": self.fs.Increment(reservation.cost),
+        }, merge=True)
+        batch.update(reservation.tx_ref, {
+            "status": "refunded",
+            "refundReason": reason[:200],
+            "settledAt": self.fs.SERVER_TIMESTAMP,
+        })
+        batch.commit()
+        self._forget(reservation.uid)
+        reservation.status = "refunded"
+
+    @contextmanager
+    def spend(self, uid: str, cost: int, meta: Optional[Dict[str, Any]] = None):
+        """
+        with spender.spend(uid, 10, {...}) as r:
+            content = generate_content(...)
+        代码块正常结束则提交，抛出异常则自动退款并继续抛出。
+        """
+        reservation = self.reserve(uid, cost, meta)
+        try:
+            yield reservation
+        except BaseException as e:
+            self.refund(reservation, reason=f"{type(e).__name__}: {e}")
+            raise
+        if reservation.status == "reserved":
+            self.commit(reservation)
@@ -1,14 +1,421 @@
+"""
+utils/storage.py
+-----------------
+对象存储：内存 / 流式上传、大对象并行分块上传、批量上传、签名 URL 缓存。
+
+- upload_bytes：接受 bytes / bytearray / memoryview / 类文件对象 / 字节迭代器，不经临时文件
+- 大于 PARALLEL_THRESHOLD 的对象走并行组合上传：切成若干部分对象并行上传，
+  再用 compose（单次最多 32 个源）合并成目标对象并删除部分对象。
+  组合对象只有 CRC32C 校验值，没有 MD5
+- upload_many：多个对象在线程池中并行上传，逐个返回结果，单个失败不影响其他对象
+- generate_signed_url：签名结果按 (bucket, blob, method) 缓存，剩余有效期不足
+  请求有效期的一半时才重新签名（Cloud Run 上 v4 签名需要一次 IAM signBlob 调用）
+
+设置 STORAGE_LOCAL_DIR 时 get_bucket() 返回本地目录实现的 LocalBucket，
+用于本地开发与基准测试，无需 GCS 凭据。
+"""
+
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from utils.clients import registry
+
+PARALLEL_THRESHOLD = 32 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024 * 1024
+MAX_COMPOSE_SOURCES = 32
+_READ_SIZE = 1024 * 1024
+
+
+class NotFound(Exception):
+    """与 google.api_core.exceptions.NotFound 同名，调用方可按类名统一处理"""
+
+
+# ----------------------------------------------------------------------
+# 本地文件系统实现（GCS Bucket / Blob 的子集）
+# ----------------------------------------------------------------------
+class LocalBlob:
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+        self.path = os.path.join(bucket.root, name)
+
+    @property
+    def size(self) -> Optional[int]:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else None
+
+    def _write(self, chunks: Iterable[bytes], throttle: bool = True) -> None:
+        self.bucket._request()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                if throttle:
+                    self.bucket._transfer(len(chunk))
+                f.write(chunk)
+        os.replace(tmp, self.path)
+
+    def upload_from_file(self, file_obj, size=None, content_type=None, rewind=False, **kw) -> None:
+        if rewind:
+            file_obj.seek(0)
+        self.content_type = content_type
+
+        def chunks():
+            remaining = size
+            while remaining is None or remaining > 0:
+                chunk = file_obj.read(_READ_SIZE if remaining is None else min(_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        self._write(chunks())
+
+    def upload_from_string(self, data, content_type=None, **kw) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.upload_from_file(io.BytesIO(data), size=len(data), content_type=content_type)
+
+    def upload_from_filename(self, filename, content_type=None, **kw) -> None:
+        with open(filename, "rb") as f:
+            self.upload_from_file(f, content_type=content_type)
+
+    def download_as_bytes(self, **kw) -> bytes:
+        self.bucket._request()
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        self.bucket._transfer(len(data))
+        return data
+
+    def exists(self, **kw) -> bool:
+        self.bucket._request()
+        return os.path.exists(self.path)
+
+    def delete(self, **kw) -> None:
+        self.bucket._request()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+
+    def compose(self, sources: Sequence["LocalBlob"], **kw) -> None:
+        if len(sources) > MAX_COMPOSE_SOURCES:
+            raise ValueError(f"compose accepts at most {MAX_COMPOSE_SOURCES} sources")
+
+        def chunks():
+            for src in sources:
+                with open(src.path, "rb") as f:
+                    while True:
+                        chunk = f.read(_READ_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+        self._write(chunks(), throttle=False)  # 服务端合并：只计一次请求，不计传输时间
+
+    def generate_signed_url(self, expiration=3600, method="GET", version="v4", **kw) -> str:
+        self.bucket._request(self.bucket.sign_latency)
+        seconds = int(expiration.total_seconds()) if hasattr(expiration, "total_seconds") else int(expiration)
+        return (f"file://{quote(os.path.abspath(self.path))}?X-Goog-Method={method}"
+                f"&X-Goog-Expires={seconds}&X-Goog-Date={int(time.time())}")
+
+
+class LocalBucket:
+    """
+    root: 存放对象的目录
+    latency: 每次请求的模拟往返延迟（秒）；bandwidth: 单个连接的模拟吞吐（字节/秒）
+    sign_latency: 签名 URL 的模拟耗时（对应 IAM signBlob）
+    """
+
+    def __init__(self, root: str, name: Optional[str] = None, latency: float = 0.0,
+                 bandwidth: Optional[float] = None, sign_latency: float = 0.0):
+        self.root = root
+        self.name = name or os.path.basename(os.path.normpath(root))
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.sign_latency = sign_latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _request(self, delay=None):
+        with self._lock:
+            self.requests += 1
+        delay = self.latency if delay is None else delay
+        if delay:
+            time.sleep(delay)
+
+    def _transfer(self, nbytes):
+        if self.bandwidth:
+            time.sleep(nbytes / self.bandwidth)
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self, name)
+
+    def list_blobs(self, prefix: str = "") -> List[LocalBlob]:
+        found = []
+        for dirpath, _, files in os.walk(self.root):
+            for f in files:
+                if f.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, f), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    found.append(self.blob(name))
+        return sorted(found, key=lambda b: b.name)
+
+
+_local_buckets: Dict[str, LocalBucket] = {}
+_local_lock = threading.Lock()
+
+
+def get_bucket(bucket_name: str):
+    """GCS Bucket；设置 STORAGE_LOCAL_DIR 时返回同名的本地 LocalBucket"""
+    local_dir = os.environ.get("STORAGE_LOCAL_DIR")
+    if local_dir:
+        with _local_lock:
+            if bucket_name not in _local_buckets:
+                _local_buckets[bucket_name] = LocalBucket(os.path.join(local_dir, bucket_name), bucket_name)
+            return _local_buckets[bucket_name]
+    return registry.get("storage").bucket(bucket_name)
+
+
+# ----------------------------------------------------------------------
+# 上传
+# ----------------------------------------------------------------------
+class _IterReader(io.RawIOBase):
+    """把字节迭代器包装成只读文件对象，供 upload_from_file 边读边传"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk).cast("B")
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]  # 切片不复制
+        return n
+
+
+def _iter_parts(data, chunk_size: int):
+    """按 chunk_size 切分；缓冲区切片不复制，文件对象 / 迭代器逐块读取"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for s in range(0, len(view), chunk_size):
+            yield view[s:s + chunk_size]
+        return
+    reader = data if hasattr(data, "read") else _IterReader(data)
+    while True:
+        buf = bytearray()
+        while len(buf) < chunk_size:
+            chunk = reader.read(chunk_size - len(buf))
+            if not chunk:
+                break
+            buf += chunk
+        if not buf:
+            return
+        yield memoryview(buf)
+        if len(buf) < chunk_size:
+            return
+
+
+def _compose(bucket, destination: str, parts: List[Any], content_type: Optional[str]):
+    """分组合并（每次最多 32 个源），层层合并到目标对象，返回需要删除的中间对象"""
+    garbage = list(parts)
+    level = 0
+    while len(parts) > MAX_COMPOSE_SOURCES:
+        merged = []
+        for g in range(0, len(parts), MAX_COMPOSE_SOURCES):
+            blob = bucket.blob(f"{destination}.__parts/{uuid.uuid4().hex}-l{level + 1}-{g}")
+            blob.compose(parts[g:g + MAX_COMPOSE_SOURCES])
+            merged.append(blob)
+        garbage.extend(merged)
+        parts, level = merged, level + 1
+    target = bucket.blob(destination)
+    target.content_type = content_type
+    target.compose(parts)
+    return garbage
+
+
+def upload_parallel(bucket_name: str, data, destination: str, content_type: Optional[str] = None,
+                    chunk_size: int = CHUNK_SIZE, max_concurrency: int = 8, bucket=None) -> str:
+    """
+    并行组合上传：各部分并行上传为临时对象（最多 max_concurrency 个在途，
+    流式输入时内存占用约为 max_concurrency × chunk_size），再 compose 成目标对象。
+    """
+    bucket = bucket or get_bucket(bucket_name)
+    prefix = f"{destination}.__parts/{uuid.uuid4().hex}"
+    parts: List[Any] = []
+    in_flight = threading.BoundedSemaphore(max_concurrency)
+
+    def put(index, view):
+        try:
+            blob = bucket.blob(f"{prefix}-{index:05d}")
+            blob.upload_from_file(io.BytesIO(view), size=len(view))
+            return blob
+        finally:
+            in_flight.release()
+
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_concurrency) as pool:
+            for index, view in enumerate(_iter_parts(data, chunk_size)):
+                in_flight.acquire()
+                futures.append(pool.submit(put, index, view))
+        parts = [f.result() for f in futures]
+        if not parts:
+            parts = [bucket.blob(f"{prefix}-00000")]
+            parts[0].upload_from_string(b"")
+        garbage = _compose(bucket, destination, parts, content_type)
+    except Exception:
+        garbage = [f.result() for f in futures if f.done() and not f.exception()]
+        _delete_quietly(garbage)
+        raise
+    _delete_quietly(garbage)
+    return f"gs://{bucket_name}/{destination}"
+
+
+def _delete_quietly(blobs, max_concurrency: int = 8):
+    def delete(blob):
+        try:
+            blob.delete()
+        except Exception as e:
+            print(f"[Storage Cleanup Error] {blob.name}: {e}")
+    if len(blobs) <= 1:
+        for blob in blobs:
+            delete(blob)
+        return
+    with ThreadPoolExecutor(min(max_concurrency, len(blobs))) as pool:
+        list(pool.map(delete, blobs))
+
+
+def _size_of(data) -> Optional[int]:
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, memoryview):
+        return data.nbytes
+    return None
+
+
+def upload_bytes(bucket_name: str, data, destination: str, content_type: Optional[str] = None,
+                 parallel_threshold: int = PARALLEL_THRESHOLD, bucket=None, **parallel_kw) -> str:
+    """
+    上传内存数据或流：bytes / bytearray / memoryview / 类文件对象 / 字节迭代器。
+    已知大小且不小于 parallel_threshold 时走并行组合上传；未知大小的流单连接边读边传。
+    """
+    bucket = bucket or get_bucket(bucket_name)
+    size = _size_of(data)
+    if size is not None and size >= parallel_threshold:
+        return upload_parallel(bucket_name, data, destination, content_type, bucket=bucket, **parallel_kw)
+    blob = bucket.blob(destination)
+    if size is not None:
+        blob.upload_from_file(io.BytesIO(data), size=size, content_type=content_type)
+    else:
+        reader = data if hasattr(data, "read") else io.BufferedReader(_IterReader(data), _READ_SIZE)
+        blob.upload_from_file(reader, content_type=content_type)
+    return f"gs://{bucket_name}/{destination}"
+
+
+def upload_many(bucket_name: str, items: Sequence[Tuple], max_concurrency: int = 8, bucket=None) -> List[Dict[str, Any]]:
+    """
+    批量上传：items 为 (destination, data[, content_type])。
+    返回与输入顺序一致的 [{"destination", "uri", "error"}]
+    """
+    bucket = bucket or get_bucket(bucket_name)
+
+    def put(item):
+        destination, data = item[0], item[1]
+        content_type = item[2] if len(item) > 2 else None
+        try:
+            uri = upload_bytes(bucket_name, data, destination, content_type, bucket=bucket)
+            return {"destination": destination, "uri": uri, "error": None}
+        except Exception as e:
+            print(f"[Storage Upload Error] {destination}: {e}")
+            return {"destination": destination, "uri": None, "error": str(e)}
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(min(max_concurrency, len(items))) as pool:
+        return list(pool.map(put, items))
+
+
 def upload_to_gcs(bucket_name, source_file_name, destination_blob_name):
-    from google.cloud import storage
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
+    size = os.path.getsize(source_file_name)
+    if size >= PARALLEL_THRESHOLD:
+        with open(source_file_name, "rb") as f:
+            return upload_parallel(bucket_name, f, destination_blob_name)
+    get_bucket(bucket_name).blob(destination_blob_name).upload_from_filename(source_file_name)
     return f"gs://{bucket_name}/{destination_blob_name}"
 
-def generate_signed_url(bucket_name, blob_name, expiration=3600):
-    from google.cloud import storage
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
-    return blob.generate_signed_url(version="v4", expiration=expiration, method="GET")
+
+# ----------------------------------------------------------------------
+# 签名 URL 缓存
+# ----------------------------------------------------------------------
+class SignedUrlCache:
+    """
+    (bucket, blob, method) → (url, 过期时间)。剩余有效期不低于请求有效期 × refresh_fraction
+    时直接复用，调用方拿到的 URL 至少还有一半的请求时长可用。
+    """
+
+    def __init__(self, max_entries: int = 50_000, refresh_fraction: float = 0.5):
+        self.max_entries = max_entries
+        self.refresh_fraction = refresh_fraction
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_sign(self, bucket_name: str, blob_name: str, expiration: int, method: str, sign) -> str:
+        key = (bucket_name, blob_name, method)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] - now >= expiration * self.refresh_fraction:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        url = sign()
+        with self._lock:
+            self._entries[key] = (url, now + expiration)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url
+
+    def invalidate(self, bucket_name: str, blob_name: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[:2] == (bucket_name, blob_name)]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+signed_urls = SignedUrlCache()
+
+
+def generate_signed_url(bucket_name, blob_name, expiration=3600, method="GET", cache=True):
+    def sign():
+        blob = get_bucket(bucket_name).blob(blob_name)
+        return blob.generate_signed_url(version="v4", expiration=expiration, method=method)
+    if not cache:
+        return sign()
+    return signed_urls.get_or_sign(bucket_name, blob_name, expiration, method, sign)
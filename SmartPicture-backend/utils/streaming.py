@@ -0,0 +1,89 @@
+"""
+utils/streaming.py
+-------------------
+流式生成响应：把模型的文本片段转成 Server-Sent Events 或逐行 JSON（NDJSON）。
+
+事件顺序：start → token × N → done（尾部事件，携带 SEO 封装与积分结算结果）
+生成出错时发送 error 事件；客户端中途断开时 WSGI 服务器会关闭生成器，
+此时调用 on_abort（例如退款）并关闭上游流，不再继续消耗模型配额。
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from flask import Response
+
+FORMATS = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def stream_format(request, data: Dict[str, Any]) -> Optional[str]:
+    """根据请求体的 stream 字段或 Accept 头判断是否使用流式响应"""
+    mode = data.get("stream")
+    if mode in FORMATS:
+        return mode
+    if mode is True or "text/event-stream" in request.headers.get("Accept", ""):
+        return "sse"
+    if "application/x-ndjson" in request.headers.get("Accept", ""):
+        return "ndjson"
+    return None
+
+
+def format_event(fmt: str, event: str, data: Dict[str, Any]) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False, default=str) + "\n"
+
+
+def stream_generation(
+    chunks: Iterable[str],
+    on_complete: Callable[[str], Dict[str, Any]],
+    on_abort: Optional[Callable[[str], None]] = None,
+    fmt: str = "sse",
+    disconnected: Optional[Callable[[], bool]] = None,
+):
+    """
+    chunks: 模型文本片段迭代器
+    on_complete(full_text) -> 尾部事件内容（SEO 封装、结算结果）
+    on_abort(reason): 出错或客户端断开时调用
+    disconnected(): 每收到一个片段检查一次；服务器要等写失败才会关闭生成器，
+    这里可以更早停下上游流
+    """
+    finished = False
+    parts = []
+    try:
+        yield format_event(fmt, "start", {})
+        for text in chunks:
+            if disconnected is not None and disconnected():
+                if on_abort:
+                    on_abort("client disconnected")
+                finished = True  # 已退款，finally 中只需关闭上游流
+                return
+            parts.append(text)
+            yield format_event(fmt, "token", {"text": text})
+        trailer = on_complete("".join(parts))
+        finished = True
+        yield format_event(fmt, "done", trailer)
+    except GeneratorExit:
+        if not finished and on_abort:
+            on_abort("client disconnected")
+        raise
+    except Exception as e:
+        print(f"[Stream Error] {e}")
+        if not finished and on_abort:
+            on_abort(str(e))
+        yield format_event(fmt, "error", {"error": str(e)})
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def streaming_response(generator, fmt: str) -> Response:
+    return Response(generator, mimetype=FORMATS[fmt], headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # 关闭反向代理缓冲，逐块下发
+    })
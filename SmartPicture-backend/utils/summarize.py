@@ -0,0 +1,288 @@
+"""
+utils/summarize.py
+-------------------
+长文本（音视频转写稿）map-reduce 摘要。
+
+- 切分：按句切分后以 token 估算值合并成片段；与 utils/tts_cache.py 相同，收段位置由句子内容决定
+  （某句哈希命中且达到 min_tokens，或再加一句会超过 max_tokens），局部修改只影响附近的片段
+- map：各片段摘要在线程池中并行（max_concurrency 个请求在途），失败按指数退避重试
+- reduce：片段摘要按同样的内容决定规则分组，逐层合并，直到剩下的内容能一次写出最终摘要与要点
+- 缓存：每次模型调用按 SHA-256(阶段 + 提示词版本 + 模型 + 输入) 存入 SQLite，
+  修改或重跑时只重新计算变化的片段及其上层合并
+- 进度：iter_summary 逐个产出 (事件, 数据)：plan → chunk × N → reduce × L → done
+- 模型可替换：model_fn(prompt) -> str，默认走 utils/ai_client.generate_content（网关、准入）
+- 上限：max_chunks 限制单次摘要的片段数，超出时在任何模型调用之前抛出 TranscriptTooLarge
+
+缓存路径 SUMMARY_CACHE_PATH（默认 data/summaries.sqlite）。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils.embed_cache import _with_retry
+from utils.tts_cache import split_sentences
+
+PROMPT_VERSION = 1
+DEFAULT_MODEL = "gemini-pro"
+CHUNK_TOKENS = 2000      # 单个片段上限
+MIN_CHUNK_TOKENS = 800
+REDUCE_TOKENS = 6000     # 单次合并 / 最终摘要的输入上限
+_CUT_MODULUS = 4
+
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK = re.compile(f"[{_CJK_RANGES}]")
+_WORD = re.compile(f"[^\\W{_CJK_RANGES}]+")
+
+MAP_PROMPT = (
+    "以下是一段音视频转写稿的第 {index}/{total} 部分。请用简洁的中文概括其中的主要内容，"
+    "保留关键事实、数字、人名与时间戳，不要添加原文没有的信息。\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "以下是同一音视频中连续几部分内容的摘要。请合并为一段连贯的摘要，去掉重复，"
+    "保留关键事实、数字、人名与时间戳。\n\n{text}"
+)
+FINAL_PROMPT = (
+    "以下是一段音视频的内容{source}。请写出：\n"
+    "1. 一段完整的中文摘要；\n"
+    "2. 另起一行写“要点：”，之后每行一条以“- ”开头的要点（不超过 {highlights} 条）。\n\n{text}"
+)
+
+
+class TranscriptTooLarge(ValueError):
+    def __init__(self, chunks: int, max_chunks: int):
+        super().__init__(f"transcript splits into {chunks} chunks (max {max_chunks})")
+        self.chunks = chunks
+        self.max_chunks = max_chunks
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算：中日韩字符约 1 token / 字，其他文字约 4 字符 / token"""
+    return len(_CJK.findall(text)) + sum((len(w) + 3) // 4 for w in _WORD.findall(text))
+
+
+def _cut_here(text: str) -> bool:
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=2).digest()
+    return int.from_bytes(digest, "little") % _CUT_MODULUS == 0
+
+
+def _group(items: Sequence[str], max_tokens: int, min_tokens: int,
+           count_tokens: Callable[[str], int]) -> List[List[str]]:
+    """按内容决定的切点合并相邻条目，每组不超过 max_tokens（单个条目超限时独占一组）"""
+    groups, current, size = [], [], 0
+    for item in items:
+        n = count_tokens(item)
+        if current and size + n > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += n
+        if size >= min_tokens and _cut_here(item):
+            groups.append(current)
+            current, size = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def chunk_transcript(text: str, max_tokens: int = CHUNK_TOKENS, min_tokens: int = MIN_CHUNK_TOKENS,
+                     count_tokens: Callable[[str], int] = estimate_tokens) -> List[str]:
+    sentences = []
+    for sentence in split_sentences(text):
+        n = count_tokens(sentence)
+        if n <= max_tokens:
+            sentences.append(sentence)
+            continue
+        step = max(len(sentence) * max_tokens // n, 1)  # 超长无标点文本按比例硬切
+        sentences += [sentence[i:i + step] for i in range(0, len(sentence), step)]
+    return [" ".join(g) for g in _group(sentences, max_tokens, min_tokens, count_tokens)]
+
+
+def parse_final(text: str) -> Tuple[str, List[str]]:
+    """最终输出拆成 (摘要, 要点列表)"""
+    summary, highlights = [], []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if re.match(r"^([-•*·]|\d+[.、)])\s*", line):
+            highlights.append(re.sub(r"^([-•*·]|\d+[.、)])\s*", "", line))
+        elif line and not re.match(r"^(要点|亮点|highlights?)\s*[:：]?\s*$", line, re.I):
+            summary.append(re.sub(r"^(摘要|summary)\s*[:：]\s*", "", line, flags=re.I))
+    return "\n".join(summary), highlights
+
+
+# ----------------------------------------------------------------------
+# 缓存
+# ----------------------------------------------------------------------
+class SummaryCache:
+    """SQLite（WAL），每个线程一个连接"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT result FROM summaries WHERE key = ?", (key,)).fetchone()
+        if row:
+            self.hits += 1
+            return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: str) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", (key, result, time.time()))
+
+    def stats(self) -> Dict[str, int]:
+        count = self._conn().execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        return {"entries": count, "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SummaryCache(os.environ.get(
+                "SUMMARY_CACHE_PATH", os.path.join(os.path.dirname(__file__), "../data/summaries.sqlite")))
+        return _cache
+
+
+def _reset_after_fork():
+    global _cache_lock
+    _cache_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ----------------------------------------------------------------------
+# 流水线
+# ----------------------------------------------------------------------
+def default_model(model: str = DEFAULT_MODEL, user: Optional[str] = None) -> Callable[[str], str]:
+    def call(prompt: str) -> str:
+        from utils.ai_client import generate_content  # 延迟导入：测试时可整体替换模型
+        return generate_content(prompt, model=model, temperature=0.3, user=user)
+    return call
+
+
+def iter_summary(
+    text: str,
+    model_fn: Optional[Callable[[str], str]] = None,
+    model: str = DEFAULT_MODEL,
+    cache: Optional[SummaryCache] = None,
+    max_concurrency: int = 4,
+    chunk_tokens: int = CHUNK_TOKENS,
+    min_chunk_tokens: int = MIN_CHUNK_TOKENS,
+    reduce_tokens: int = REDUCE_TOKENS,
+    max_highlights: int = 8,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+    max_retries: int = 2,
+    base_delay: float = 0.5,
+    user: Optional[str] = None,
+    max_chunks: Optional[int] = None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    逐个产出进度事件 (event, data)，最后一个为 ("done", {"summary", "highlights", ...})。
+    model 参与缓存键；替换 model_fn 时应同时给出能区分它的 model 名。
+    生成器被提前关闭（如客户端断开）时取消尚未开始的模型调用。
+    """
+    model_fn = model_fn or default_model(model, user)
+    cache = cache if cache is not None else get_summary_cache()
+    started = time.perf_counter()
+    calls = {"model": 0, "cached": 0}
+    lock = threading.Lock()
+
+    def run(stage: str, prompt: str, payload: str) -> Tuple[str, bool]:
+        key = hashlib.sha256(json.dumps([stage, PROMPT_VERSION, model, payload], ensure_ascii=False)
+                             .encode("utf-8")).hexdigest()
+        hit = cache.get(key)
+        if hit is not None:
+            with lock:
+                calls["cached"] += 1
+            return hit, True
+        result = _with_retry(lambda: model_fn(prompt), max_retries, base_delay, "Summarize")
+        cache.put(key, result)
+        with lock:
+            calls["model"] += 1
+        return result, False
+
+    chunks = chunk_transcript(text, chunk_tokens, min_chunk_tokens, count_tokens)
+    if max_chunks is not None and len(chunks) > max_chunks:
+        raise TranscriptTooLarge(len(chunks), max_chunks)
+    yield "plan", {"chunks": len(chunks), "tokens": sum(count_tokens(c) for c in chunks)}
+    pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    try:
+        if len(chunks) <= 1:
+            # 短文本直接写最终摘要
+            items, levels, source = chunks, 0, "转写稿"
+        else:
+            futures = {pool.submit(run, "map", MAP_PROMPT.format(index=i + 1, total=len(chunks), text=c), c): i
+                       for i, c in enumerate(chunks)}
+            items, pending = [None] * len(chunks), set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = futures[future]
+                    items[i], cached = future.result()
+                    yield "chunk", {"index": i, "cached": cached, "done": len(chunks) - len(pending), "total": len(chunks)}
+
+            levels, source = 0, "分段摘要"
+            while sum(count_tokens(s) for s in items) > reduce_tokens and len(items) > 1:
+                levels += 1
+                groups = _group(items, reduce_tokens, reduce_tokens // 2, count_tokens)
+                if len(groups) == len(items):  # 每组只有一条时无法再合并，交给最终摘要截断
+                    break
+                texts = ["\n\n".join(g) for g in groups]
+                results = list(pool.map(lambda t: run("reduce", REDUCE_PROMPT.format(text=t), t), texts))
+                items = [r for r, _ in results]
+                yield "reduce", {"level": levels, "groups": len(groups), "cached": sum(c for _, c in results)}
+
+        joined = "\n\n".join(items)
+        output, _ = run("final", FINAL_PROMPT.format(source=source, highlights=max_highlights, text=joined),
+                        f"{max_highlights}\n{joined}")
+        summary, highlights = parse_final(output)
+        yield "done", {
+            "summary": summary,
+            "highlights": highlights[:max_highlights],
+            "chunks": len(chunks),
+            "levels": levels,
+            "model_calls": calls["model"],
+            "cached_calls": calls["cached"],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def summarize_transcript(text: str, progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                         **kw) -> Dict[str, Any]:
+    """同步版本：返回 done 事件的数据；progress(event, data) 接收中间事件"""
+    for event, data in iter_summary(text, **kw):
+        if event == "done":
+            return data
+        if progress:
+            progress(event, data)
+    raise RuntimeError("summary pipeline ended without a result")
@@ -0,0 +1,214 @@
+"""
+utils/token_cache.py
+---------------------
+已验证 Token 缓存，供 utils/fb_auth.py（Firebase ID Token）与
+utils/auth.py（HS256 JWT）共用。
+
+- VerifiedTokenCache：有界 LRU，条目在 Token 的 exp 到期时失效；
+  无 exp 的 Token 最多缓存 max_ttl 秒。支持按用户撤销与撤销回调。
+- SigningKeyCache：缓存公钥（如 Google securetoken 证书），
+  按 Cache-Control 的 max-age 在后台提前刷新，遇到未知 kid 时按需刷新。
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+
+
+class VerifiedTokenCache:
+    """
+    max_size: 最多缓存多少个 Token
+    max_ttl: 单个条目最长缓存时间（秒），同时作为无 exp Token 的 TTL
+    leeway: 提前多少秒视为过期，避免临界时刻放行刚过期的 Token
+    """
+
+    def __init__(self, max_size: int = 50_000, max_ttl: float = 300.0, leeway: float = 5.0):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.leeway = leeway
+        self.enabled = True
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float, Optional[str]]]" = OrderedDict()
+        self._by_uid: Dict[str, set] = {}
+        self._revoke_hooks: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str, namespace: str) -> bytes:
+        # 只保存摘要，内存中不留原始 Bearer Token
+        return hashlib.sha256(f"{namespace}:{token}".encode()).digest()
+
+    def get(self, token: str, namespace: str = "default") -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = self._key(token, namespace)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires_at, uid = entry
+            if time.time() >= expires_at:
+                self._evict(key, uid)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, token: str, claims: Dict[str, Any], namespace: str = "default", uid: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + self.max_ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]) - self.leeway)
+        if expires_at <= now:
+            return
+        uid = uid or claims.get("uid") or claims.get("user_id") or claims.get("sub")
+        key = self._key(token, namespace)
+        with self._lock:
+            self._entries[key] = (claims, expires_at, uid)
+            self._entries.move_to_end(key)
+            if uid:
+                self._by_uid.setdefault(uid, set()).add(key)
+            while len(self._entries) > self.max_size:
+                old_key, (_, _, old_uid) = self._entries.popitem(last=False)
+                self._drop_uid_key(old_key, old_uid)
+
+    def verify(self, token: str, verifier: Callable[[str], Dict[str, Any]], namespace: str = "default") -> Dict[str, Any]:
+        """命中直接返回 claims；未命中调用 verifier 完整验证后写入缓存"""
+        claims = self.get(token, namespace)
+        if claims is None:
+            claims = verifier(token)
+            self.put(token, claims, namespace)
+        return claims
+
+    # ------------------------------------------------------------------
+    # 撤销
+    # ------------------------------------------------------------------
+    def on_revoke(self, hook: Callable[[str], None]) -> None:
+        """注册撤销回调（例如通过 Pub/Sub 通知其他实例）"""
+        self._revoke_hooks.append(hook)
+
+    def revoke(self, uid: str, notify: bool = True) -> int:
+        """移除该用户全部已缓存 Token，下次请求必须重新完整验证"""
+        with self._lock:
+            keys = self._by_uid.pop(uid, set())
+            for key in keys:
+                self._entries.pop(key, None)
+        if notify:
+            for hook in self._revoke_hooks:
+                hook(uid)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_uid.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _evict(self, key, uid):
+        self._entries.pop(key, None)
+        self._drop_uid_key(key, uid)
+
+    def _drop_uid_key(self, key, uid):
+        keys = self._by_uid.get(uid)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_uid[uid]
+
+
+class SigningKeyCache:
+    """
+    fetch: 无参函数，返回 ({kid: public_key}, max_age_seconds)
+    refresh_ratio: 在 max_age 的多少比例处后台刷新
+    min_refresh_interval: 未知 kid 触发按需刷新的最小间隔（秒），防止被刷爆
+    """
+
+    def __init__(self, fetch: Callable[[], Tuple[Dict[str, Any], float]],
+                 refresh_ratio: float = 0.8, min_refresh_interval: float = 30.0):
+        self.fetch = fetch
+        self.refresh_ratio = refresh_ratio
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._max_age = 0.0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def get(self, kid: str):
+        if time.time() >= self._expires_at or kid not in self._keys:
+            if time.time() - self._last_refresh >= self.min_refresh_interval or not self._keys:
+                self.refresh()
+        return self._keys.get(kid)
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._last_refresh = time.time()
+            keys, max_age = self.fetch()
+            self._keys = keys
+            self._max_age = max_age
+            self._expires_at = time.time() + max_age
+
+    def start(self) -> None:
+        """启动后台刷新线程：在 max_age 的 refresh_ratio 处提前拉取新公钥"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="signing-key-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._keys:
+                wait = self._last_refresh + self._max_age * self.refresh_ratio - time.time()
+                if self._stop.wait(max(wait, 0)):
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[SigningKey Refresh Error] {e}")
+                if self._stop.wait(self.min_refresh_interval):
+                    return
+
+
+def fetch_google_certs() -> Tuple[Dict[str, Any], float]:
+    """拉取 Firebase ID Token 的签名证书，返回公钥与 Cache-Control max-age"""
+    import urllib.request
+    from cryptography.x509 import load_pem_x509_certificate
+
+    with urllib.request.urlopen(GOOGLE_CERTS_URL, timeout=5) as resp:
+        certs = json.load(resp)
+        cache_control = resp.headers.get("Cache-Control", "")
+    match = re.search(r"max-age=(\d+)", cache_control)
+    max_age = float(match.group(1)) if match else 3600.0
+    keys = {kid: load_pem_x509_certificate(pem.encode()).public_key() for kid, pem in certs.items()}
+    return keys, max_age
+
+
+# 进程内共享实例：两个认证模块都使用它
+token_cache = VerifiedTokenCache()
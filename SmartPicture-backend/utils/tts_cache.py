@@ -0,0 +1,290 @@
+"""
+utils/tts_cache.py
+-------------------
+语音合成（TTS）分段并行 + 内容寻址缓存。
+
+- 切分：长文本按句切分，再按内容决定的边界把句子合并成片段（某句哈希命中或长度超限时收段），
+  文本局部修改只会改变附近的片段，其余片段仍命中缓存
+- 键：SHA-256(片段文本 + 音色 + 音频配置)
+- 存储：本地目录（按总大小 LRU 淘汰）、GCS（淘汰交给存储桶生命周期规则），或两者叠加
+- 合成：未命中的片段在线程池中并行请求，失败按指数退避重试；MP3 帧可直接拼接
+  （去掉后续片段开头的 ID3 标签）
+- 流式：iter_speech 按顺序产出片段字节，第一段就绪即可下发，不必等全部完成
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from utils.clients import registry
+from utils.embed_cache import _with_retry
+from utils.storage import get_bucket, upload_bytes
+
+DEFAULT_VOICE = "en-US-Wavenet-D"
+MAX_SEGMENT_CHARS = 1200  # 单次请求上限为 5000 字节，留出多字节字符的余量
+MIN_SEGMENT_CHARS = 200
+_CUT_MODULUS = 4  # 约每 4 句出现一个内容决定的切点
+
+_SENTENCE = re.compile(r"[^.!?。！？；;\n]*(?:[.!?。！？；;]+|\n+|$)")
+
+
+# ----------------------------------------------------------------------
+# 切分
+# ----------------------------------------------------------------------
+def split_sentences(text: str) -> List[str]:
+    return [s for s in (m.group(0).strip() for m in _SENTENCE.finditer(text)) if s]
+
+
+def split_segments(text: str, max_chars: int = MAX_SEGMENT_CHARS, min_chars: int = MIN_SEGMENT_CHARS) -> List[str]:
+    segments, current = [], []
+    size = 0
+    for sentence in split_sentences(text):
+        while len(sentence) > max_chars:  # 超长无标点文本按空白硬切
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                segments.append(" ".join(current))
+                current, size = [], 0
+            segments.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and size + len(sentence) + 1 > max_chars:
+            segments.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence) + 1
+        digest = hashlib.blake2b(sentence.encode("utf-8"), digest_size=2).digest()
+        if size >= min_chars and int.from_bytes(digest, "little") % _CUT_MODULUS == 0:
+            segments.append(" ".join(current))
+            current, size = [], 0
+    if current:
+        segments.append(" ".join(current))
+    return segments
+
+
+def segment_key(text: str, voice: Dict[str, Any], audio_config: Dict[str, Any]) -> str:
+    payload = json.dumps({"text": text, "voice": voice, "audio": audio_config}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ----------------------------------------------------------------------
+# 缓存
+# ----------------------------------------------------------------------
+class DiskSegmentCache:
+    """
+    directory: 缓存目录，每个片段一个文件
+    max_bytes: 总大小上限，超出时按最近访问时间淘汰（启动时按文件 mtime 恢复顺序）
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".seg"):
+                st = os.stat(os.path.join(directory, name))
+                files.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+        self._total = sum(self._entries.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".seg")
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                self._total -= self._entries.pop(key, 0)
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key))  # 重启后仍能恢复访问顺序
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._total += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old, size = self._entries.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+class GcsSegmentCache:
+    """GCS 上的片段缓存；容量由存储桶生命周期规则（按对象年龄删除）控制"""
+
+    def __init__(self, bucket: str, prefix: str = "tts-cache/"):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _blob(self, key):
+        return get_bucket(self.bucket).blob(self.prefix + key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            data = self._blob(key).download_as_bytes()
+        except Exception as e:
+            if type(e).__name__ != "NotFound":
+                print(f"[TTS Cache Error] {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        upload_bytes(self.bucket, data, self.prefix + key, content_type="application/octet-stream")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class TieredSegmentCache:
+    """本地 LRU 在前、GCS 在后：多个实例共享 GCS，热片段只在本地读取"""
+
+    def __init__(self, local: DiskSegmentCache, remote: GcsSegmentCache):
+        self.local = local
+        self.remote = remote
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self.local.get(key)
+        if data is None:
+            data = self.remote.get(key)
+            if data is not None:
+                self.local.put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self.local.put(key, data)
+        self.remote.put(key, data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"local": self.local.stats(), "remote": self.remote.stats()}
+
+
+# ----------------------------------------------------------------------
+# 合成
+# ----------------------------------------------------------------------
+def google_synthesizer(text: str, voice: Dict[str, Any], audio_config: Dict[str, Any]) -> bytes:
+    from google.cloud import texttospeech  # 延迟导入
+    client = registry.get("tts")
+    response = client.synthesize_speech(
+        input=texttospeech.SynthesisInput(text=text),
+        voice=texttospeech.VoiceSelectionParams(**voice),
+        audio_config=texttospeech.AudioConfig(
+            audio_encoding=getattr(texttospeech.AudioEncoding, audio_config.get("audio_encoding", "MP3")),
+            **{k: v for k, v in audio_config.items() if k != "audio_encoding"}),
+    )
+    return response.audio_content
+
+
+def _strip_id3(data: bytes) -> bytes:
+    """去掉开头的 ID3v2 标签，MP3 帧即可直接拼接"""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        return data[10 + size + (10 if data[5] & 0x10 else 0):]
+    return data
+
+
+def iter_speech(
+    text: str,
+    voice_name: str = DEFAULT_VOICE,
+    language_code: str = "en-US",
+    audio_config: Optional[Dict[str, Any]] = None,
+    synthesizer: Optional[Callable[[str, Dict[str, Any], Dict[str, Any]], bytes]] = None,
+    cache=None,
+    max_concurrency: int = 4,
+    max_retries: int = 3,
+    base_delay: float = 0.5,
+    max_chars: int = MAX_SEGMENT_CHARS,
+) -> Iterator[bytes]:
+    """按顺序产出各片段的音频字节；命中缓存的片段不发起请求，其余并行合成"""
+    synthesizer = synthesizer or google_synthesizer
+    cache = cache if cache is not None else get_tts_cache()
+    voice = {"language_code": language_code, "name": voice_name}
+    audio_config = audio_config or {"audio_encoding": "MP3"}
+    segments = split_segments(text, max_chars=max_chars)
+
+    def run(segment):
+        key = segment_key(segment, voice, audio_config)
+        data = cache.get(key)
+        if data is None:
+            data = _with_retry(lambda: synthesizer(segment, voice, audio_config), max_retries, base_delay, "TTS")
+            cache.put(key, data)
+        return data
+
+    if not segments:
+        return
+    with ThreadPoolExecutor(min(max_concurrency, len(segments))) as pool:
+        futures = [pool.submit(run, s) for s in segments]
+        try:
+            for i, future in enumerate(futures):
+                data = future.result()
+                yield data if i == 0 else _strip_id3(data)
+        finally:
+            for f in futures:  # 客户端断开时取消尚未开始的片段
+                f.cancel()
+
+
+def synthesize_long(text: str, **kw) -> bytes:
+    return b"".join(iter_speech(text, **kw))
+
+
+def speech_response(text: str, **kw):
+    """流式返回 MP3：第一段合成完即开始下发"""
+    from flask import Response
+    return Response(iter_speech(text, **kw), mimetype="audio/mpeg", headers={"Cache-Control": "no-cache"})
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """
+    懒加载默认缓存：TTS_CACHE_DIR（默认 data/tts_cache）、TTS_CACHE_MAX_MB（默认 512），
+    设置 TTS_CACHE_BUCKET 时在本地缓存之后叠加 GCS。
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            local = DiskSegmentCache(
+                os.environ.get("TTS_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../data/tts_cache")),
+                int(os.environ.get("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+            bucket = os.environ.get("TTS_CACHE_BUCKET")
+            _cache = TieredSegmentCache(local, GcsSegmentCache(bucket)) if bucket else local
+        return _cache
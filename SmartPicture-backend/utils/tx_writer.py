@@ -0,0 +1,311 @@
+"""
+utils/tx_writer.py
+-------------------
+缓冲式交易日志写入器。
+
+请求线程只把交易记录放进内存队列，后台线程按「满 500 条或到达时间间隔」
+合并成 Firestore WriteBatch 提交，请求延迟不再取决于 Firestore 写延迟。
+
+注意：只有交易日志（transactions 集合中的审计记录）走缓冲；
+余额（users/{uid}.points）的变更仍在请求线程同步写入，保持强一致。
+进程收到 SIGTERM（Cloud Run 缩容）或正常退出时会先刷完队列。
+
+同一批连续失败 max_failed_rounds 轮后二分拆批，定位无法写入的单条记录（如 update 不存在的文档），
+追加到死信文件 TX_DEAD_LETTER_PATH（默认 data/tx_dead_letter.jsonl，JSON Lines），其余记录照常写入；
+拆批后没有任何部分写入成功时视为 Firestore 整体不可用，整批放回队首等待下一轮，不会误判为死信。
+"""
+
+import atexit
+import json
+import os
+import signal
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+MAX_BATCH = 500  # Firestore 单个 WriteBatch 的写入上限
+
+
+class TransactionLogWriter:
+    """
+    db: firestore.Client（或进程内替身）
+    fs: 提供 SERVER_TIMESTAMP 的模块，默认 google.cloud.firestore
+    max_batch: 单批最多写入条数（≤ 500）
+    flush_interval: 队列非空时最长等待多久就提交（秒）
+    max_pending: 队列积压超过该值时，在调用线程同步刷写（反压，不丢数据）
+    max_failed_rounds: 同一批连续失败多少轮（每轮重试 max_retries 次）后拆批定位死信
+    dead_letter_path: 死信文件路径，默认取 TX_DEAD_LETTER_PATH
+    """
+
+    def __init__(
+        self,
+        db,
+        fs=None,
+        max_batch: int = MAX_BATCH,
+        flush_interval: float = 0.5,
+        max_pending: int = 20_000,
+        max_retries: int = 5,
+        max_failed_rounds: int = 3,
+        dead_letter_path: Optional[str] = None,
+    ):
+        if fs is None:
+            from google.cloud import firestore as fs
+        self.db = db
+        self.fs = fs
+        self.max_batch = min(max_batch, MAX_BATCH)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.max_failed_rounds = max_failed_rounds
+        self.dead_letter_path = dead_letter_path or os.environ.get(
+            "TX_DEAD_LETTER_PATH", os.path.join(os.path.dirname(__file__), "../data/tx_dead_letter.jsonl"))
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._closed = False
+        self._head_failures = 0  # 队首这一批已连续失败的轮数
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "bisected_batches": 0,
+            "dead_lettered": 0,
+            "inline_flushes": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # 入队
+    # ------------------------------------------------------------------
+    def set(self, ref, data: Dict[str, Any], merge: bool = False) -> None:
+        self._enqueue(("set", ref, data, merge))
+
+    def update(self, ref, data: Dict[str, Any]) -> None:
+        self._enqueue(("update", ref, data, None))
+
+    def log(self, uid: str, amount: int, meta: Dict[str, Any], **fields) -> str:
+        """追加一条交易记录，立即返回文档 ID（文档稍后批量写入）"""
+        ref = self.db.collection("transactions").document()
+        self.set(ref, {
+            "uid": uid, "type": "earn" if amount > 0 else "spend",
+            "amount": amount, "meta": meta,
+            "createdAt": self.fs.SERVER_TIMESTAMP,
+            **fields,
+        })
+        return ref.id
+
+    def _enqueue(self, op) -> None:
+        if not self._closed:
+            self._ensure_thread()
+        with self._cond:
+            self._queue.append(op)
+            self._stats["enqueued"] += 1
+            pending = len(self._queue)
+            if pending == 1 or pending >= self.max_batch:
+                self._cond.notify()
+        if self._closed or pending > self.max_pending:
+            # 已关闭（正在退出）或积压过多：在调用线程同步写入
+            with self._cond:
+                self._stats["inline_flushes"] += 1
+            self._flush_once()
+
+    # ------------------------------------------------------------------
+    # 刷写
+    # ------------------------------------------------------------------
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """同步刷完当前队列；返回是否已清空"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            if not self._flush_once():
+                time.sleep(0.05)
+        return True
+
+    def close(self, timeout: Optional[float] = 10.0) -> bool:
+        """停止后台线程并刷完队列（Cloud Run 缩容宽限期默认 10 秒）"""
+        self._closed = True
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout)
+        return self.flush(timeout)
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._stats, "pending": len(self._queue)}
+
+    def _flush_once(self) -> bool:
+        """取出最多 max_batch 条提交一次；失败时按原顺序放回队首"""
+        with self._flush_lock:
+            with self._cond:
+                ops = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            if not ops:
+                return True
+
+            t0 = time.perf_counter()
+            for attempt in range(self.max_retries):
+                try:
+                    self._commit(ops)
+                    break
+                except Exception as e:
+                    print(f"[TxWriter Error] batch of {len(ops)} failed (attempt {attempt + 1}): {e}")
+                    time.sleep(min(0.1 * 2 ** attempt, 2.0))
+            else:
+                self._head_failures += 1
+                if self._head_failures >= self.max_failed_rounds:
+                    return self._isolate_poison(ops)
+                with self._cond:
+                    self._queue.extendleft(reversed(ops))
+                    self._stats["failed_batches"] += 1
+                return False
+
+            self._head_failures = 0
+            elapsed = (time.perf_counter() - t0) * 1000
+            with self._cond:
+                self._stats["written"] += len(ops)
+                self._stats["batches"] += 1
+                self._stats["last_batch_size"] = len(ops)
+                self._stats["last_flush_ms"] = round(elapsed, 2)
+                self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed), 2)
+            return True
+
+    def _commit(self, ops) -> None:
+        batch = self.db.batch()
+        for kind, ref, data, merge in ops:
+            if kind == "set":
+                batch.set(ref, data, merge=merge)
+            else:
+                batch.update(ref, data)
+        batch.commit()
+
+    def _bisect(self, ops):
+        """
+        逐层对半提交（每个子批只试一次），返回 (已写入, [(单条记录, 异常)], 是否放弃)。
+        一直没有任何子批写入成功、失败次数又超过定位单条所需的次数时放弃，避免 Firestore
+        整体不可用时对整批做上千次无效提交。
+        """
+        written, failed, failures = [], [], 0
+        budget = 2 * len(ops).bit_length() + 2
+        stack = [ops]
+        while stack:
+            part = stack.pop()
+            try:
+                self._commit(part)
+                written.extend(part)
+                continue
+            except Exception as e:
+                failures += 1
+                if not written and failures > budget:
+                    return written, failed, True
+                if len(part) == 1:
+                    failed.append((part[0], e))
+                    continue
+            mid = len(part) // 2
+            stack += [part[mid:], part[:mid]]  # 先处理前半，保持写入顺序
+        return written, failed, False
+
+    def _isolate_poison(self, ops) -> bool:
+        """拆批定位无法写入的记录；有部分写入成功才把失败的单条判为死信，否则整批放回队首"""
+        written, failed, gave_up = self._bisect(ops)
+        self._head_failures = 0
+        with self._cond:
+            self._stats["bisected_batches"] += 1
+            if gave_up or not written:
+                self._queue.extendleft(reversed(ops))
+                self._stats["failed_batches"] += 1
+                return False
+            self._stats["written"] += len(written)
+        self._dead_letter(failed)
+        return True
+
+    def _dead_letter(self, failed) -> None:
+        for (kind, ref, data, merge), e in failed:
+            print(f"[TxWriter Dead Letter] {kind} {getattr(ref, 'path', ref)}: {e}")
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.dead_letter_path)), exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for (kind, ref, data, merge), e in failed:
+                    f.write(json.dumps({
+                        "kind": kind, "path": getattr(ref, "path", str(ref)), "data": data, "merge": merge,
+                        "error": str(e), "at": time.time(),
+                    }, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            # 死信文件写不了时上面的日志仍保留了完整记录
+            print(f"[TxWriter Error] dead letter file {self.dead_letter_path}: {e}")
+        with self._cond:
+            self._stats["dead_lettered"] += len(failed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._closed:
+                    self._cond.wait()
+                if len(self._queue) < self.max_batch and not self._closed:
+                    # 攒批：等到满批或超时
+                    self._cond.wait(self.flush_interval)
+                if self._closed and not self._queue:
+                    return
+            if not self._flush_once():
+                time.sleep(self.flush_interval)
+            if self._closed and not self._queue:
+                return
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._cond:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # fork 后后台线程不会被继承，需在子进程中重新启动
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="tx-log-writer", daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------
+    # 进程退出时刷写
+    # ------------------------------------------------------------------
+    def install_shutdown_hooks(self, timeout: float = 8.0) -> bool:
+        """注册 atexit 与 SIGTERM 处理：先刷完队列，再交给原有的处理器"""
+        return install_shutdown_hooks(lambda: self, timeout)
+
+
+def install_shutdown_hooks(get_writer: Callable[[], Optional[TransactionLogWriter]], timeout: float = 8.0) -> bool:
+    """
+    进程退出（atexit）与 SIGTERM 时刷完 get_writer() 返回的写入器（None 表示尚未创建，无需刷写）。
+    写入器懒加载时应在创建应用时、于主线程调用，而不是等首个请求（通常在工作线程上）创建写入器时。
+    signal 只能在主线程注册；不在主线程时打印警告并返回 False（仍注册 atexit）。
+    """
+    def _flush():
+        writer = get_writer()
+        if writer is not None:
+            writer.close(timeout)
+
+    atexit.register(_flush)
+    if threading.current_thread() is not threading.main_thread():
+        print("[TxWriter Warning] not on the main thread, SIGTERM flush hook not installed; "
+              "buffered transaction logs may be lost on shutdown")
+        return False
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def _on_sigterm(signum, frame):
+        _flush()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    return True
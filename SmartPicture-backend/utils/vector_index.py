@@ -0,0 +1,378 @@
+"""
+utils/vector_index.py
+----------------------
+知识库（RAG）本地向量索引。
+
+- 存储：向量保存在内存映射的 float32（可选 float16）矩阵 vectors.bin 中，
+  容量按倍数增长；每行的元数据（chunk id、来源、正文）追加写入 meta.jsonl
+- 检索：入库时归一化，余弦相似度即内积；分块矩阵乘 + argpartition 取 top-k，
+  多个查询一次批量计算
+- 变更：增量追加；删除只写墓碑（tombstones.npy），compact() 重写矩阵并回收空间；
+  同一 chunk id 再次写入视为更新（旧行打墓碑）
+- IVF（可选）：train_ivf() 用球面 k-means 训练粗聚类中心，每行归属一个倒排桶，
+  查询只扫描最近的 nprobe 个桶，百万级 chunk 下延迟仍可控
+
+目录结构：
+    index.json          维度、dtype、行数、容量、IVF 参数
+    vectors.bin         行优先的向量矩阵（np.memmap）
+    meta.jsonl          每行一条元数据，与矩阵行号一一对应
+    tombstones.npy      已删除行的布尔掩码
+    ivf_centroids.npy   IVF 聚类中心（训练后）
+    ivf_assign.npy      每行所属的桶（训练后）
+
+写入由单个进程负责（入库任务），其余进程可以只读打开并在需要时 reload()。
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+HEADER_NAME = "index.json"
+VECTORS_NAME = "vectors.bin"
+META_NAME = "meta.jsonl"
+TOMBSTONES_NAME = "tombstones.npy"
+CENTROIDS_NAME = "ivf_centroids.npy"
+ASSIGN_NAME = "ivf_assign.npy"
+
+DTYPES = {"float32": np.float32, "float16": np.float16}
+
+_SCAN_ROWS = 65_536  # 暴力检索时每块参与矩阵乘的行数，限制临时内存
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """按行取 top-k（降序），返回 (列下标, 分数)"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex:
+    """
+    path: 索引目录
+    dim: 向量维度；新建索引时必须提供，打开已有索引时从 index.json 读取
+    dtype: "float32" 或 "float16"（仅影响存储，计算统一用 float32；float16 全量扫描需逐块转换，
+           单条查询较慢，建议配合 IVF 或批量查询）
+    nprobe: IVF 查询默认扫描的桶数
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None, dtype: str = "float32", nprobe: int = 8):
+        self.path = path
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        header_path = os.path.join(path, HEADER_NAME)
+        if os.path.exists(header_path):
+            with open(header_path, encoding="utf-8") as f:
+                header = json.load(f)
+        else:
+            if not dim:
+                raise ValueError("dim is required when creating a new index")
+            if dtype not in DTYPES:
+                raise ValueError(f"Unsupported dtype: {dtype}")
+            header = {"dim": dim, "dtype": dtype, "count": 0, "capacity": 0, "nlist": 0}
+        self.dim = header["dim"]
+        self.dtype = header["dtype"]
+        self._header = header
+        self.reload()
+
+    # ------------------------------------------------------------------
+    # 加载与持久化
+    # ------------------------------------------------------------------
+    def reload(self) -> None:
+        """从磁盘重新加载（只读进程在入库任务写入后调用）"""
+        with self._lock:
+            header_path = os.path.join(self.path, HEADER_NAME)
+            if os.path.exists(header_path):
+                with open(header_path, encoding="utf-8") as f:
+                    self._header = json.load(f)
+            self._count = self._header["count"]
+            self._capacity = self._header["capacity"]
+            self._matrix = self._map(self._capacity) if self._capacity else None
+
+            self._meta: List[Dict[str, Any]] = []
+            self._meta_bytes = 0  # 已提交元数据的字节长度，之后的尾部视为未提交
+            meta_path = os.path.join(self.path, META_NAME)
+            if os.path.exists(meta_path):
+                with open(meta_path, "rb") as f:
+                    for line in f:
+                        if len(self._meta) >= self._count:
+                            break  # 未提交的尾部（写入中途崩溃）忽略
+                        self._meta.append(json.loads(line))
+                        self._meta_bytes += len(line)
+
+            deleted = self._load_npy(TOMBSTONES_NAME)
+            self._deleted = np.zeros(self._count, dtype=bool)
+            if deleted is not None:
+                self._deleted[: min(len(deleted), self._count)] = deleted[: self._count]
+            self._rows = {m["id"]: i for i, m in enumerate(self._meta) if not self._deleted[i]}
+
+            self._centroids = self._load_npy(CENTROIDS_NAME) if self._header.get("nlist") else None
+            assign = self._load_npy(ASSIGN_NAME) if self._centroids is not None else None
+            self._assign = np.full(self._count, -1, dtype=np.int32)
+            if assign is not None:
+                self._assign[: min(len(assign), self._count)] = assign[: self._count]
+            self._lists: Optional[List[np.ndarray]] = None
+
+    def _load_npy(self, name):
+        p = os.path.join(self.path, name)
+        return np.load(p) if os.path.exists(p) else None
+
+    def _save_npy(self, name, arr):
+        p = os.path.join(self.path, name)
+        with open(f"{p}.tmp", "wb") as f:
+            np.save(f, arr)
+        os.replace(f"{p}.tmp", p)
+
+    def _map(self, capacity: int) -> np.memmap:
+        return np.memmap(os.path.join(self.path, VECTORS_NAME), dtype=DTYPES[self.dtype],
+                         mode="r+", shape=(capacity, self.dim))
+
+    def _grow(self, needed: int) -> None:
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+        with open(os.path.join(self.path, VECTORS_NAME), "ab") as f:
+            f.truncate(capacity * self.dim * np.dtype(DTYPES[self.dtype]).itemsize)
+        self._capacity = capacity
+        self._matrix = self._map(capacity)
+
+    def _commit(self) -> None:
+        """矩阵与元数据落盘后再更新 index.json，count 以它为准"""
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._save_npy(TOMBSTONES_NAME, self._deleted)
+        if self._centroids is not None:
+            self._save_npy(ASSIGN_NAME, self._assign)
+        self._header.update(count=self._count, capacity=self._capacity)
+        p = os.path.join(self.path, HEADER_NAME)
+        with open(f"{p}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self._header, f)
+        os.replace(f"{p}.tmp", p)
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def add(self, vectors: Sequence[Sequence[float]], metas: Sequence[Dict[str, Any]]) -> List[int]:
+        """
+        追加一批向量；metas 与向量一一对应，必须带唯一的 "id"（例如 doc_id#chunk）。
+        已存在的 id 视为更新：旧行打墓碑。返回新行号。
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(vectors) != len(metas):
+            raise ValueError("vectors and metas must have the same length")
+        if any("id" not in m for m in metas):
+            raise ValueError("every meta needs an 'id'")
+        vectors = _normalize(vectors)
+
+        with self._lock:
+            start = self._count
+            end = start + len(vectors)
+            self._grow(end)
+            self._matrix[start:end] = vectors.astype(DTYPES[self.dtype])
+            payload = "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in metas).encode("utf-8")
+            with open(os.path.join(self.path, META_NAME), "ab") as f:
+                # 截掉上次崩溃留下的未提交尾部，保证行号与元数据对齐
+                f.truncate(self._meta_bytes)
+                f.write(payload)
+            self._meta_bytes += len(payload)
+
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(vectors), dtype=bool)])
+            for i, m in enumerate(metas, start):
+                old = self._rows.get(m["id"])
+                if old is not None:
+                    self._deleted[old] = True
+                self._rows[m["id"]] = i
+            self._meta.extend(dict(m) for m in metas)
+
+            if self._centroids is not None:
+                assign = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+                self._assign = np.concatenate([self._assign, assign])
+                self._lists = None
+            self._count = end
+            self._commit()
+            return list(range(start, end))
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """按 chunk id 删除（写墓碑），返回实际删除的条数"""
+        with self._lock:
+            removed = 0
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is not None:
+                    self._deleted[row] = True
+                    removed += 1
+            if removed:
+                self._lists = None
+                self._commit()
+            return removed
+
+    def compact(self) -> int:
+        """重写矩阵与元数据，去掉墓碑行；返回回收的行数"""
+        with self._lock:
+            keep = np.flatnonzero(~self._deleted)
+            removed = self._count - len(keep)
+            if not removed:
+                return 0
+            capacity = max(len(keep), 1024)
+            tmp_vectors = os.path.join(self.path, f"{VECTORS_NAME}.tmp")
+            out = np.memmap(tmp_vectors, dtype=DTYPES[self.dtype], mode="w+", shape=(capacity, self.dim))
+            for s in range(0, len(keep), _SCAN_ROWS):
+                rows = keep[s:s + _SCAN_ROWS]
+                out[s:s + len(rows)] = self._matrix[rows]
+            out.flush()
+            del out
+
+            meta = [self._meta[i] for i in keep]
+            meta_path = os.path.join(self.path, META_NAME)
+            payload = "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in meta).encode("utf-8")
+            with open(f"{meta_path}.tmp", "wb") as f:
+                f.write(payload)
+
+            self._matrix = None
+            os.replace(tmp_vectors, os.path.join(self.path, VECTORS_NAME))
+            os.replace(f"{meta_path}.tmp", meta_path)
+            self._meta = meta
+            self._meta_bytes = len(payload)
+            self._count = len(keep)
+            self._capacity = capacity
+            self._matrix = self._map(capacity)
+            self._deleted = np.zeros(self._count, dtype=bool)
+            self._rows = {m["id"]: i for i, m in enumerate(meta)}
+            if self._centroids is not None:
+                self._assign = self._assign[keep]
+                self._lists = None
+            self._commit()
+            return removed
+
+    def train_ivf(self, nlist: int, sample: int = 100_000, iters: int = 10, seed: int = 0) -> None:
+        """在（抽样的）现有向量上训练 nlist 个聚类中心，并为所有行分桶"""
+        with self._lock:
+            live = np.flatnonzero(~self._deleted)
+            if len(live) < nlist:
+                raise ValueError(f"need at least {nlist} vectors to train {nlist} lists")
+            rng = np.random.default_rng(seed)
+            picked = np.sort(rng.choice(live, size=min(sample, len(live)), replace=False))
+            data = np.asarray(self._matrix[picked], dtype=np.float32)
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+            for _ in range(iters):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                empty = np.bincount(labels, minlength=nlist) == 0
+                sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]  # 空桶重新播种
+                centroids = _normalize(sums)
+
+            self._centroids = centroids.astype(np.float32)
+            self._assign = np.empty(self._count, dtype=np.int32)
+            for s in range(0, self._count, _SCAN_ROWS):
+                block = np.asarray(self._matrix[s:min(s + _SCAN_ROWS, self._count)], dtype=np.float32)
+                self._assign[s:s + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+            self._lists = None
+            self._header["nlist"] = nlist
+            self._save_npy(CENTROIDS_NAME, self._centroids)
+            self._commit()
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            live = np.flatnonzero(~self._deleted)
+            labels = self._assign[live]
+            order = np.argsort(labels, kind="stable")
+            bounds = np.searchsorted(labels[order], np.arange(len(self._centroids) + 1))
+            rows = live[order]
+            self._lists = [rows[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._lists
+
+    def _search_flat(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for s in range(0, self._count, _SCAN_ROWS):
+            block = np.asarray(self._matrix[s:min(s + _SCAN_ROWS, self._count)], dtype=np.float32)
+            scores = queries @ block.T
+            scores[:, self._deleted[s:s + len(block)]] = -np.inf
+            idx, top = _top_k(scores, k)
+            merged_rows = np.concatenate([best_rows, idx + s], axis=1)
+            merged_scores = np.concatenate([best_scores, top], axis=1)
+            pick, best_scores = _top_k(merged_scores, k)
+            best_rows = np.take_along_axis(merged_rows, pick, axis=1)
+        return best_rows, best_scores
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        lists = self._inverted_lists()
+        probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :nprobe]
+        results = []
+        for q, probe in zip(queries, probes):
+            rows = np.sort(np.concatenate([lists[c] for c in probe]))
+            if not len(rows):
+                results.append((rows, np.empty(0, dtype=np.float32)))
+                continue
+            scores = np.asarray(self._matrix[rows], dtype=np.float32) @ q
+            idx, top = _top_k(scores[None, :], k)
+            results.append((rows[idx[0]], top[0]))
+        return results
+
+    def search(
+        self,
+        queries: Sequence[Sequence[float]],
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量余弦 top-k。queries 为单个向量或 (n, dim) 矩阵；
+        返回每个查询的命中列表：[{"score": 相似度, **元数据}]，按分数降序。
+        训练过 IVF 时默认只扫描 nprobe 个桶，exact=True 强制全量扫描。
+        """
+        q = np.asarray(queries, dtype=np.float32)
+        q = _normalize(q.reshape(-1, self.dim))
+        with self._lock:
+            if not self._count:
+                return [[] for _ in range(len(q))]
+            if self._centroids is not None and not exact:
+                pairs = self._search_ivf(q, k, nprobe or self.nprobe)
+            else:
+                rows, scores = self._search_flat(q, k)
+                pairs = list(zip(rows, scores))
+            return [
+                [{"score": float(s), **self._meta[r]} for r, s in zip(rs, ss) if np.isfinite(s)]
+                for rs, ss in pairs
+            ]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ids(self) -> List[str]:
+        """当前有效（未删除）的 chunk id"""
+        with self._lock:
+            return list(self._rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "dim": self.dim,
+                "dtype": self.dtype,
+                "rows": self._count,
+                "live": len(self._rows),
+                "tombstones": int(self._deleted.sum()),
+                "capacity": self._capacity,
+                "nlist": int(len(self._centroids)) if self._centroids is not None else 0,
+            }
@@ -1,6 +1,12 @@
-def analyze_image_uri(image_uri: str):
+from utils.clients import registry
+from utils.image_index import analyze_deduplicated, fingerprint_uri, get_image_index
+
+def analyze_image_uri(image_uri: str, dedup: bool = True):
+    """标签识别；dedup 时重复 / 近重复图片复用已有结果（utils/image_index.py）"""
+    if dedup:
+        return analyze_deduplicated(image_uri, "labels", lambda: analyze_image_uri(image_uri, dedup=False))
     from google.cloud import vision  # 延迟导入
-    client = vision.ImageAnnotatorClient()
+    client = registry.get("vision")
     image = vision.Image()
     image.source.image_uri = image_uri
 
@@ -9,9 +15,107 @@ def analyze_image_uri(image_uri: str):
 
 def detect_explicit_content(image_uri: str):
     from google.cloud import vision
-    client = vision.ImageAnnotatorClient()
+    client = registry.get("vision")
     image = vision.Image()
     image.source.image_uri = image_uri
     response = client.safe_search_detection(image=image)
     safe = response.safe_search_annotation
     return {"adult": safe.adult, "violence": safe.violence, "racy": safe.racy}
+
+
+# === 批量多特征标注 ===
+# Vision API Feature.Type 枚举值（直接用整数，构造请求时无需导入 SDK）
+FEATURES = {
+    "labels": 4,        # LABEL_DETECTION
+    "ocr": 5,           # TEXT_DETECTION
+    "safe_search": 6,   # SAFE_SEARCH_DETECTION
+}
+MAX_IMAGES_PER_REQUEST = 16  # batch_annotate_images 同步接口单次上限
+
+def _likelihood(value):
+    return getattr(value, "name", value)
+
+def _parse_response(image_uri, response, features):
+    error = getattr(response, "error", None)
+    if error is not None and getattr(error, "code", 0):
+        return {"image_uri": image_uri, "error": error.message or f"code {error.code}"}
+    result = {"image_uri": image_uri, "error": None}
+    if "labels" in features:
+        result["labels"] = [label.description for label in response.label_annotations]
+    if "safe_search" in features:
+        safe = response.safe_search_annotation
+        result["safe_search"] = {
+            "adult": _likelihood(safe.adult),
+            "violence": _likelihood(safe.violence),
+            "racy": _likelihood(safe.racy),
+        }
+    if "ocr" in features:
+        texts = response.text_annotations
+        result["ocr"] = texts[0].description if texts else ""
+    return result
+
+def batch_annotate(image_uris, features=("labels", "safe_search"), chunk_size=MAX_IMAGES_PER_REQUEST,
+                   max_concurrency=4, max_results=10, client=None, dedup=True):
+    """
+    批量标注多张图片的多个特征：每批最多 16 张调用一次 batch_annotate_images，
+    各批在线程池中并行（最多 max_concurrency 个请求在途）。
+    返回与输入顺序一致的结果列表；单张或整批失败时对应条目带 error，不影响其他图片。
+    dedup 时先计算指纹，重复 / 近重复图片直接复用已有结果（条目带 "deduplicated": True），
+    只把未命中的图片发给 Vision；含 OCR 时只复用字节完全相同的图片。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    unknown = [f for f in features if f not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unsupported features: {unknown}")
+    index = get_image_index() if dedup else None
+    if index is not None and image_uris:
+        return _batch_annotate_deduplicated(index, list(image_uris), features, chunk_size, max_concurrency,
+                                            max_results, client)
+    client = client or registry.get("vision")
+    feature_specs = [{"type_": FEATURES[f], "max_results": max_results} for f in features]
+    chunk_size = max(1, min(chunk_size, MAX_IMAGES_PER_REQUEST))
+    chunks = [image_uris[i:i + chunk_size] for i in range(0, len(image_uris), chunk_size)]
+
+    def annotate_chunk(uris):
+        requests = [{"image": {"source": {"image_uri": uri}}, "features": feature_specs} for uri in uris]
+        try:
+            response = client.batch_annotate_images(requests=requests)
+        except Exception as e:
+            return [{"image_uri": uri, "error": str(e)} for uri in uris]
+        return [_parse_response(uri, r, features) for uri, r in zip(uris, response.responses)]
+
+    if len(chunks) <= 1:
+        return annotate_chunk(chunks[0]) if chunks else []
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks))) as pool:
+        return [item for chunk in pool.map(annotate_chunk, chunks) for item in chunk]
+
+
+def _batch_annotate_deduplicated(index, image_uris, features, chunk_size, max_concurrency, max_results, client):
+    from concurrent.futures import ThreadPoolExecutor
+
+    kind = f"{','.join(sorted(features))}:{max_results}"
+    exact = "ocr" in features
+    with ThreadPoolExecutor(max_workers=min(max_concurrency * 4, len(image_uris))) as pool:
+        fingerprints = list(pool.map(fingerprint_uri, image_uris))
+
+    results = [None] * len(image_uris)
+    pending = {}  # 同一批内字节相同的图片只请求一次：sha256（或无指纹时的序号）-> [序号]
+    for i, (uri, fp) in enumerate(zip(image_uris, fingerprints)):
+        hit = index.find(fp, kind, exact=exact) if fp is not None else None
+        if hit is not None:
+            results[i] = {**hit[0], "image_uri": uri, "deduplicated": True}
+        else:
+            pending.setdefault(fp.sha256 if fp is not None else i, []).append(i)
+
+    if pending:
+        firsts = [positions[0] for positions in pending.values()]
+        annotated = batch_annotate([image_uris[i] for i in firsts], features, chunk_size, max_concurrency,
+                                   max_results, client, dedup=False)
+        for positions, result in zip(pending.values(), annotated):
+            fp = fingerprints[positions[0]]
+            if fp is not None and result.get("error") is None:
+                index.add(fp, kind, {k: v for k, v in result.items() if k != "image_uri"})
+            for n, i in enumerate(positions):
+                results[i] = {**result, "image_uri": image_uris[i]} if n else result
+    return results